@@ -0,0 +1,294 @@
+import json
+import hashlib
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import counters
+from .cache import invalidate
+from .forms import ProjectForm, BoreholeForm, GeologyForm, MessageForm
+from .models import User, Project, Borehole, Geology, Message, Batch
+from .sync import record_all
+
+
+# Model, form, parent and owner of each model a batch can change, in the
+# order creates are applied so parents are created before their children
+BATCHED = {
+    "project": (Project, ProjectForm, None, "lead"),
+    "borehole": (Borehole, BoreholeForm, "project", "logger"),
+    "geology": (Geology, GeologyForm, "borehole", None),
+    "message": (Message, MessageForm, "project", "user")
+}
+
+# Most operations applied by a single batch
+BATCH_LIMIT = 1000
+
+
+class InvalidBatch(Exception):
+    """
+    Raised for a batch which cannot be applied. index is the position of
+    the operation at fault, if any.
+    """
+
+    def __init__(self, error, index=None):
+        super().__init__(error)
+        self.index = index
+
+
+class Operation:
+    """
+    A single create or update in a batch.
+    New rows name their parent by id, or by the ref of a row created in
+    the same batch.
+    """
+
+    def __init__(self, index, operation):
+        if not isinstance(operation, dict) or \
+                operation.get("model") not in BATCHED or \
+                operation.get("op") not in ("create", "update") or \
+                not isinstance(operation.get("data"), dict):
+            raise InvalidBatch("Invalid inputs.", index)
+        self.index = index
+        self.name = operation["model"]
+        self.created = operation["op"] == "create"
+        self.data = operation["data"]
+        self.id = operation.get("id")
+        self.ref = operation.get("ref")
+        parent = BATCHED[self.name][2]
+        self.parent = operation.get(parent) if self.created else None
+        self.instance = None
+        self.project_id = None
+
+        if self.created and parent and \
+                not isinstance(self.parent, (int, str)):
+            raise InvalidBatch("Invalid inputs.", index)
+        if not self.created and not isinstance(self.id, int):
+            raise InvalidBatch("Invalid inputs.", index)
+        if self.ref is not None and not isinstance(self.ref, str):
+            raise InvalidBatch("Invalid inputs.", index)
+
+
+def digest(operations):
+    return hashlib.md5(
+        json.dumps(operations, sort_keys=True).encode()).hexdigest()
+
+
+def parse(operations):
+    """
+    Validates every operation with the form of its model and returns them
+    with an unsaved instance each. Rows to update and the parents of new
+    rows are fetched with one query per model whatever the batch size.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise InvalidBatch("Invalid inputs.")
+    if len(operations) > BATCH_LIMIT:
+        raise InvalidBatch(
+            f"Batches are limited to {BATCH_LIMIT} operations.")
+    operations = [
+        Operation(index, operation)
+        for index, operation in enumerate(operations)
+    ]
+
+    # Rows to update, layers with their borehole for its project id
+    rows = {}
+    for name, (model, form, parent, owner) in BATCHED.items():
+        ids = {op.id for op in operations if op.name == name and not
+               op.created}
+        if ids:
+            related = ["borehole"] if model is Geology else []
+            rows[name] = model.objects.select_related(*related).in_bulk(ids)
+
+    # Existing parents of new rows with their project ids
+    parents = {}
+    for name, field in (("project", "id"), ("borehole", "project_id")):
+        ids = {
+            op.parent for op in operations
+            if BATCHED[op.name][2] == name and isinstance(op.parent, int)
+        }
+        parents[name] = dict(
+            BATCHED[name][0].objects.filter(id__in=ids).values_list(
+                "id", field)
+        ) if ids else {}
+
+    refs = {}
+    for op in operations:
+        if op.ref is not None:
+            if op.ref in refs or not op.created:
+                raise InvalidBatch("Invalid inputs.", op.index)
+            refs[op.ref] = op
+
+    for op in operations:
+        model, form_class, parent, owner = BATCHED[op.name]
+        if op.created:
+            form = form_class(op.data)
+        else:
+            instance = rows[op.name].get(op.id)
+            if instance is None:
+                raise InvalidBatch(
+                    f"{op.name.capitalize()} could not be found.", op.index)
+            form = form_class(op.data, instance=instance)
+            op.project_id = project_of(op.name, instance)
+
+        if not form.is_valid():
+            raise InvalidBatch("Invalid inputs.", op.index)
+        op.instance = form.save(commit=False)
+
+        # Parents named by ref are resolved once they are created
+        if isinstance(op.parent, int):
+            if op.parent not in parents[parent]:
+                raise InvalidBatch(
+                    f"{parent.capitalize()} could not be found.", op.index)
+            op.project_id = parents[parent][op.parent]
+        elif isinstance(op.parent, str):
+            if op.parent not in refs or refs[op.parent].name != parent:
+                raise InvalidBatch("Invalid inputs.", op.index)
+            op.parent = refs[op.parent]
+    return operations
+
+
+def project_of(name, instance):
+    if name == "project":
+        return instance.id
+    if name == "geology":
+        return instance.borehole.project_id
+    return instance.project_id
+
+
+def last_id(model):
+    """
+    Returns the highest id used by a model or 0 for an empty table.
+    """
+    row = model.objects.order_by("-id").values_list("id", flat=True).first()
+    return row or 0
+
+
+def insert(model, rows):
+    """
+    Inserts rows with bulk_create and sets their ids.
+    SQLite does not return primary keys from bulk_create, but a transaction
+    which has already written holds the write lock, so its rows are the
+    last ones inserted.
+    """
+    start = last_id(model)
+    model.objects.bulk_create(rows)
+    if rows[0].pk is None:
+        ids = model.objects.filter(id__gt=start).order_by("id")
+        for row, id in zip(rows, ids.values_list("id", flat=True)):
+            row.pk = id
+
+
+def apply(user, operations):
+    """
+    Applies parsed operations with one bulk_create and one bulk_update per
+    model, then updates the counters, change log and cached responses
+    which the signals skipped by bulk operations would have.
+    Must be called in a transaction.
+    """
+    now = timezone.now()
+    counted = {User: set(), Project: set(), Borehole: set()}
+    changes = []
+    scopes = {"projects"}
+
+    for name, (model, form, parent, owner) in BATCHED.items():
+        created = [op for op in operations if op.name == name and op.created]
+        for op in created:
+            if owner:
+                setattr(op.instance, f"{owner}_id", user.id)
+            if isinstance(op.parent, Operation):
+                op.project_id = op.parent.project_id
+                op.parent = op.parent.instance.id
+            if parent:
+                setattr(op.instance, f"{parent}_id", op.parent)
+        if created:
+            insert(model, [op.instance for op in created])
+        if name == "project":
+            for op in created:
+                op.project_id = op.instance.id
+
+        # The same row may be updated more than once, the last one wins
+        updated = {
+            op.instance.id: op.instance for op in operations
+            if op.name == name and not op.created
+        }
+        if updated:
+            fields = list(form._meta.fields)
+            if hasattr(model, "updated_at"):
+                fields.append("updated_at")
+                for instance in updated.values():
+                    instance.updated_at = now
+            model.objects.bulk_update(updated.values(), fields)
+
+    for op in operations:
+        id, project_id = op.instance.id, op.project_id
+        changes.append((op.name, id, project_id))
+        scopes.add(f"project:{project_id}")
+        if op.name == "project" and op.created:
+            counted[User].add(user.id)
+        elif op.name == "borehole":
+            scopes.add(f"borehole:{id}")
+            if op.created:
+                counted[User].add(user.id)
+                counted[Project].add(project_id)
+                changes.append(("project", project_id, project_id))
+        elif op.name == "geology":
+            borehole_id = op.instance.borehole_id
+            counted[Borehole].add(borehole_id)
+            changes.append(("borehole", borehole_id, project_id))
+            scopes.update({f"borehole:{borehole_id}", f"layer:{id}"})
+        elif op.name == "message":
+            counted[Project].add(project_id)
+            changes.append(("project", project_id, project_id))
+
+    # Boreholes are serialized with their project's details
+    edited = {op.instance.id for op in operations
+              if op.name == "project" and not op.created}
+    if edited:
+        boreholes = Borehole.objects.filter(project_id__in=edited)
+        scopes.update(
+            f"borehole:{id}" for id in boreholes.values_list("id", flat=True))
+
+    for model, ids in counted.items():
+        if ids:
+            counters.refresh(model, ids, updated_at=now)
+    record_all(list(dict.fromkeys(changes)))
+    invalidate(*scopes)
+
+    return [
+        {"model": op.name, "id": op.instance.id, "ref": op.ref}
+        for op in operations
+    ]
+
+
+def replay(batch, operations):
+    if batch.digest != digest(operations):
+        raise InvalidBatch("Idempotency key was used for a different batch.")
+    return json.loads(batch.response)
+
+
+def submit(user, key, operations):
+    """
+    Applies a batch once per user and idempotency key.
+    Returns (response, replayed) where replayed is True when the key was
+    already used by an identical batch, which is then not applied again.
+    """
+    batch = Batch.objects.filter(user=user, key=key).first()
+    if batch is not None:
+        return replay(batch, operations), True
+
+    try:
+        with transaction.atomic():
+            # Claiming the key first also takes the database write lock
+            batch = Batch.objects.create(
+                user=user, key=key, digest=digest(operations))
+            results = apply(user, parse(operations))
+            batch.response = json.dumps({
+                "message": "Batch applied.", "results": results
+            })
+            batch.save(update_fields=["response"])
+    except IntegrityError:
+        # A concurrent retry with the same key committed first
+        batch = Batch.objects.filter(user=user, key=key).first()
+        if batch is None:
+            raise
+        return replay(batch, operations), True
+    return json.loads(batch.response), False
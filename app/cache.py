@@ -0,0 +1,127 @@
+import time
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+
+from .metrics import CACHE_REQUESTS
+
+
+def get_cache():
+    return caches[getattr(settings, "QLOG_RESPONSE_CACHE", "default")]
+
+
+def versions(names):
+    """
+    Returns the current version of each cache scope in names.
+    A scope without a version, such as after eviction, starts from the
+    current time so it never reuses a version of older cached entries.
+    """
+    cache = get_cache()
+    keys = [f"version:{name}" for name in names]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def bump(*names):
+    """
+    Moves each scope in names to a new version, so every response cached
+    under an older version is no longer found.
+    """
+    cache = get_cache()
+    for name in names:
+        try:
+            cache.incr(f"version:{name}")
+        except ValueError:
+            cache.set(f"version:{name}", time.time_ns(), None)
+
+
+def invalidate(*names):
+    """
+    Bumps scopes now and again once the current transaction commits.
+    The second bump drops anything cached by a concurrent request which
+    read the database before the commit.
+    """
+    bump(*names)
+    transaction.on_commit(lambda: bump(*names))
+
+
+def cache_response(scope):
+    """
+    Decorator caching successful GET responses of a view for logged in
+    users. scope is called with the view's URL arguments and returns the
+    names of the scopes the response depends on, or None to skip caching.
+    Entries expire after QLOG_RESPONSE_CACHE_TTL seconds, which bounds how
+    long a lost invalidation can serve stale data.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != "GET" or \
+                    not request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+            names = scope(**kwargs)
+            if names is None:
+                return view(request, *args, **kwargs)
+
+            # Key on the URL and the version of every scope it depends on
+            cache = get_cache()
+            key = hashlib.md5(
+                f"{request.get_full_path()}:{versions(names)}".encode()
+            ).hexdigest()
+            key = f"response:{key}"
+            entry = cache.get(key)
+            if entry is not None:
+                CACHE_REQUESTS.inc(result="hit")
+                content, content_type = entry
+                response = HttpResponse(content, content_type=content_type)
+                response["X-Cache"] = "HIT"
+                return response
+
+            CACHE_REQUESTS.inc(result="miss")
+            response = view(request, *args, **kwargs)
+            timeout = getattr(settings, "QLOG_RESPONSE_CACHE_TTL", 60)
+            if response.status_code == 200 and response.streaming:
+                cache_stream(cache, key, response, timeout)
+            elif response.status_code == 200:
+                cache.set(
+                    key, (response.content, response["Content-Type"]),
+                    timeout
+                )
+            response["X-Cache"] = "MISS"
+            return response
+        return wrapper
+    return decorator
+
+
+def cache_stream(cache, key, response, timeout):
+    """
+    Keeps a copy of a streamed response as it is sent and caches it once
+    the whole body has been sent. Bodies larger than
+    QLOG_RESPONSE_CACHE_MAX_BYTES are not cached so streaming still uses
+    constant memory.
+    """
+    limit = getattr(settings, "QLOG_RESPONSE_CACHE_MAX_BYTES", 1024 * 1024)
+    content_type = response["Content-Type"]
+
+    def stream(parts):
+        kept, size = [], 0
+        for part in parts:
+            if kept is not None:
+                size += len(part)
+                if size > limit:
+                    kept = None
+                else:
+                    kept.append(part)
+            yield part
+        if kept is not None:
+            cache.set(key, (b"".join(kept), content_type), timeout)
+
+    response.streaming_content = stream(response.streaming_content)
@@ -0,0 +1,113 @@
+import math
+
+from django.db import connection, transaction
+
+from .models import Cluster
+from .spatial import MAX_COORDINATE
+
+
+# Zoom levels of the grid kept by the app_cluster triggers
+MAX_LEVEL = 16
+
+# Most cells across either side of a map view, views spanning more cells
+# are answered from a coarser level
+GRID = 32
+
+# Statements refilling the clusters from the boreholes, as the
+# app_cluster triggers would
+REBUILD = [
+    "DELETE FROM app_cluster",
+    """
+    INSERT INTO app_cluster (
+        project_id, level, x, y, count, sum_easting, sum_northing, sample
+    )
+    SELECT
+        project_id, level, CAST((borehole_easting + 1000) / size AS INTEGER),
+        CAST((borehole_northing + 1000) / size AS INTEGER), 1,
+        borehole_easting, borehole_northing, app_borehole.id
+    FROM app_borehole, app_cluster_level
+    WHERE borehole_easting IS NOT NULL AND borehole_northing IS NOT NULL
+    ORDER BY app_borehole.id
+    ON CONFLICT (project_id, level, x, y) DO UPDATE SET
+        count = count + 1,
+        sum_easting = sum_easting + excluded.sum_easting,
+        sum_northing = sum_northing + excluded.sum_northing,
+        sample = CASE
+            WHEN sample = '' THEN excluded.sample
+            WHEN length(sample) - length(replace(sample, ',', '')) < 2
+                THEN sample || ',' || excluded.sample
+            ELSE sample
+        END
+    """
+]
+
+
+def rebuild():
+    """
+    Refills the clusters from the boreholes. Only needed if they were
+    changed by hand, the database triggers keep them in sync.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        for statement in REBUILD:
+            cursor.execute(statement)
+
+
+def cell(value, size):
+    """
+    Returns the cell of a coordinate as the triggers number it. Values are
+    clamped to the possible positions, where truncating as the triggers
+    do is the same as rounding down.
+    """
+    value = min(max(value, -MAX_COORDINATE), MAX_COORDINATE)
+    return int((value + MAX_COORDINATE) // size)
+
+
+def clusters(zoom, min_easting, min_northing, max_easting, max_northing,
+             project_id=None):
+    """
+    Returns the clusters of boreholes in a map view at a zoom level, each
+    as [count, easting, northing, sample ids] where the position is the
+    centroid of its boreholes.
+    Views spanning more than GRID cells use a coarser level, so the size
+    of the response does not depend on the number of boreholes.
+    """
+    bounds = [min_easting, min_northing, max_easting, max_northing]
+    if not all(map(math.isfinite, bounds)):
+        raise ValueError("Bounds must be finite.")
+
+    level = min(max(zoom, 0), MAX_LEVEL)
+    span = max(max_easting - min_easting, max_northing - min_northing)
+    while level > 0 and span > GRID * 2 * MAX_COORDINATE / 2 ** level:
+        level -= 1
+    size = 2 * MAX_COORDINATE / 2 ** level
+
+    cells = Cluster.objects.filter(
+        level=level,
+        x__range=(cell(min_easting, size), cell(max_easting, size)),
+        y__range=(cell(min_northing, size), cell(max_northing, size))
+    )
+    if project_id is not None:
+        cells = cells.filter(project_id=project_id)
+
+    # Cells of different projects at the same place are one cluster
+    merged = {}
+    for x, y, count, easting, northing, sample in cells.values_list(
+            "x", "y", "count", "sum_easting", "sum_northing", "sample"):
+        total = merged.setdefault((x, y), [0, 0.0, 0.0, []])
+        total[0] += count
+        total[1] += easting
+        total[2] += northing
+        total[3] += [int(id) for id in sample.split(",") if id]
+
+    return {
+        "level": level,
+        "fields": ["count", "easting", "northing", "ids"],
+        "clusters": [
+            [
+                count, round(easting / count, 6), round(northing / count, 6),
+                sorted(ids)[:3]
+            ]
+            for (x, y), (count, easting, northing, ids) in sorted(
+                merged.items())
+        ]
+    }
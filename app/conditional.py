@@ -0,0 +1,140 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.views.decorators.http import condition
+
+from .models import User, Project, Borehole, Geology, Message
+
+
+def conditional(validator):
+    """
+    Decorator answering conditional GET requests with 304 Not Modified.
+    validator is called with the view's URL arguments and returns a tuple
+    of (last modified, state) computed from cheap aggregates, without
+    building the response body, or None if the resource does not exist.
+    The ETag is a hash of the URL and state.
+    last modified may be None for collections where a deletion would not
+    move it forward, then only the ETag is used.
+    """
+    def compute(request, *args, **kwargs):
+        # Computed once per request and shared by both header functions
+        if not hasattr(request, "validator"):
+            request.validator = None
+            if request.method == "GET" and request.user.is_authenticated:
+                request.validator = validator(**kwargs)
+        return request.validator
+
+    def etag(request, *args, **kwargs):
+        value = compute(request, *args, **kwargs)
+        if value is None:
+            return None
+        return hashlib.md5(
+            f"{request.get_full_path()}:{value[1]}".encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        value = compute(request, *args, **kwargs)
+        return None if value is None else value[0]
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
+
+
+def changes(rows, field="updated_at"):
+    """
+    Returns the latest change time and number of rows of a queryset.
+    """
+    return rows.aggregate(modified=Max(field), count=Count("id"))
+
+
+def latest(*times):
+    times = [time for time in times if time is not None]
+    return max(times) if times else None
+
+
+def projects_validator(project_id, page_number=1):
+    if project_id == 0:
+        projects = changes(Project.objects.all())
+        return None, (projects["modified"], projects["count"])
+
+    # Project counters move its updated_at when boreholes change
+    project = Project.objects.filter(id=project_id).values_list(
+        "updated_at", flat=True).first()
+    if project is None:
+        return None
+    boreholes = changes(Borehole.objects.filter(project_id=project_id))
+    return (
+        latest(project, boreholes["modified"]),
+        (project, boreholes["modified"], boreholes["count"])
+    )
+
+
+def profile_validator(user_id):
+    # User counters move its updated_at, so it covers every serialized
+    # column including the counts
+    if user_id == 0:
+        users = changes(User.objects.all())
+        return None, (users["modified"], users["count"])
+
+    # Separate aggregates so each one is answered from an index
+    user = User.objects.filter(id=user_id).values_list(
+        "updated_at", flat=True).first()
+    logging = Borehole.objects.filter(logger_id=user_id).values("project_id")
+    leading = changes(Project.objects.filter(lead_id=user_id))
+    logging = Project.objects.filter(id__in=logging).aggregate(
+        modified=Max("updated_at"), count=Count("id"),
+        leads=Max("lead__updated_at")
+    )
+    return None, (
+        user, leading["modified"], leading["count"], logging["modified"],
+        logging["count"], logging["leads"]
+    )
+
+
+def borehole_validator(borehole_id):
+    borehole = Borehole.objects.filter(id=borehole_id).values_list(
+        "updated_at", "project__updated_at").first()
+    if borehole is None:
+        return None
+    return latest(*borehole), borehole
+
+
+def geology_validator(borehole_id, strata_id=0):
+    if strata_id == 0:
+
+        # Borehole counters move its updated_at when layers change
+        borehole = Borehole.objects.filter(id=borehole_id).values_list(
+            "updated_at", flat=True).first()
+        if borehole is None:
+            return None
+        layers = changes(Geology.objects.filter(borehole_id=borehole_id))
+        return (
+            latest(borehole, layers["modified"]),
+            (borehole, layers["modified"], layers["count"])
+        )
+
+    layer = Geology.objects.filter(id=strata_id).values_list(
+        "updated_at", "borehole__updated_at").first()
+    if layer is None:
+        return None
+    return latest(*layer), layer
+
+
+def sketch_validator(project_id):
+    project = Project.objects.filter(id=project_id).values_list(
+        "updated_at", flat=True).first()
+    if project is None:
+        return None
+    return project, project
+
+
+def message_validator(project_id, page_number=1):
+    messages = changes(
+        Message.objects.filter(project_id=project_id), "message_date")
+    return None, (messages["modified"], messages["count"])
+
+
+def bundle_validator(project_id):
+    project = projects_validator(project_id)
+    if project is None:
+        return None
+    messages = message_validator(project_id)
+    return project[0], (project[1], messages[1])
@@ -0,0 +1,82 @@
+from django.apps import apps as global_apps
+from django.db import transaction
+from django.db.models import (
+    Count, DecimalField, F, Max, OuterRef, Subquery, Value
+)
+from django.db.models.functions import Coalesce
+
+
+def aggregate_of(model, field, aggregate, default=Value(0)):
+    """
+    Returns a subquery expression aggregating the rows of model which
+    point at the outer row through field.
+    """
+    rows = model.objects.filter(**{field: OuterRef("pk")}).order_by()
+    rows = rows.values(field).annotate(value=aggregate).values("value")
+    return Coalesce(Subquery(rows), default)
+
+
+def counters(apps=global_apps):
+    """
+    Returns every denormalized counter as (model, field, expression)
+    where expression computes the true value for each row.
+    """
+    User = apps.get_model("app", "User")
+    Project = apps.get_model("app", "Project")
+    Borehole = apps.get_model("app", "Borehole")
+    Geology = apps.get_model("app", "Geology")
+    Message = apps.get_model("app", "Message")
+    depth = DecimalField(max_digits=5, decimal_places=2)
+    return [
+        (User, "project_count", aggregate_of(Project, "lead", Count("id"))),
+        (User, "borehole_count", aggregate_of(
+            Borehole, "logger", Count("id"))),
+        (Project, "borehole_count", aggregate_of(
+            Borehole, "project", Count("id"))),
+        (Project, "message_count", aggregate_of(
+            Message, "project", Count("id"))),
+        (Borehole, "layer_count", aggregate_of(
+            Geology, "borehole", Count("id"))),
+        (Borehole, "logged_depth", aggregate_of(
+            Geology, "borehole", Max("end_depth"),
+            default=Value(0, output_field=depth)
+        ))
+    ]
+
+
+def rebuild(apps=global_apps):
+    """
+    Recomputes every counter with one UPDATE statement per counter.
+    """
+    with transaction.atomic():
+        for model, field, expression in counters(apps):
+            model.objects.update(**{field: expression})
+
+
+def refresh(model, ids, **values):
+    """
+    Recomputes the counters of the rows of model with the given ids in one
+    UPDATE statement, also setting any other values given.
+    For code which changes rows with bulk_create or bulk_update and so
+    skips the signals.
+    """
+    fields = {
+        field: expression for counted, field, expression in counters()
+        if counted is model
+    }
+    model.objects.filter(id__in=ids).update(**fields, **values)
+
+
+def verify(apps=global_apps):
+    """
+    Returns a list of (model name, field, id, stored, expected) for every
+    counter which does not match the rows it counts.
+    """
+    errors = []
+    for model, field, expression in counters(apps):
+        rows = model.objects.annotate(expected=expression)
+        rows = rows.exclude(**{field: F("expected")})
+        for id, stored, expected in rows.values_list(
+                "id", field, "expected"):
+            errors.append((model.__name__, field, id, stored, expected))
+    return errors
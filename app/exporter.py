@@ -0,0 +1,89 @@
+from django.utils.text import compress_sequence
+
+from .formats import (
+    BOREHOLE_COLUMNS, GEOLOGY_COLUMNS, csv_lines, ndjson_lines, ags_lines
+)
+from .models import Borehole, Geology
+
+
+# Rows fetched from the database at a time
+CHUNK_SIZE = 2000
+
+# Bytes of output collected before sending them
+BUFFER_SIZE = 64 * 1024
+
+# Content type and file extension of each export format
+EXPORTS = {
+    "csv": ("text/csv", "csv"),
+    "ags": ("text/plain", "ags"),
+    "ndjson": ("application/x-ndjson", "ndjson")
+}
+
+
+def layer_rows(projects):
+    """
+    Returns one row per layer with its borehole's details, and one row
+    with empty layer columns for each borehole without layers, from a
+    single query read CHUNK_SIZE rows at a time.
+    """
+    rows = Borehole.objects.filter(project__in=projects).order_by(
+        "project_id", "id", "geology__start_depth", "geology__id")
+    return rows.values_list(
+        "project__project_reference", "id", *BOREHOLE_COLUMNS,
+        *(f"geology__{column}" for column in GEOLOGY_COLUMNS)
+    ).iterator(chunk_size=CHUNK_SIZE)
+
+
+def ags_rows(projects):
+    boreholes = Borehole.objects.filter(project__in=projects).order_by(
+        "project_id", "id")
+    layers = Geology.objects.filter(borehole__project__in=projects)
+    layers = layers.order_by(
+        "borehole__project_id", "borehole_id", "start_depth", "id")
+    return (
+        projects.order_by("id").values_list(
+            "project_reference", "project_title", "project_client"),
+        boreholes.values_list(
+            "borehole_reference", "drilling_equipment", "borehole_easting",
+            "borehole_northing", "ground_level", "borehole_diameter"
+        ).iterator(chunk_size=CHUNK_SIZE),
+        layers.values_list(
+            "borehole__borehole_reference", "start_depth", "end_depth",
+            "geology_description", "field_test_details"
+        ).iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def buffered(lines, size=BUFFER_SIZE):
+    """
+    Joins lines into chunks of about size characters, so a response is
+    not written one short line at a time.
+    """
+    chunk, length = [], 0
+    for line in lines:
+        chunk.append(line)
+        length += len(line)
+        if length >= size:
+            yield "".join(chunk)
+            chunk, length = [], 0
+    if chunk:
+        yield "".join(chunk)
+
+
+def export(projects, format, compress=False):
+    """
+    Returns an iterator over the bytes of the boreholes and layers of a
+    queryset of projects in an EXPORTS format, optionally gzipped.
+    Rows are read and written as the iterator is consumed, so memory use
+    does not grow with the size of the projects and the first bytes are
+    ready before every row has been read.
+    """
+    if format == "ags":
+        lines = ags_lines(*ags_rows(projects))
+    elif format == "ndjson":
+        lines = ndjson_lines(layer_rows(projects))
+    else:
+        lines = csv_lines(layer_rows(projects))
+
+    chunks = (chunk.encode() for chunk in buffered(lines))
+    return compress_sequence(chunks) if compress else chunks
@@ -0,0 +1,219 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .forms import BoreholeForm, GeologyForm
+
+
+# Columns of the CSV format, one row per layer with its borehole's details
+BOREHOLE_COLUMNS = BoreholeForm._meta.fields
+GEOLOGY_COLUMNS = GeologyForm._meta.fields
+CSV_COLUMNS = BOREHOLE_COLUMNS + GEOLOGY_COLUMNS
+
+# Exports also identify the project and borehole of each row
+EXPORT_COLUMNS = ["project_reference", "borehole_id"] + CSV_COLUMNS
+
+# Used for required text which AGS files do not always contain
+NOT_RECORDED = "Not recorded"
+
+
+class InvalidFile(Exception):
+    """
+    Raised when a line of an imported file cannot be read as CSV, with the
+    number of the line.
+    """
+
+    def __init__(self, error, line):
+        super().__init__(error)
+        self.line = line
+
+
+def read_rows(reader):
+    """
+    Yields the rows of a CSV reader, raising InvalidFile for a line it
+    cannot read rather than csv.Error.
+    """
+    try:
+        yield from reader
+    except csv.Error as error:
+        # DictReader only updates its line number after a row is read
+        line = getattr(reader, "reader", reader).line_num
+        raise InvalidFile(f"File could not be read: {error}.", line)
+
+
+def read_ags(lines):
+    """
+    Reads AGS4 data one line at a time, yielding (line number, group, row)
+    for every DATA line where row maps headings to values.
+    """
+    reader = csv.reader(lines)
+    group, headings = None, []
+    for row in read_rows(reader):
+        if not row:
+            continue
+        if row[0] == "GROUP":
+            group, headings = row[1], []
+        elif row[0] == "HEADING":
+            headings = row[1:]
+        elif row[0] == "DATA":
+            yield reader.line_num, group, dict(zip(headings, row[1:]))
+
+
+def ags_records(lines):
+    """
+    Maps the LOCA (HOLE in older files), GEOL and HDIA groups of AGS data
+    onto borehole, geology and diameter records of
+    (kind, line number, borehole reference, form data).
+    Other groups are ignored.
+    """
+    for line, group, row in read_ags(lines):
+        ref = row.get("LOCA_ID", row.get("HOLE_ID", ""))
+        if group in ("LOCA", "HOLE"):
+            yield "borehole", line, ref, {
+                "borehole_reference": ref,
+                "borehole_northing": row.get(f"{group}_NATN", ""),
+                "borehole_easting": row.get(f"{group}_NATE", ""),
+                "ground_level": row.get(f"{group}_GL", ""),
+                "drilling_equipment": row.get(f"{group}_TYPE") or
+                NOT_RECORDED,
+
+                # Diameters are given in the HDIA group, 0 until then
+                "borehole_diameter": 0
+            }
+        elif group == "GEOL":
+            yield "geology", line, ref, {
+                "start_depth": row.get("GEOL_TOP", ""),
+                "end_depth": row.get("GEOL_BASE", ""),
+                "field_test_details": row.get("GEOL_REM") or NOT_RECORDED,
+                "geology_description": row.get("GEOL_DESC", "")
+            }
+        elif group == "HDIA":
+            yield "diameter", line, ref, {
+                "borehole_diameter": row.get("HDIA_DIAM", "")
+            }
+
+
+def csv_records(lines):
+    """
+    Maps CSV rows with the CSV_COLUMNS headings onto borehole and geology
+    records of (kind, line number, borehole reference, form data).
+    The first row of each borehole gives its details, rows without a
+    start depth only describe a borehole.
+    """
+    reader = csv.DictReader(lines)
+    seen = set()
+    for row in read_rows(reader):
+        ref = row.get("borehole_reference", "")
+        if ref not in seen:
+            seen.add(ref)
+            yield "borehole", reader.line_num, ref, {
+                column: row.get(column, "") for column in BOREHOLE_COLUMNS
+            }
+        if row.get("start_depth"):
+            yield "geology", reader.line_num, ref, {
+                column: row.get(column, "") for column in GEOLOGY_COLUMNS
+            }
+
+
+# Record readers for each import format
+READERS = {"ags": ags_records, "csv": csv_records}
+
+
+class Echo:
+    """
+    File-like object returning what is written, so csv.writer can format
+    a single line at a time.
+    """
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    """
+    Writes rows with the EXPORT_COLUMNS values as CSV, one line at a time.
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(rows):
+    """
+    Writes rows with the EXPORT_COLUMNS values as one JSON object per
+    borehole with its layers nested under "geology". Rows must be ordered
+    by borehole.
+    """
+    split = 2 + len(BOREHOLE_COLUMNS)
+    borehole, layers = None, []
+    for row in rows:
+        if borehole is None or row[1] != borehole["borehole_id"]:
+            if borehole is not None:
+                yield ndjson_line(borehole, layers)
+            borehole = dict(zip(EXPORT_COLUMNS[:split], row[:split]))
+            layers = []
+
+        # Boreholes without layers have a single row without a layer
+        if row[split] is not None:
+            layers.append(dict(zip(GEOLOGY_COLUMNS, row[split:])))
+    if borehole is not None:
+        yield ndjson_line(borehole, layers)
+
+
+def ndjson_line(borehole, layers):
+    borehole["geology"] = layers
+    return json.dumps(borehole, cls=DjangoJSONEncoder) + "\n"
+
+
+def ags_group(name, headings, units, rows):
+    """
+    Writes an AGS4 group with its HEADING, UNIT and TYPE lines.
+    headings maps each heading to its data type.
+    """
+    writer = csv.writer(
+        Echo(), quoting=csv.QUOTE_ALL, lineterminator="\r\n")
+    yield writer.writerow(["GROUP", name])
+    yield writer.writerow(["HEADING", *headings])
+    yield writer.writerow(["UNIT", *units])
+    yield writer.writerow(["TYPE", *headings.values()])
+    for row in rows:
+        yield writer.writerow(["DATA", *row])
+    yield "\r\n"
+
+
+def ags_lines(projects, boreholes, layers):
+    """
+    Writes AGS4 data from rows of (reference, title, client) for PROJ,
+    (reference, type, easting, northing, ground level, diameter) for LOCA
+    and HDIA and (borehole reference, top, base, description, remarks)
+    for GEOL.
+    """
+    yield from ags_group("PROJ", {
+        "PROJ_ID": "ID", "PROJ_NAME": "X", "PROJ_CLNT": "X"
+    }, ["", "", ""], projects)
+    yield from ags_group("TRAN", {"TRAN_AGS": "X"}, [""], [["4.1"]])
+
+    # Diameters are kept for the HDIA group
+    diameters = []
+
+    def locations():
+        for row in boreholes:
+            diameters.append((row[0], row[5]))
+            yield row[:5]
+
+    yield from ags_group("LOCA", {
+        "LOCA_ID": "ID", "LOCA_TYPE": "PA", "LOCA_NATE": "2DP",
+        "LOCA_NATN": "2DP", "LOCA_GL": "2DP"
+    }, ["", "", "m", "m", "m"], locations())
+    yield from ags_group("HDIA", {
+        "LOCA_ID": "ID", "HDIA_DIAM": "0DP"
+    }, ["", "mm"], diameters)
+    yield from ags_group("GEOL", {
+        "LOCA_ID": "ID", "GEOL_TOP": "2DP", "GEOL_BASE": "2DP",
+        "GEOL_DESC": "X", "GEOL_REM": "X"
+    }, ["", "m", "m", "", ""], (
+        row[:4] + ("" if row[4] == NOT_RECORDED else row[4],)
+        for row in layers
+    ))
@@ -0,0 +1,68 @@
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse as BaseJsonResponse
+from django.http import StreamingHttpResponse
+
+from .timing import timed
+
+
+def accepts_gzip(request):
+    """
+    Returns whether the Accept-Encoding header of a request accepts gzip,
+    either by name or through "*", with a q-value above 0.
+    """
+    qualities = {}
+    for coding in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        name, *params = [part.strip() for part in coding.split(";")]
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            qualities[name.lower()] = quality
+    return qualities.get("gzip", qualities.get("*", 0)) > 0
+
+
+class JsonResponse(BaseJsonResponse):
+    """
+    JsonResponse which records the time spent encoding the body as JSON
+    in the request timer.
+    """
+
+    @timed("encode")
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+
+class StreamingJsonResponse(StreamingHttpResponse):
+    """
+    Streams a JSON array of the rows of a queryset given to serializer.
+    Rows are read and serialized chunk_size at a time, so memory use does
+    not depend on the number of rows. The body is the same as a
+    JsonResponse of the serialized list.
+    Related rows used by serializer must be selected on the queryset, as
+    serializers only join them into querysets, not chunks.
+    """
+
+    def __init__(self, rows, serializer, chunk_size=500, **kwargs):
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(
+            self.stream(rows, serializer, chunk_size), **kwargs)
+
+    @staticmethod
+    def stream(rows, serializer, chunk_size):
+        encoder = DjangoJSONEncoder()
+        rows = rows.iterator(chunk_size=chunk_size)
+        chunk = list(islice(rows, chunk_size))
+        separator = "["
+        while chunk:
+            yield separator + ", ".join(
+                encoder.encode(row) for row in serializer(chunk))
+            separator = ", "
+            chunk = list(islice(rows, chunk_size))
+        yield "[]" if separator == "[" else "]"
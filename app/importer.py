@@ -0,0 +1,183 @@
+from django.db import transaction
+from django.utils import timezone
+
+from . import counters
+from .batch import insert
+from .cache import invalidate
+from .forms import BoreholeForm, GeologyForm
+from .models import User, Project, Borehole, Geology
+from .sync import record_all
+
+
+# Most row errors kept in a report, later errors are only counted
+ERROR_LIMIT = 100
+
+# Most ids in a single IN clause
+ID_CHUNK = 500
+
+
+def form_errors(form):
+    return "; ".join(
+        f"{field}: {' '.join(messages)}"
+        for field, messages in form.errors.items()
+    )
+
+
+class Importer:
+    """
+    Imports boreholes and geology layers into a project from a stream of
+    records read by app.formats.
+    Records are validated with the borehole and geology forms and inserted
+    with bulk_create in batches, so memory use only grows with the number
+    of boreholes, not the number of layers. Invalid rows are skipped and
+    reported with their line number.
+    Layers and diameters are only imported for boreholes the import
+    creates, rows for boreholes already in the project are reported as
+    conflicts so importing a file again does not duplicate its layers.
+    progress is called with the report after every batch.
+    """
+
+    def __init__(self, project, logger, batch_size=1000, progress=None):
+        self.project = project
+        self.logger = logger
+        self.batch_size = batch_size
+        self.progress = progress
+        self.existing = set(
+            project.borehole.values_list("borehole_reference", flat=True))
+        self.boreholes = {}
+        self.touched = set()
+        self.diameters = {}
+        self.new_boreholes = {}
+        self.new_layers = []
+        self.report = {
+            "lines": 0, "boreholes": 0, "layers": 0, "error_count": 0,
+            "errors": []
+        }
+
+    def run(self, records):
+        """
+        Imports every record in one transaction and returns the report.
+        """
+        with transaction.atomic():
+            # Writing first takes the lock needed to read back new ids
+            Project.objects.filter(id=self.project.id).update(
+                updated_at=timezone.now())
+            for kind, line, ref, data in records:
+                self.report["lines"] = line
+                getattr(self, kind)(line, ref, data)
+            self.flush_layers()
+            self.finish()
+        return self.report
+
+    def error(self, line, message):
+        self.report["error_count"] += 1
+        if len(self.report["errors"]) < ERROR_LIMIT:
+            self.report["errors"].append({"line": line, "error": message})
+
+    def borehole(self, line, ref, data):
+        if ref in self.existing or ref in self.boreholes or \
+                ref in self.new_boreholes:
+            return self.error(line, f"Borehole {ref} already exists.")
+        form = BoreholeForm(data)
+        if not form.is_valid():
+            return self.error(line, form_errors(form))
+        borehole = form.save(commit=False)
+        borehole.project_id = self.project.id
+        borehole.logger_id = self.logger.id
+        self.new_boreholes[ref] = borehole
+        if len(self.new_boreholes) >= self.batch_size:
+            self.flush_boreholes()
+
+    def conflict(self, line, ref):
+        """
+        Reports a row for a borehole which was not created by the import,
+        returning whether there was one.
+        """
+        if ref in self.boreholes or ref in self.new_boreholes:
+            return False
+        if ref in self.existing:
+            self.error(line, f"Borehole {ref} already exists.")
+        else:
+            self.error(line, f"Borehole {ref} could not be found.")
+        return True
+
+    def geology(self, line, ref, data):
+        if self.conflict(line, ref):
+            return
+        form = GeologyForm(data)
+        if not form.is_valid():
+            return self.error(line, form_errors(form))
+        self.new_layers.append((ref, form.save(commit=False)))
+        if len(self.new_layers) >= self.batch_size:
+            self.flush_layers()
+
+    def diameter(self, line, ref, data):
+        try:
+            diameter = int(data["borehole_diameter"])
+        except ValueError:
+            return self.error(line, "borehole_diameter: Enter a number.")
+        if diameter <= 0:
+            return self.error(
+                line, "borehole_diameter: Ensure this value is greater than 0."
+            )
+        if self.conflict(line, ref):
+            return
+        if ref in self.new_boreholes:
+            self.new_boreholes[ref].borehole_diameter = diameter
+        else:
+            self.diameters[self.boreholes[ref]] = diameter
+
+    def flush_boreholes(self):
+        if not self.new_boreholes:
+            return
+        insert(Borehole, list(self.new_boreholes.values()))
+        for ref, borehole in self.new_boreholes.items():
+            self.boreholes[ref] = borehole.id
+            self.touched.add(borehole.id)
+        self.report["boreholes"] += len(self.new_boreholes)
+        self.new_boreholes = {}
+        if self.progress:
+            self.progress(self.report)
+
+    def flush_layers(self):
+        # Layers may belong to boreholes which are not inserted yet
+        self.flush_boreholes()
+        if not self.new_layers:
+            return
+        for ref, layer in self.new_layers:
+            layer.borehole_id = self.boreholes[ref]
+            self.touched.add(layer.borehole_id)
+        layers = [layer for ref, layer in self.new_layers]
+        insert(Geology, layers)
+        record_all([
+            ("geology", layer.id, self.project.id) for layer in layers
+        ])
+        self.report["layers"] += len(layers)
+        self.new_layers = []
+        if self.progress:
+            self.progress(self.report)
+
+    def finish(self):
+        """
+        Updates what the signals skipped by bulk_create would have:
+        counters, the change log and cached responses.
+        """
+        Borehole.objects.bulk_update([
+            Borehole(id=id, borehole_diameter=diameter)
+            for id, diameter in self.diameters.items()
+        ], ["borehole_diameter"])
+
+        now = timezone.now()
+        touched = sorted(self.touched)
+        for start in range(0, len(touched), ID_CHUNK):
+            counters.refresh(
+                Borehole, touched[start:start + ID_CHUNK], updated_at=now)
+        counters.refresh(Project, [self.project.id], updated_at=now)
+        counters.refresh(User, [self.logger.id], updated_at=now)
+
+        record_all([("project", self.project.id, self.project.id)] + [
+            ("borehole", id, self.project.id) for id in touched
+        ])
+        invalidate("projects", f"project:{self.project.id}", *(
+            f"borehole:{id}" for id in touched
+        ))
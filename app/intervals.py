@@ -0,0 +1,94 @@
+from django.db import connection
+
+from .search import match_query
+
+
+# Values of each layer in interval responses
+INTERVAL_FIELDS = [
+    "id", "borehole_id", "borehole", "start_depth", "end_depth",
+    "top_elevation", "bottom_elevation", "description"
+]
+
+# Most layers returned by an interval query
+INTERVAL_LIMIT = 5000
+
+# Layers of a project found through the R*Tree index, which stores values
+# as 32 bit floats rounded outwards, so they are compared again with the
+# exact columns
+INTERVAL_QUERY = """
+    SELECT
+        app_geology.id, borehole_id, borehole_reference, start_depth,
+        end_depth, ground_level - start_depth, ground_level - end_depth,
+        geology_description, {first}
+    FROM app_geology_interval
+    INNER JOIN app_geology ON app_geology.id = app_geology_interval.id
+    INNER JOIN app_borehole ON app_borehole.id = app_geology.borehole_id
+    WHERE min_project <= %s AND max_project >= %s
+        AND app_borehole.project_id = %s
+"""
+
+# Conditions of a depth or elevation range, index then exact columns
+DEPTH_RANGE = """
+    AND min_depth <= %s AND max_depth >= %s
+    AND min(start_depth, end_depth) <= %s
+    AND max(start_depth, end_depth) >= %s
+"""
+ELEVATION_RANGE = """
+    AND min_elevation <= %s AND max_elevation >= %s
+    AND ground_level - max(start_depth, end_depth) <= %s
+    AND ground_level - min(start_depth, end_depth) >= %s
+"""
+
+
+def layers(project_id, depth=None, elevation=None, text=None, first=False,
+           limit=INTERVAL_LIMIT):
+    """
+    Returns the layers of a project intersecting a (top, bottom) depth
+    range or a (low, high) elevation range as compact rows of
+    INTERVAL_FIELDS, with "truncated" set when there were more than limit.
+    Layers can be limited to those matching a full text search, and with
+    first to the shallowest such layer of each borehole, such as where
+    each borehole first reached rock.
+    """
+    sql = INTERVAL_QUERY.format(
+        first="min(start_depth)" if first else "NULL")
+    params = [project_id, project_id, project_id]
+    if depth is not None:
+        top, bottom = depth
+        sql += DEPTH_RANGE
+        params += [bottom, top, bottom, top]
+    if elevation is not None:
+        low, high = elevation
+        sql += ELEVATION_RANGE
+        params += [high, low, high, low]
+    if text is not None and not match_query(text):
+        return {"fields": INTERVAL_FIELDS, "layers": [], "truncated": False}
+    if text is not None:
+        sql += """
+            AND app_geology.id * 2 IN (
+                SELECT rowid FROM app_search
+                WHERE app_search MATCH %s AND project_id = %s
+            )
+        """
+        params += [match_query(text), project_id]
+    if first:
+        # SQLite takes the other columns from the row with the minimum
+        sql += " GROUP BY borehole_id"
+    sql += " ORDER BY borehole_id, start_depth, app_geology.id LIMIT %s"
+    params.append(limit + 1)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = [
+            [
+                id, borehole_id, borehole, float(start), float(end),
+                round(float(top), 2), round(float(bottom), 2), description
+            ]
+            for id, borehole_id, borehole, start, end, top, bottom,
+            description, _ in cursor.fetchall()
+        ]
+    return {
+        "fields": INTERVAL_FIELDS,
+        "layers": rows[:limit],
+        "truncated": len(rows) > limit
+    }
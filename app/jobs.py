@@ -0,0 +1,155 @@
+import json
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+
+# Function running each kind of job, called with the job
+HANDLERS = {
+    "report": "app.reports.report",
+    "strip_log": "app.reports.render_log",
+    "collect_sketches": "app.sketches.collect"
+}
+
+# Seconds a worker waits before looking for new jobs when none are queued
+POLL_SECONDS = 1.0
+
+# Times a job is claimed by workers which stop before it is failed
+MAX_ATTEMPTS = 3
+
+
+def enqueue(kind, user=None, **arguments):
+    """
+    Queues a job of kind with JSON serializable arguments.
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job {kind!r}.")
+    return Job.objects.create(
+        kind=kind, user=user, arguments=json.dumps(arguments))
+
+
+def arguments(job):
+    return json.loads(job.arguments)
+
+
+def fan_out(job, children):
+    """
+    Queues child jobs, each a (kind, arguments) pair, and makes job wait
+    for them. The job is queued again once every child has finished, its
+    handler then finds its children finished and assembles their results.
+    """
+    with transaction.atomic():
+        Job.objects.bulk_create([
+            Job(
+                kind=kind, user_id=job.user_id, parent=job,
+                arguments=json.dumps(values)
+            ) for kind, values in children
+        ])
+        job.status, job.total, job.progress = Job.WAITING, len(children), 0
+        job.save(update_fields=["status", "total", "progress", "updated_at"])
+
+
+def expire():
+    """
+    Takes back the running jobs whose lease of QLOG_JOB_LEASE seconds ran
+    out, as their worker stopped. They are queued again, or failed once
+    they were claimed MAX_ATTEMPTS times so their parent can finish.
+    """
+    lease = getattr(settings, "QLOG_JOB_LEASE", 15 * 60)
+    now = timezone.now()
+    expired = Job.objects.filter(
+        status=Job.RUNNING, claimed_at__lt=now - timedelta(seconds=lease))
+    expired.filter(attempts__lt=MAX_ATTEMPTS).update(
+        status=Job.QUEUED, updated_at=now)
+    for job in expired.filter(attempts__gte=MAX_ATTEMPTS):
+        failed = Job.objects.filter(
+            id=job.id, status=Job.RUNNING, claimed_at=job.claimed_at
+        ).update(
+            status=Job.FAILED, updated_at=now,
+            error=f"Worker stopped during each of {job.attempts} attempts."
+        )
+        if failed:
+            finished(job)
+
+
+def claim():
+    """
+    Takes the oldest queued job and marks it running, or returns None when
+    there are none. A job is only claimed by the worker whose update
+    changes it from queued, so workers never run the same job.
+    Expired jobs are taken back first.
+    """
+    expire()
+    while True:
+        id = Job.objects.filter(status=Job.QUEUED).order_by(
+            "id").values_list("id", flat=True).first()
+        if id is None:
+            return None
+        now = timezone.now()
+        claimed = Job.objects.filter(id=id, status=Job.QUEUED).update(
+            status=Job.RUNNING, claimed_at=now,
+            attempts=F("attempts") + 1, updated_at=now)
+        if claimed:
+            return Job.objects.get(id=id)
+
+
+def finished(job):
+    """
+    Counts a finished child job towards its parent and queues the parent
+    again when it was the last one, with its attempts counted afresh.
+    """
+    if job.parent_id is None:
+        return
+    with transaction.atomic():
+        Job.objects.filter(id=job.parent_id).update(
+            progress=F("progress") + 1, updated_at=timezone.now())
+        unfinished = Job.objects.filter(parent_id=job.parent_id).filter(
+            ~Q(status__in=[Job.DONE, Job.FAILED])).exists()
+        if not unfinished:
+            Job.objects.filter(
+                id=job.parent_id, status=Job.WAITING
+            ).update(
+                status=Job.QUEUED, attempts=0, updated_at=timezone.now())
+
+
+def run(job):
+    """
+    Runs a claimed job and stores its result, or its error if it raised.
+    Jobs which fanned out are left waiting for their children.
+    """
+    try:
+        result = import_string(HANDLERS[job.kind])(job)
+    except Exception:
+        job.status, job.error = Job.FAILED, traceback.format_exc()
+        job.save(update_fields=["status", "error", "updated_at"])
+    else:
+        if job.status == Job.WAITING:
+            return
+        job.status, job.result = Job.DONE, json.dumps(result)
+        job.save(update_fields=["status", "result", "updated_at"])
+    finished(job)
+
+
+def work(once=False, poll=POLL_SECONDS):
+    """
+    Runs queued jobs one after another. With once, returns the number of
+    jobs run when none are left, otherwise waits for more forever.
+    """
+    count = 0
+    while True:
+        job = claim()
+        if job is not None:
+            run(job)
+            count += 1
+        elif once:
+            return count
+        else:
+            time.sleep(poll)
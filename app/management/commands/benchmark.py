@@ -0,0 +1,209 @@
+import sys
+import json
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from app.cache import get_cache
+from app.models import User, Project, Borehole, Geology
+from app.urls import urlpatterns
+
+
+# Routes which would change the state of the benchmark session, only
+# accept writes or have no sample row
+SKIPPED = ["logout", "batch", "import_boreholes", "project_report", "job"]
+
+# Sample query strings of routes which need one
+QUERIES = {
+    "search": "q=clay",
+    "map_within": "box=-1000,-1000,1000,1000",
+    "map_nearest": "easting=0&northing=0",
+    "map_clusters": "zoom=3&box=-1000,-1000,1000,1000",
+    "cross_section": "line=-1000,0,1000,0&buffer=100",
+    "stratum_surface": "stratum=clay&resolution=10"
+}
+
+# Private cache used while benchmarking, so clearing it between requests
+# leaves the cache of a running server alone
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "benchmark"
+    }
+}
+
+# Routes which list every row when the parameter given is 0
+COLLECTIONS = {
+    "projects": "project_id",
+    "profile": "user_id",
+    "geology": "strata_id"
+}
+
+
+def body(response):
+    """
+    Returns the full body of a response, consuming it if streamed.
+    """
+    if response.streaming:
+        return b"".join(response.streaming_content)
+    return response.content
+
+
+class QueryCounter:
+    """
+    Database execute wrapper counting every query run through it.
+    Unlike CaptureQueriesContext it does not depend on connection.queries,
+    which is reset at the start of each request when DEBUG is on.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def percentile(values, percent):
+    """
+    Returns the nearest-rank percentile of a list of numbers.
+    """
+    values = sorted(values)
+    rank = max(int(round(percent / 100 * len(values))) - 1, 0)
+    return values[rank]
+
+
+class Command(BaseCommand):
+    """
+    Requests every route in app.urls through the Django test client.
+    Reports p50/p95 latency, SQL query count and peak Python memory per
+    endpoint as JSON so runs can be compared between releases.
+    Latency is reported for cold requests made with an empty cache and
+    for warm requests repeating them, queries and memory for cold ones.
+    Intended to be run against a database filled by seed_data.
+    """
+    help = "Benchmarks every API route and prints the results as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument(
+            "--user", help="Username to log in as, defaults to the first."
+        )
+        parser.add_argument(
+            "--output", help="File to write results to, defaults to stdout."
+        )
+
+    def handle(self, *args, **options):
+        if options["user"]:
+            user = User.objects.filter(username=options["user"]).first()
+        else:
+            user = User.objects.order_by("id").first()
+        project = Project.objects.order_by("id").first()
+        borehole = Borehole.objects.order_by("id").first()
+        layer = Geology.objects.order_by("id").first()
+        if None in (user, project, borehole, layer):
+            raise CommandError("Nothing to benchmark, run seed_data first.")
+
+        # Sample values for each URL parameter name used in app.urls
+        self.kwargs = {
+            "project_id": project.id,
+            "user_id": user.id,
+            "borehole_id": borehole.id,
+            "strata_id": layer.id,
+            "page_number": 1
+        }
+        self.client = Client()
+        self.client.force_login(user)
+
+        results = {
+            "iterations": options["iterations"],
+            "endpoints": []
+        }
+        hosts = [*settings.ALLOWED_HOSTS, "testserver"]
+        with override_settings(
+                ALLOWED_HOSTS=hosts, CACHES=CACHES,
+                QLOG_RESPONSE_CACHE="default"):
+            for name, url in self.routes():
+                results["endpoints"].append(
+                    self.measure(name, url, options["iterations"]))
+
+        output = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+    def routes(self):
+        """
+        Yields the name and a sample URL of every route in app.urls.
+        Collection routes are also requested with an id of 0.
+        """
+        for pattern in urlpatterns:
+            if pattern.name in SKIPPED:
+                continue
+            params = pattern.pattern.converters.keys()
+            missing = [param for param in params if param not in self.kwargs]
+            if missing:
+                sys.stderr.write(
+                    f"Skipping {pattern.name}, no sample for {missing}.\n")
+                continue
+            kwargs = {param: self.kwargs[param] for param in params}
+            url = reverse(pattern.name, kwargs=kwargs)
+            if pattern.name in QUERIES:
+                url += f"?{QUERIES[pattern.name]}"
+            yield pattern.name, url
+
+            # Requests for all rows use an id of 0
+            if pattern.name in COLLECTIONS:
+                kwargs[COLLECTIONS[pattern.name]] = 0
+                yield f"{pattern.name} (all)", reverse(
+                    pattern.name, kwargs=kwargs)
+
+    def measure(self, name, url, iterations):
+        """
+        Requests a URL several times and returns its statistics.
+        """
+        cache = get_cache()
+        timings, warm = [], []
+        for _ in range(max(iterations, 1)):
+            cache.clear()
+            start = time.perf_counter()
+            response = self.client.get(url)
+            content = body(response)
+            timings.append((time.perf_counter() - start) * 1000)
+
+            # The same request again is answered from the cache if it can be
+            start = time.perf_counter()
+            body(self.client.get(url))
+            warm.append((time.perf_counter() - start) * 1000)
+
+        # Queries and memory are measured separately to keep the timings clean
+        cache.clear()
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            body(self.client.get(url))
+        cache.clear()
+        tracemalloc.start()
+        body(self.client.get(url))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        return {
+            "name": name,
+            "url": url,
+            "status": response.status_code,
+            "bytes": len(content),
+            "p50_ms": round(percentile(timings, 50), 3),
+            "p95_ms": round(percentile(timings, 95), 3),
+            "warm_p50_ms": round(percentile(warm, 50), 3),
+            "warm_p95_ms": round(percentile(warm, 95), 3),
+            "queries": counter.count,
+            "peak_memory_kb": round(peak / 1024, 1)
+        }
@@ -0,0 +1,68 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from app.management.commands.benchmark import percentile
+from app.models import Geology, Message
+from app.search import SEARCH_PAGE_SIZE, find
+
+
+def scan(text, project_id=None, size=SEARCH_PAGE_SIZE):
+    """
+    Finds the first size layers and messages containing every word of
+    text with icontains filters, the way searching worked before the full
+    text index. Returns the number of rows found.
+    """
+    layers = Geology.objects.all()
+    messages = Message.objects.all()
+    if project_id is not None:
+        layers = layers.filter(borehole__project_id=project_id)
+        messages = messages.filter(project_id=project_id)
+    for word in text.split():
+        layers = layers.filter(
+            Q(geology_description__icontains=word) |
+            Q(field_test_details__icontains=word) |
+            Q(spt_result__icontains=word)
+        )
+        messages = messages.filter(message__icontains=word)
+    found = len(list(layers[:size]))
+    if found < size:
+        found += len(list(messages[:size - found]))
+    return found
+
+
+class Command(BaseCommand):
+    """
+    Times a search with the full text index against the same search with
+    icontains scans and prints the results as JSON. Both return a page of
+    SEARCH_PAGE_SIZE results, as the search endpoint does, the index
+    ranked and the scans in table order.
+    Intended to be run against a database filled by seed_data.
+    """
+    help = "Benchmarks full text search against icontains scans."
+
+    def add_arguments(self, parser):
+        parser.add_argument("query", nargs="?", default="stiff clay")
+        parser.add_argument("--project", type=int)
+        parser.add_argument("--iterations", type=int, default=20)
+
+    def handle(self, *args, **options):
+        query, project = options["query"], options["project"]
+        results = {"query": query, "project": project}
+        for name, run in (
+            ("fts", lambda: len(find(query, project)["results"])),
+            ("icontains", lambda: scan(query, project))
+        ):
+            timings = []
+            for _ in range(max(options["iterations"], 1)):
+                start = time.perf_counter()
+                rows = run()
+                timings.append((time.perf_counter() - start) * 1000)
+            results[name] = {
+                "rows": rows,
+                "p50_ms": round(percentile(timings, 50), 3),
+                "p95_ms": round(percentile(timings, 95), 3)
+            }
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,51 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.exporter import EXPORTS, export
+from app.models import Project
+
+
+class Command(BaseCommand):
+    """
+    Writes the boreholes and layers of projects as CSV, AGS4 or NDJSON.
+    Rows are streamed from the database, so memory use does not grow with
+    the size of the projects.
+    """
+    help = "Exports the boreholes and layers of projects."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "projects", type=int, nargs="*",
+            help="Project ids, defaults to every project."
+        )
+        parser.add_argument("--lead", help="Only projects led by username.")
+        parser.add_argument(
+            "--format", choices=sorted(EXPORTS), default="csv")
+        parser.add_argument(
+            "--output", help="File to write to, defaults to stdout."
+        )
+        parser.add_argument(
+            "--gzip", action="store_true", help="Compress the output."
+        )
+
+    def handle(self, *args, **options):
+        projects = Project.objects.all()
+        if options["projects"]:
+            projects = projects.filter(id__in=options["projects"])
+        if options["lead"]:
+            projects = projects.filter(lead__username=options["lead"])
+        if not projects.exists():
+            raise CommandError("No projects to export.")
+        if options["format"] == "ags" and projects.count() != 1:
+            raise CommandError("AGS exports hold a single project.")
+
+        chunks = export(projects, options["format"], options["gzip"])
+        if options["output"]:
+            with open(options["output"], "wb") as file:
+                for chunk in chunks:
+                    file.write(chunk)
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.flush()
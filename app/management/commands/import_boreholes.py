@@ -0,0 +1,64 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.formats import READERS, InvalidFile
+from app.importer import Importer
+from app.models import User, Project
+
+
+class Command(BaseCommand):
+    """
+    Imports boreholes and geology layers from an AGS4 or CSV file into an
+    existing project. The file is read one line at a time.
+    """
+    help = "Imports boreholes and geology layers from an AGS4 or CSV file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("project", type=int, help="Project id.")
+        parser.add_argument("path")
+        parser.add_argument(
+            "--format", choices=sorted(READERS),
+            help="File format, defaults to the file extension."
+        )
+        parser.add_argument(
+            "--logger", help="Username of the logger, defaults to the lead."
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        project = Project.objects.select_related("lead").filter(
+            id=options["project"]).first()
+        if project is None:
+            raise CommandError("Project could not be found.")
+        logger = project.lead
+        if options["logger"]:
+            logger = User.objects.filter(username=options["logger"]).first()
+            if logger is None:
+                raise CommandError("User could not be found.")
+
+        extension = os.path.splitext(options["path"])[1].lstrip(".").lower()
+        format = options["format"] or extension
+        if format not in READERS:
+            raise CommandError(f"Unknown format {format!r}.")
+
+        importer = Importer(
+            project, logger, options["batch_size"], progress=self.progress)
+        with open(options["path"], encoding="utf-8-sig", newline="") as file:
+            try:
+                report = importer.run(READERS[format](file))
+            except InvalidFile as error:
+                raise CommandError(f"Line {error.line}: {error}")
+
+        for error in report["errors"]:
+            self.stdout.write(f"Line {error['line']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report['boreholes']} boreholes and "
+            f"{report['layers']} layers with {report['error_count']} errors."
+        ))
+
+    def progress(self, report):
+        self.stderr.write(
+            f"Line {report['lines']}: {report['boreholes']} boreholes, "
+            f"{report['layers']} layers"
+        )
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app.models import Geology
+from app.spt import SPT_FIELDS
+
+
+class Command(BaseCommand):
+    """
+    Parses the SPT result of every geology layer into its numeric columns.
+    Layers are read and updated in chunks of --batch-size in id order, each
+    chunk in its own transaction, so memory use and lock time do not grow
+    with the table.
+    """
+    help = "Backfills the parsed SPT columns of geology layers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        size = max(options["batch_size"], 1)
+        last, total = 0, 0
+        while True:
+            layers = list(Geology.objects.filter(id__gt=last).order_by(
+                "id").only("id", "spt_result")[:size])
+            if not layers:
+                break
+            for layer in layers:
+                layer.parse_spt()
+            with transaction.atomic():
+                Geology.objects.bulk_update(layers, SPT_FIELDS)
+            last = layers[-1].id
+            total += len(layers)
+            self.stdout.write(f"Parsed {total} layers.")
+        self.stdout.write(self.style.SUCCESS("SPT results parsed."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from app import clusters
+
+
+class Command(BaseCommand):
+    """
+    Refills the map clusters of every zoom level from the boreholes.
+    """
+    help = "Rebuilds the borehole map clusters."
+
+    def handle(self, *args, **options):
+        clusters.rebuild()
+        self.stdout.write(self.style.SUCCESS("Map clusters rebuilt."))
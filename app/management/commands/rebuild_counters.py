@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app import counters
+
+
+class Command(BaseCommand):
+    """
+    Recomputes the denormalized counters on users, projects and boreholes
+    from the rows they count, or with --verify only reports mismatches.
+    """
+    help = "Rebuilds or verifies the denormalized counters."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify", action="store_true",
+            help="Report counters which are wrong without fixing them."
+        )
+
+    def handle(self, *args, **options):
+        if not options["verify"]:
+            counters.rebuild()
+            self.stdout.write(self.style.SUCCESS("Counters rebuilt."))
+            return
+
+        errors = counters.verify()
+        for model, field, id, stored, expected in errors:
+            self.stdout.write(
+                f"{model} {id}: {field} is {stored}, expected {expected}")
+        if errors:
+            raise CommandError(f"{len(errors)} counters are wrong.")
+        self.stdout.write(self.style.SUCCESS("Counters are correct."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from app import search
+
+
+class Command(BaseCommand):
+    """
+    Refills the full text index of geology layers and messages.
+    """
+    help = "Rebuilds the full text search index."
+
+    def handle(self, *args, **options):
+        search.rebuild()
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
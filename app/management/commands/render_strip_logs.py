@@ -0,0 +1,44 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.models import Project
+from app.processes import worker_pool
+from app.striplogs import LOG_FORMATS, render_borehole
+
+
+class Command(BaseCommand):
+    """
+    Renders the strip log of every borehole in a project with a pool of
+    worker processes. Logs already rendered for the current version of
+    their borehole are kept.
+    """
+    help = "Renders the strip logs of every borehole in a project."
+
+    def add_arguments(self, parser):
+        parser.add_argument("project", type=int, help="Project id.")
+        parser.add_argument(
+            "--format", choices=sorted(LOG_FORMATS), default="png")
+        parser.add_argument(
+            "--workers", type=int, default=os.cpu_count() or 1,
+            help="Worker processes, 1 renders in this process."
+        )
+
+    def handle(self, *args, **options):
+        project = Project.objects.filter(id=options["project"]).first()
+        if project is None:
+            raise CommandError("Project could not be found.")
+        ids = list(project.borehole.order_by("id").values_list(
+            "id", flat=True))
+        formats = [options["format"]] * len(ids)
+
+        if options["workers"] > 1 and len(ids) > 1:
+            with worker_pool(options["workers"]) as pool:
+                names = list(pool.map(
+                    render_borehole, ids, formats, chunksize=16))
+        else:
+            names = list(map(render_borehole, ids, formats))
+
+        rendered = len([name for name in names if name])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {rendered} strip logs for project {project.id}."))
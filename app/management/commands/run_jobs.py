@@ -0,0 +1,37 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from app.jobs import POLL_SECONDS, work
+from app.processes import worker_pool
+
+
+class Command(BaseCommand):
+    """
+    Runs queued background jobs with a pool of worker processes, each
+    taking the oldest queued job in turn, so the child jobs of a report
+    are run in parallel. Runs until stopped, or with --once until no jobs
+    are left.
+    """
+    help = "Runs queued background jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=os.cpu_count() or 1,
+            help="Worker processes, 1 runs jobs in this process."
+        )
+        parser.add_argument(
+            "--once", action="store_true",
+            help="Stop once no jobs are queued."
+        )
+        parser.add_argument("--poll", type=float, default=POLL_SECONDS)
+
+    def handle(self, *args, **options):
+        workers, once = max(options["workers"], 1), options["once"]
+        if workers == 1:
+            count = work(once, options["poll"])
+        else:
+            with worker_pool(workers) as pool:
+                count = sum(pool.map(
+                    work, [once] * workers, [options["poll"]] * workers))
+        self.stdout.write(self.style.SUCCESS(f"Ran {count} jobs."))
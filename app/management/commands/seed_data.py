@@ -0,0 +1,171 @@
+import random
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app import counters, sync
+from app.batch import insert, last_id
+from app.models import User, Project, Borehole, Geology, Message
+
+
+SOILS = ["CLAY", "SILT", "SAND", "GRAVEL", "PEAT", "SANDSTONE", "SHALE"]
+STRENGTHS = ["Very soft", "Soft", "Firm", "Stiff", "Very stiff", "Hard"]
+
+
+def chunks(iterable, size):
+    """
+    Splits an iterable into lists of at most size items.
+    """
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+class Command(BaseCommand):
+    """
+    Seeds the database with a reproducible synthetic dataset.
+    The same --seed always generates the same rows, and rows are written
+    with bulk_create in batches so memory use does not grow with size.
+    """
+    help = "Seeds the database with synthetic projects, boreholes and layers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=20)
+        parser.add_argument("--projects", type=int, default=100)
+        parser.add_argument(
+            "--boreholes", type=int, default=10,
+            help="Boreholes per project."
+        )
+        parser.add_argument(
+            "--layers", type=int, default=10,
+            help="Geology layers per borehole."
+        )
+        parser.add_argument(
+            "--messages", type=int, default=10,
+            help="Messages per project."
+        )
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+
+        with transaction.atomic():
+            start = {
+                name: last_id(model)
+                for name, (model, *rest) in sync.SYNCED.items()
+            }
+            users = self.create_users(options["users"], options["seed"])
+            projects = self.create_projects(options["projects"], users)
+            boreholes = self.create_boreholes(
+                projects, options["boreholes"], users)
+            self.create_geology(boreholes, options["layers"])
+            self.create_messages(projects, options["messages"], users)
+
+            # bulk_create skips the signals which maintain the counters
+            counters.rebuild()
+            for name in sync.SYNCED:
+                sync.record_many(name, start[name], self.batch_size)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(users)} users, {len(projects)} projects, "
+            f"{len(boreholes)} boreholes and "
+            f"{len(boreholes) * options['layers']} layers."
+        ))
+
+    def insert(self, model, rows):
+        """
+        Inserts rows from an iterable in batches.
+        """
+        for chunk in chunks(rows, self.batch_size):
+            model.objects.bulk_create(chunk)
+
+    def bulk_create(self, model, rows):
+        """
+        Inserts rows from an iterable in batches.
+        Returns the ids of the inserted rows.
+        """
+        ids = []
+        for chunk in chunks(rows, self.batch_size):
+            insert(model, chunk)
+            ids.extend(row.pk for row in chunk)
+        return ids
+
+    def create_users(self, count, seed):
+        # Hash once, every seeded user shares the same password
+        password = make_password("qlog")
+        usernames = [f"seed{seed}_user{n}" for n in range(count)]
+        User.objects.bulk_create([
+            User(username=username, password=password)
+            for username in usernames
+        ], ignore_conflicts=True)
+        users = User.objects.filter(username__in=usernames).order_by("id")
+        return list(users.values_list("id", flat=True))
+
+    def create_projects(self, count, users):
+        return self.bulk_create(Project, (
+            Project(
+                lead_id=self.random.choice(users),
+                project_title=f"Project {n}",
+                project_reference=f"P{n:05d}",
+                project_client=f"Client {self.random.randint(1, 50)}",
+                project_description="Synthetic project."
+            ) for n in range(count)
+        ))
+
+    def create_boreholes(self, projects, count, users):
+        return self.bulk_create(Borehole, (
+            Borehole(
+                logger_id=self.random.choice(users),
+                project_id=project,
+                borehole_reference=f"BH{n + 1:02d}",
+                borehole_northing=round(self.random.uniform(0, 999), 6),
+                borehole_easting=round(self.random.uniform(0, 999), 6),
+                ground_level=round(self.random.uniform(0, 100), 2),
+                drilling_equipment="Rotary rig",
+                borehole_diameter=self.random.choice([100, 150, 200])
+            ) for project in projects for n in range(count)
+        ))
+
+    def create_geology(self, boreholes, count):
+        self.insert(Geology, self.layers(boreholes, count))
+
+    def layers(self, boreholes, count):
+        """
+        Builds consecutive layers down each borehole.
+        """
+        # Thinner layers for deep logs so depths fit in 999.99m
+        scale = min(1.0, 300 / max(count, 1))
+        for borehole in boreholes:
+            depth = 0
+            for n in range(count):
+                thickness = self.random.uniform(0.3, 3.0) * scale
+                thickness = max(round(thickness, 2), 0.01)
+                blows = self.random.randint(2, 50)
+                yield Geology(
+                    borehole_id=borehole,
+                    start_depth=depth,
+                    end_depth=round(depth + thickness, 2),
+                    sample_number=f"S{n + 1}",
+                    spt_result=f"N={blows}",
+                    field_test_details=f"SPT at {depth:.2f}m",
+                    geology_description=(
+                        f"{self.random.choice(STRENGTHS)} "
+                        f"{self.random.choice(SOILS)}"
+                    )
+                )
+                depth = round(depth + thickness, 2)
+
+    def create_messages(self, projects, count, users):
+        self.insert(Message, (
+            Message(
+                project_id=project,
+                user_id=self.random.choice(users),
+                message=f"Message {n} on project {project}."
+            ) for project in projects for n in range(count)
+        ))
@@ -0,0 +1,214 @@
+import os
+import json
+import glob
+import time
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+
+
+# Upper bounds of the latency histogram buckets in seconds
+LATENCY_BUCKETS = [
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+]
+
+
+def metrics_dir():
+    """
+    Returns the directory shared by worker processes, or None when metrics
+    are only kept in memory.
+    """
+    return getattr(settings, "QLOG_METRICS_DIR", None)
+
+
+class Metric:
+    """
+    Base class for a named metric with a fixed set of label names.
+    Values are kept in the registry keyed by the metric and label values.
+    """
+    type = None
+
+    def __init__(self, registry, name, documentation, labels):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+
+    def key(self, labels):
+        return json.dumps(
+            [self.name] + [str(labels.get(label, "")) for label in self.labels]
+        )
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.registry.lock:
+            values = self.registry.values
+            values[key] = values.get(key, 0) + amount
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, *args, buckets=LATENCY_BUCKETS):
+        super().__init__(*args)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.registry.lock:
+            values = self.registry.values
+            counts = values.get(key)
+            if counts is None:
+                counts = values[key] = [0] * (len(self.buckets) + 3)
+
+            # Bucket counts are stored per bucket and summed when rendered
+            counts[bisect_left(self.buckets, value)] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+
+class Registry:
+    """
+    Holds the metrics of this process.
+    When QLOG_METRICS_DIR is set, each process periodically writes its
+    values to its own file there and the /metrics view sums the files of
+    every process. Files of exited processes are kept so totals never go
+    backwards, apart from when a new process reuses an old pid.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.values = {}
+        self.last_flush = 0
+
+    def counter(self, name, documentation, labels=()):
+        self.metrics[name] = Counter(self, name, documentation, labels)
+        return self.metrics[name]
+
+    def histogram(self, name, documentation, labels=(), **kwargs):
+        self.metrics[name] = Histogram(
+            self, name, documentation, labels, **kwargs)
+        return self.metrics[name]
+
+    def flush(self, interval=0):
+        """
+        Writes the values of this process to the shared directory if at
+        least interval seconds have passed since the last write.
+        """
+        directory = metrics_dir()
+        if directory is None or time.time() - self.last_flush < interval:
+            return
+        with self.lock:
+            data = json.dumps(self.values)
+            self.last_flush = time.time()
+
+        # Written to a temporary file first so readers never see half a file
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"metrics_{os.getpid()}.json")
+        with open(f"{path}.tmp", "w") as f:
+            f.write(data)
+        os.replace(f"{path}.tmp", path)
+
+    def collect(self):
+        """
+        Returns the values of every process added together.
+        """
+        directory = metrics_dir()
+        if directory is None:
+            with self.lock:
+                return json.loads(json.dumps(self.values))
+
+        self.flush()
+        totals = {}
+        for path in glob.glob(os.path.join(directory, "metrics_*.json")):
+            try:
+                with open(path) as f:
+                    values = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for key, value in values.items():
+                if isinstance(value, list):
+                    total = totals.setdefault(key, [0] * len(value))
+                    for i, count in enumerate(value):
+                        total[i] += count
+                else:
+                    totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def render(self):
+        """
+        Returns all metrics in the Prometheus text exposition format.
+        """
+        values = self.collect()
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for key in sorted(values):
+                name, *label_values = json.loads(key)
+                if name != metric.name:
+                    continue
+                labels = [
+                    f'{label}="{value}"'
+                    for label, value in zip(metric.labels, label_values)
+                ]
+                if metric.type == "counter":
+                    lines.append(
+                        f"{name}{format_labels(labels)} {values[key]}")
+                else:
+                    lines += render_histogram(metric, labels, values[key])
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def render_histogram(metric, labels, counts):
+    """
+    Returns the bucket, sum and count lines of one histogram series.
+    """
+    lines = []
+    cumulative = 0
+    bounds = [str(bound) for bound in metric.buckets] + ["+Inf"]
+    for bound, count in zip(bounds, counts):
+        cumulative += count
+        bucket = format_labels(labels + [f'le="{bound}"'])
+        lines.append(f"{metric.name}_bucket{bucket} {cumulative}")
+    lines.append(f"{metric.name}_sum{format_labels(labels)} {counts[-2]}")
+    lines.append(f"{metric.name}_count{format_labels(labels)} {counts[-1]}")
+    return lines
+
+
+registry = Registry()
+
+REQUESTS = registry.counter(
+    "qlog_requests_total",
+    "Requests handled by URL name, method and status code.",
+    ["view", "method", "status"]
+)
+REQUEST_LATENCY = registry.histogram(
+    "qlog_request_duration_seconds",
+    "Request latency by URL name.",
+    ["view"]
+)
+QUERY_LATENCY = registry.histogram(
+    "qlog_db_query_duration_seconds",
+    "SQL query latency by URL name.",
+    ["view"]
+)
+CACHE_REQUESTS = registry.counter(
+    "qlog_cache_requests_total",
+    "Response cache lookups by result (hit or miss).",
+    ["result"]
+)
+SKETCH_UPLOAD_BYTES = registry.counter(
+    "qlog_sketch_upload_bytes_total",
+    "Bytes of sketch images uploaded."
+)
@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import random
+import cProfile
+import logging
+
+from django.conf import settings
+from django.db import connection
+
+from .metrics import registry, REQUESTS, REQUEST_LATENCY, QUERY_LATENCY
+from .timing import RequestTimer, activate, deactivate
+
+
+logger = logging.getLogger("app.requests")
+
+
+class TimingMiddleware:
+    """
+    Times every request and reports the result in a Server-Timing header.
+    Sections reported are the whole request, the view, SQL queries, model
+    serialization and JSON encoding. Requests slower than
+    QLOG_SLOW_REQUEST_MS are logged with their slowest SQL statements.
+    When QLOG_PROFILE_DIR is set, a QLOG_PROFILE_SAMPLE_RATE fraction of
+    requests are run under cProfile and the profile is saved there if they
+    turn out to be slow.
+    Should be the first entry in MIDDLEWARE so the total covers every
+    other middleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_ms = getattr(settings, "QLOG_SLOW_REQUEST_MS", 500)
+        self.slow_queries = getattr(settings, "QLOG_SLOW_QUERY_COUNT", 5)
+        self.sample_rate = getattr(settings, "QLOG_PROFILE_SAMPLE_RATE", 0)
+        self.profile_dir = getattr(settings, "QLOG_PROFILE_DIR", None)
+
+    def __call__(self, request):
+        timer = RequestTimer()
+        request.timer = timer
+        activate(timer)
+
+        # Only a sample of requests pay for the profiler
+        profiler = None
+        if self.profile_dir and random.random() < self.sample_rate:
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+        try:
+            with connection.execute_wrapper(timer):
+                response = self.get_response(request)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            deactivate()
+
+        if timer.view_start is not None:
+            timer.add("view", time.perf_counter() - timer.view_start)
+        total = timer.total
+        response["Server-Timing"] = self.header(timer, total)
+
+        if total * 1000 >= self.slow_ms:
+            self.log(request, response, timer, total, profiler)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.timer.view_start = time.perf_counter()
+
+    def header(self, timer, total):
+        """
+        Formats the sections of a request timer as a Server-Timing header.
+        """
+        metrics = [
+            f"total;dur={total * 1000:.2f}",
+            f'db;dur={timer.db_time * 1000:.2f};desc="{len(timer.queries)} '
+            f'queries"'
+        ]
+        for name, duration in timer.sections.items():
+            metrics.append(f"{name};dur={duration * 1000:.2f}")
+        return ", ".join(metrics)
+
+    def log(self, request, response, timer, total, profiler):
+        """
+        Writes a structured record of a slow request to the log.
+        """
+        record = {
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "total_ms": round(total * 1000, 3),
+            "db_ms": round(timer.db_time * 1000, 3),
+            "queries": len(timer.queries),
+            "sections_ms": {
+                name: round(duration * 1000, 3)
+                for name, duration in timer.sections.items()
+            },
+            "worst_queries": [
+                {"ms": duration, "sql": sql}
+                for duration, sql in timer.worst_queries(self.slow_queries)
+            ],
+            "profile": None
+        }
+
+        # Keep the profile of sampled outliers for later inspection
+        if profiler is not None:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            name = request.path.strip("/").replace("/", "_") or "index"
+            path = os.path.join(
+                self.profile_dir,
+                f"{int(time.time() * 1000)}_{request.method}_{name}.prof"
+            )
+            profiler.dump_stats(path)
+            record["profile"] = path
+
+        logger.warning(json.dumps(record))
+
+
+class MetricsMiddleware:
+    """
+    Counts requests and records request and SQL query latency per URL name
+    in the metrics registry served at /metrics.
+    Must come after TimingMiddleware, whose timer supplies the queries.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.flush_interval = getattr(
+            settings, "QLOG_METRICS_FLUSH_SECONDS", 5)
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        # Requests which did not match a route are grouped together
+        match = request.resolver_match
+        view = match.url_name if match and match.url_name else "unmatched"
+        REQUESTS.inc(
+            view=view, method=request.method, status=response.status_code)
+        REQUEST_LATENCY.observe(duration, view=view)
+        timer = getattr(request, "timer", None)
+        if timer is not None:
+            for query_duration, sql in timer.queries:
+                QUERY_LATENCY.observe(query_duration, view=view)
+
+        registry.flush(self.flush_interval)
+        return response
@@ -0,0 +1,37 @@
+# Generated by Django 3.0.3 on 2026-10-18 02:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='borehole',
+            index=models.Index(fields=['project', 'borehole_timestamp', 'id'], name='borehole_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borehole',
+            index=models.Index(fields=['logger', 'project'], name='borehole_logger_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='geology',
+            index=models.Index(fields=['borehole', 'geology_timestamp', 'id'], name='geology_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['project', 'message_date', 'id'], name='message_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['project_timestamp', 'id'], name='project_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['lead', 'project_timestamp'], name='project_lead_idx'),
+        ),
+    ]
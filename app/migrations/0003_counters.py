@@ -0,0 +1,80 @@
+# Generated by Django 3.0.3 on 2026-10-18 02:42
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def aggregate_of(model, field, aggregate, default=Value(0)):
+    rows = model.objects.filter(**{field: OuterRef("pk")}).order_by()
+    rows = rows.values(field).annotate(value=aggregate).values("value")
+    return Coalesce(Subquery(rows), default)
+
+
+def fill_counters(apps, schema_editor):
+    """
+    Counts the rows which existed before the counters were added.
+    """
+    User = apps.get_model("app", "User")
+    Project = apps.get_model("app", "Project")
+    Borehole = apps.get_model("app", "Borehole")
+    Geology = apps.get_model("app", "Geology")
+    Message = apps.get_model("app", "Message")
+    depth = models.DecimalField(max_digits=5, decimal_places=2)
+
+    User.objects.update(
+        project_count=aggregate_of(Project, "lead", Count("id")),
+        borehole_count=aggregate_of(Borehole, "logger", Count("id"))
+    )
+    Project.objects.update(
+        borehole_count=aggregate_of(Borehole, "project", Count("id")),
+        message_count=aggregate_of(Message, "project", Count("id"))
+    )
+    Borehole.objects.update(
+        layer_count=aggregate_of(Geology, "borehole", Count("id")),
+        logged_depth=aggregate_of(
+            Geology, "borehole", Max("end_depth"),
+            default=Value(0, output_field=depth)
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='borehole',
+            name='layer_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='borehole',
+            name='logged_depth',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=5),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='borehole_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='borehole_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='project_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
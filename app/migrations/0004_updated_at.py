@@ -0,0 +1,51 @@
+# Generated by Django 3.0.3 on 2026-10-18 03:10
+
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def fill_updated_at(apps, schema_editor):
+    """
+    Rows which existed before updated_at was added were last changed no
+    later than when they were created, as far as we know.
+    """
+    for model, created in [
+        ("Project", "project_timestamp"),
+        ("Borehole", "borehole_timestamp"),
+        ("Geology", "geology_timestamp")
+    ]:
+        apps.get_model("app", model).objects.update(updated_at=F(created))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='borehole',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='geology',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['updated_at'], name='project_updated_idx'),
+        ),
+        migrations.RunPython(fill_updated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 3.0.3 on 2026-10-18 02:49
+
+from django.db import migrations, models
+
+
+# Existing rows are logged as created so a first sync from 0 finds them
+BACKFILL = [
+    """
+    INSERT INTO app_change (model, object_id, project_id, deleted, timestamp)
+    SELECT 'project', id, id, 0, updated_at FROM app_project ORDER BY id
+    """,
+    """
+    INSERT INTO app_change (model, object_id, project_id, deleted, timestamp)
+    SELECT 'borehole', id, project_id, 0, updated_at FROM app_borehole
+    ORDER BY id
+    """,
+    """
+    INSERT INTO app_change (model, object_id, project_id, deleted, timestamp)
+    SELECT 'geology', app_geology.id, app_borehole.project_id, 0,
+        app_geology.updated_at
+    FROM app_geology
+    INNER JOIN app_borehole ON app_geology.borehole_id = app_borehole.id
+    ORDER BY app_geology.id
+    """,
+    """
+    INSERT INTO app_change (model, object_id, project_id, deleted, timestamp)
+    SELECT 'message', id, project_id, 0, message_date FROM app_message
+    ORDER BY id
+    """
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=12)),
+                ('object_id', models.PositiveIntegerField()),
+                ('project_id', models.PositiveIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['project_id', 'id'], name='change_project_idx'),
+        ),
+        migrations.RunSQL(BACKFILL, migrations.RunSQL.noop),
+    ]
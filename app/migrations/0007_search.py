@@ -0,0 +1,191 @@
+# Generated by Django 3.0.3 on 2026-10-18 03:20
+
+from django.db import migrations
+
+
+# Full text index of geology layers and messages, kept in sync by triggers
+# so rows written with bulk_create and update() are indexed too.
+# Layers use rowid id * 2 and messages id * 2 + 1.
+CREATE = [
+    """
+    CREATE VIRTUAL TABLE app_search USING fts5(
+        text, field_test, reference,
+        kind UNINDEXED, object_id UNINDEXED, project_id UNINDEXED,
+        borehole_id UNINDEXED,
+        tokenize = 'porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER app_search_geology_insert AFTER INSERT ON app_geology
+    BEGIN
+        INSERT INTO app_search (
+            rowid, text, field_test, reference, kind, object_id,
+            project_id, borehole_id
+        )
+        SELECT
+            new.id * 2, new.geology_description,
+            coalesce(new.spt_result, '') || ' ' || new.field_test_details,
+            app_borehole.borehole_reference || ' ' ||
+            app_project.project_reference,
+            'geology', new.id, app_borehole.project_id, new.borehole_id
+        FROM app_borehole
+        INNER JOIN app_project ON app_project.id = app_borehole.project_id
+        WHERE app_borehole.id = new.borehole_id;
+    END
+    """,
+    """
+    CREATE TRIGGER app_search_geology_update AFTER UPDATE OF
+        geology_description, field_test_details, spt_result, borehole_id
+    ON app_geology
+    BEGIN
+        DELETE FROM app_search WHERE rowid = old.id * 2;
+        INSERT INTO app_search (
+            rowid, text, field_test, reference, kind, object_id,
+            project_id, borehole_id
+        )
+        SELECT
+            new.id * 2, new.geology_description,
+            coalesce(new.spt_result, '') || ' ' || new.field_test_details,
+            app_borehole.borehole_reference || ' ' ||
+            app_project.project_reference,
+            'geology', new.id, app_borehole.project_id, new.borehole_id
+        FROM app_borehole
+        INNER JOIN app_project ON app_project.id = app_borehole.project_id
+        WHERE app_borehole.id = new.borehole_id;
+    END
+    """,
+    """
+    CREATE TRIGGER app_search_geology_delete AFTER DELETE ON app_geology
+    BEGIN
+        DELETE FROM app_search WHERE rowid = old.id * 2;
+    END
+    """,
+    """
+    CREATE TRIGGER app_search_message_insert AFTER INSERT ON app_message
+    BEGIN
+        INSERT INTO app_search (
+            rowid, text, field_test, reference, kind, object_id,
+            project_id
+        )
+        SELECT
+            new.id * 2 + 1, new.message, '', project_reference, 'message',
+            new.id, new.project_id
+        FROM app_project WHERE id = new.project_id;
+    END
+    """,
+    """
+    CREATE TRIGGER app_search_message_update AFTER UPDATE OF
+        message, project_id
+    ON app_message
+    BEGIN
+        DELETE FROM app_search WHERE rowid = old.id * 2 + 1;
+        INSERT INTO app_search (
+            rowid, text, field_test, reference, kind, object_id,
+            project_id
+        )
+        SELECT
+            new.id * 2 + 1, new.message, '', project_reference, 'message',
+            new.id, new.project_id
+        FROM app_project WHERE id = new.project_id;
+    END
+    """,
+    """
+    CREATE TRIGGER app_search_message_delete AFTER DELETE ON app_message
+    BEGIN
+        DELETE FROM app_search WHERE rowid = old.id * 2 + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER app_search_borehole_update AFTER UPDATE OF
+        borehole_reference, project_id
+    ON app_borehole
+    WHEN new.borehole_reference IS NOT old.borehole_reference
+        OR new.project_id IS NOT old.project_id
+    BEGIN
+        UPDATE app_search SET
+            reference = new.borehole_reference || ' ' || (
+                SELECT project_reference FROM app_project
+                WHERE id = new.project_id
+            ),
+            project_id = new.project_id
+        WHERE rowid IN (
+            SELECT id * 2 FROM app_geology WHERE borehole_id = new.id
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER app_search_project_update AFTER UPDATE OF
+        project_reference
+    ON app_project
+    WHEN new.project_reference IS NOT old.project_reference
+    BEGIN
+        UPDATE app_search SET
+            reference = (
+                SELECT borehole_reference FROM app_borehole
+                WHERE id = app_search.borehole_id
+            ) || ' ' || new.project_reference
+        WHERE rowid IN (
+            SELECT app_geology.id * 2 FROM app_geology
+            INNER JOIN app_borehole
+                ON app_borehole.id = app_geology.borehole_id
+            WHERE app_borehole.project_id = new.id
+        );
+        UPDATE app_search SET reference = new.project_reference
+        WHERE rowid IN (
+            SELECT id * 2 + 1 FROM app_message WHERE project_id = new.id
+        );
+    END
+    """
+]
+
+DROP = [
+    "DROP TRIGGER app_search_project_update",
+    "DROP TRIGGER app_search_borehole_update",
+    "DROP TRIGGER app_search_message_delete",
+    "DROP TRIGGER app_search_message_update",
+    "DROP TRIGGER app_search_message_insert",
+    "DROP TRIGGER app_search_geology_delete",
+    "DROP TRIGGER app_search_geology_update",
+    "DROP TRIGGER app_search_geology_insert",
+    "DROP TABLE app_search"
+]
+
+# Existing layers and messages
+BACKFILL = [
+    """
+    INSERT INTO app_search (
+        rowid, text, field_test, reference, kind, object_id, project_id,
+        borehole_id
+    )
+    SELECT
+        app_geology.id * 2, geology_description,
+        coalesce(spt_result, '') || ' ' || field_test_details,
+        borehole_reference || ' ' || project_reference, 'geology',
+        app_geology.id, app_borehole.project_id, borehole_id
+    FROM app_geology
+    INNER JOIN app_borehole ON app_borehole.id = app_geology.borehole_id
+    INNER JOIN app_project ON app_project.id = app_borehole.project_id
+    """,
+    """
+    INSERT INTO app_search (
+        rowid, text, field_test, reference, kind, object_id, project_id
+    )
+    SELECT
+        app_message.id * 2 + 1, message, '', project_reference, 'message',
+        app_message.id, project_id
+    FROM app_message
+    INNER JOIN app_project ON app_project.id = app_message.project_id
+    """
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_batch'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE, DROP),
+        migrations.RunSQL(BACKFILL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 3.0.3 on 2026-10-18 03:34
+
+from django.db import migrations
+
+
+# R*Tree index of borehole positions, kept in sync by triggers so rows
+# written with bulk_create and update() are indexed too.
+# Boreholes without both coordinates are left out.
+CREATE = [
+    """
+    CREATE VIRTUAL TABLE app_borehole_position USING rtree(
+        id, min_easting, max_easting, min_northing, max_northing
+    )
+    """,
+    """
+    CREATE TRIGGER app_borehole_position_insert AFTER INSERT ON app_borehole
+    WHEN new.borehole_easting IS NOT NULL
+        AND new.borehole_northing IS NOT NULL
+    BEGIN
+        INSERT INTO app_borehole_position VALUES (
+            new.id, new.borehole_easting, new.borehole_easting,
+            new.borehole_northing, new.borehole_northing
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER app_borehole_position_update AFTER UPDATE OF
+        borehole_easting, borehole_northing
+    ON app_borehole
+    WHEN new.borehole_easting IS NOT old.borehole_easting
+        OR new.borehole_northing IS NOT old.borehole_northing
+    BEGIN
+        DELETE FROM app_borehole_position WHERE id = old.id;
+        INSERT INTO app_borehole_position
+        SELECT
+            new.id, new.borehole_easting, new.borehole_easting,
+            new.borehole_northing, new.borehole_northing
+        WHERE new.borehole_easting IS NOT NULL
+            AND new.borehole_northing IS NOT NULL;
+    END
+    """,
+    """
+    CREATE TRIGGER app_borehole_position_delete AFTER DELETE ON app_borehole
+    BEGIN
+        DELETE FROM app_borehole_position WHERE id = old.id;
+    END
+    """
+]
+
+DROP = [
+    "DROP TRIGGER app_borehole_position_delete",
+    "DROP TRIGGER app_borehole_position_update",
+    "DROP TRIGGER app_borehole_position_insert",
+    "DROP TABLE app_borehole_position"
+]
+
+BACKFILL = [
+    """
+    INSERT INTO app_borehole_position
+    SELECT
+        id, borehole_easting, borehole_easting, borehole_northing,
+        borehole_northing
+    FROM app_borehole
+    WHERE borehole_easting IS NOT NULL AND borehole_northing IS NOT NULL
+    """
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_search'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE, DROP),
+        migrations.RunSQL(BACKFILL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,135 @@
+# Generated by Django 3.0.3 on 2026-10-18 03:41
+
+from django.db import migrations, models
+
+
+# Grid levels and their cell size, the map spans coordinates -1000 to 1000
+LEVELS = 17
+SIZE = 2000
+
+# Adds a borehole to its cell at every level, sample keeps 3 ids
+ADD = """
+    INSERT INTO app_cluster (
+        project_id, level, x, y, count, sum_easting, sum_northing, sample
+    )
+    SELECT
+        {row}.project_id, level,
+        CAST(({row}.borehole_easting + 1000) / size AS INTEGER),
+        CAST(({row}.borehole_northing + 1000) / size AS INTEGER),
+        1, {row}.borehole_easting, {row}.borehole_northing, {row}.id
+    FROM {source}
+    WHERE {row}.borehole_easting IS NOT NULL
+        AND {row}.borehole_northing IS NOT NULL
+    ON CONFLICT (project_id, level, x, y) DO UPDATE SET
+        count = count + 1,
+        sum_easting = sum_easting + excluded.sum_easting,
+        sum_northing = sum_northing + excluded.sum_northing,
+        sample = CASE
+            WHEN sample = '' THEN excluded.sample
+            WHEN length(sample) - length(replace(sample, ',', '')) < 2
+                THEN sample || ',' || excluded.sample
+            ELSE sample
+        END;
+"""
+
+# Removes a borehole from its cells and drops cells left empty
+REMOVE = """
+    UPDATE app_cluster SET
+        count = count - 1,
+        sum_easting = sum_easting - old.borehole_easting,
+        sum_northing = sum_northing - old.borehole_northing,
+        sample = trim(
+            replace(',' || sample || ',', ',' || old.id || ',', ','), ','
+        )
+    WHERE project_id = old.project_id AND (level, x, y) IN (
+        SELECT
+            level,
+            CAST((old.borehole_easting + 1000) / size AS INTEGER),
+            CAST((old.borehole_northing + 1000) / size AS INTEGER)
+        FROM app_cluster_level
+    );
+    DELETE FROM app_cluster
+    WHERE project_id = old.project_id AND count = 0 AND (level, x, y) IN (
+        SELECT
+            level,
+            CAST((old.borehole_easting + 1000) / size AS INTEGER),
+            CAST((old.borehole_northing + 1000) / size AS INTEGER)
+        FROM app_cluster_level
+    );
+"""
+
+CREATE = [
+    "CREATE TABLE app_cluster_level (level INTEGER PRIMARY KEY, size REAL)",
+    "INSERT INTO app_cluster_level VALUES " + ", ".join(
+        f"({level}, {SIZE / 2 ** level})" for level in range(LEVELS)
+    ),
+    f"""
+    CREATE TRIGGER app_cluster_insert AFTER INSERT ON app_borehole
+    BEGIN
+        {ADD.format(row="new", source="app_cluster_level")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER app_cluster_update AFTER UPDATE OF
+        borehole_easting, borehole_northing, project_id
+    ON app_borehole
+    WHEN new.borehole_easting IS NOT old.borehole_easting
+        OR new.borehole_northing IS NOT old.borehole_northing
+        OR new.project_id IS NOT old.project_id
+    BEGIN
+        {REMOVE}
+        {ADD.format(row="new", source="app_cluster_level")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER app_cluster_delete AFTER DELETE ON app_borehole
+    BEGIN
+        {REMOVE}
+    END
+    """
+]
+
+DROP = [
+    "DROP TRIGGER app_cluster_delete",
+    "DROP TRIGGER app_cluster_update",
+    "DROP TRIGGER app_cluster_insert",
+    "DROP TABLE app_cluster_level"
+]
+
+BACKFILL = [
+    ADD.format(row="app_borehole", source="app_borehole, app_cluster_level")
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_positions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Cluster',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('project_id', models.PositiveIntegerField()),
+                ('level', models.PositiveSmallIntegerField()),
+                ('x', models.IntegerField()),
+                ('y', models.IntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('sum_easting', models.FloatField(default=0)),
+                ('sum_northing', models.FloatField(default=0)),
+                ('sample', models.CharField(blank=True, max_length=64)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='cluster',
+            index=models.Index(fields=['level', 'x', 'y'], name='cluster_cell_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='cluster',
+            constraint=models.UniqueConstraint(fields=('project_id', 'level', 'x', 'y'), name='cluster_cell_unique'),
+        ),
+        migrations.RunSQL(CREATE, DROP),
+        migrations.RunSQL(BACKFILL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 3.0.3 on 2026-10-18 04:02
+
+from django.db import migrations
+
+
+# R*Tree index of geology layers by project, depth and elevation, kept in
+# sync by triggers so rows written with bulk_create and update() are
+# indexed too. The project is a dimension of its own so queries only read
+# the layers of one project, and elevations follow the ground level of
+# the borehole.
+INDEX = """
+    INSERT INTO app_geology_interval
+    SELECT
+        {row}.id, app_borehole.project_id, app_borehole.project_id,
+        min({row}.start_depth, {row}.end_depth),
+        max({row}.start_depth, {row}.end_depth),
+        app_borehole.ground_level - max({row}.start_depth, {row}.end_depth),
+        app_borehole.ground_level - min({row}.start_depth, {row}.end_depth)
+    FROM {source};
+"""
+
+# Layers of a borehole, as a source for INDEX
+LAYERS = """
+    app_geology INNER JOIN app_borehole
+    ON app_borehole.id = app_geology.borehole_id
+"""
+
+CREATE = [
+    """
+    CREATE VIRTUAL TABLE app_geology_interval USING rtree(
+        id, min_project, max_project, min_depth, max_depth,
+        min_elevation, max_elevation
+    )
+    """,
+    f"""
+    CREATE TRIGGER app_geology_interval_insert AFTER INSERT ON app_geology
+    BEGIN
+        {INDEX.format(
+            row="new", source="app_borehole WHERE id = new.borehole_id")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER app_geology_interval_update AFTER UPDATE OF
+        start_depth, end_depth, borehole_id
+    ON app_geology
+    BEGIN
+        DELETE FROM app_geology_interval WHERE id = old.id;
+        {INDEX.format(
+            row="new", source="app_borehole WHERE id = new.borehole_id")}
+    END
+    """,
+    """
+    CREATE TRIGGER app_geology_interval_delete AFTER DELETE ON app_geology
+    BEGIN
+        DELETE FROM app_geology_interval WHERE id = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER app_geology_interval_borehole AFTER UPDATE OF
+        ground_level, project_id
+    ON app_borehole
+    WHEN new.ground_level IS NOT old.ground_level
+        OR new.project_id IS NOT old.project_id
+    BEGIN
+        DELETE FROM app_geology_interval WHERE id IN (
+            SELECT id FROM app_geology WHERE borehole_id = new.id
+        );
+        {INDEX.format(
+            row="app_geology", source=LAYERS + "WHERE app_borehole.id = new.id"
+        )}
+    END
+    """
+]
+
+DROP = [
+    "DROP TRIGGER app_geology_interval_borehole",
+    "DROP TRIGGER app_geology_interval_delete",
+    "DROP TRIGGER app_geology_interval_update",
+    "DROP TRIGGER app_geology_interval_insert",
+    "DROP TABLE app_geology_interval"
+]
+
+BACKFILL = [INDEX.format(row="app_geology", source=LAYERS)]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_clusters'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE, DROP),
+        migrations.RunSQL(BACKFILL, migrations.RunSQL.noop),
+    ]
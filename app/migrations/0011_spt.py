@@ -0,0 +1,65 @@
+# Generated by Django 3.0.3 on 2026-10-18 04:20
+
+from django.db import migrations, models
+
+
+# Columns are added with ALTER TABLE rather than AddField, which on SQLite
+# copies the whole table into a new one and drops the triggers of the
+# search and interval indexes along with the old table.
+# Existing rows are parsed by the parse_spt command.
+ADD = [
+    'ALTER TABLE "app_geology" ADD COLUMN "spt_blows" varchar(55) '
+    "NOT NULL DEFAULT ''",
+    'ALTER TABLE "app_geology" ADD COLUMN "spt_n" smallint unsigned NULL '
+    'CHECK ("spt_n" >= 0)',
+    'ALTER TABLE "app_geology" ADD COLUMN "spt_penetration" smallint '
+    'unsigned NULL CHECK ("spt_penetration" >= 0)',
+    'ALTER TABLE "app_geology" ADD COLUMN "spt_refusal" bool NOT NULL '
+    "DEFAULT 0"
+]
+
+DROP = [
+    'ALTER TABLE "app_geology" DROP COLUMN "spt_refusal"',
+    'ALTER TABLE "app_geology" DROP COLUMN "spt_penetration"',
+    'ALTER TABLE "app_geology" DROP COLUMN "spt_n"',
+    'ALTER TABLE "app_geology" DROP COLUMN "spt_blows"'
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_intervals'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunSQL(ADD, DROP)],
+            state_operations=[
+                migrations.AddField(
+                    model_name='geology',
+                    name='spt_blows',
+                    field=models.CharField(blank=True, default='', max_length=55),
+                ),
+                migrations.AddField(
+                    model_name='geology',
+                    name='spt_n',
+                    field=models.PositiveSmallIntegerField(blank=True, null=True),
+                ),
+                migrations.AddField(
+                    model_name='geology',
+                    name='spt_penetration',
+                    field=models.PositiveSmallIntegerField(blank=True, null=True),
+                ),
+                migrations.AddField(
+                    model_name='geology',
+                    name='spt_refusal',
+                    field=models.BooleanField(default=False),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='geology',
+            index=models.Index(fields=['spt_n'], name='geology_spt_idx'),
+        ),
+    ]
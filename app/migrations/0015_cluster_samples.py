@@ -0,0 +1,100 @@
+# Generated by Django 3.0.3 on 2026-10-18 05:10
+
+from importlib import import_module
+
+from django.db import migrations
+
+from app.clusters import REBUILD
+
+
+clusters = import_module("app.migrations.0009_clusters")
+
+# Removes a borehole from its cells and drops cells left empty. Cells
+# which sampled the borehole take their sample again from the boreholes
+# left in them, found through the position index.
+REMOVE = """
+    UPDATE app_cluster SET
+        count = count - 1,
+        sum_easting = sum_easting - old.borehole_easting,
+        sum_northing = sum_northing - old.borehole_northing,
+        sample = CASE
+            WHEN instr(',' || sample || ',', ',' || old.id || ',') = 0
+                THEN sample
+            ELSE coalesce((
+                SELECT group_concat(id) FROM (
+                    SELECT app_borehole.id
+                    FROM app_cluster_level
+                    INNER JOIN app_borehole_position
+                        ON min_easting <= (app_cluster.x + 1) * size - 1000
+                        AND max_easting >= app_cluster.x * size - 1000
+                        AND min_northing <= (app_cluster.y + 1) * size - 1000
+                        AND max_northing >= app_cluster.y * size - 1000
+                    INNER JOIN app_borehole
+                        ON app_borehole.id = app_borehole_position.id
+                    WHERE app_cluster_level.level = app_cluster.level
+                        AND app_borehole.project_id = old.project_id
+                        AND app_borehole.id != old.id
+                        AND CAST((borehole_easting + 1000) / size AS INTEGER)
+                            = app_cluster.x
+                        AND CAST((borehole_northing + 1000) / size AS INTEGER)
+                            = app_cluster.y
+                    ORDER BY app_borehole.id
+                    LIMIT 3
+                )
+            ), '')
+        END
+    WHERE project_id = old.project_id AND (level, x, y) IN (
+        SELECT
+            level,
+            CAST((old.borehole_easting + 1000) / size AS INTEGER),
+            CAST((old.borehole_northing + 1000) / size AS INTEGER)
+        FROM app_cluster_level
+    );
+    DELETE FROM app_cluster
+    WHERE project_id = old.project_id AND count = 0 AND (level, x, y) IN (
+        SELECT
+            level,
+            CAST((old.borehole_easting + 1000) / size AS INTEGER),
+            CAST((old.borehole_northing + 1000) / size AS INTEGER)
+        FROM app_cluster_level
+    );
+"""
+
+
+def triggers(remove):
+    return [
+        "DROP TRIGGER app_cluster_delete",
+        "DROP TRIGGER app_cluster_update",
+        f"""
+        CREATE TRIGGER app_cluster_update AFTER UPDATE OF
+            borehole_easting, borehole_northing, project_id
+        ON app_borehole
+        WHEN new.borehole_easting IS NOT old.borehole_easting
+            OR new.borehole_northing IS NOT old.borehole_northing
+            OR new.project_id IS NOT old.project_id
+        BEGIN
+            {remove}
+            {clusters.ADD.format(row="new", source="app_cluster_level")}
+        END
+        """,
+        f"""
+        CREATE TRIGGER app_cluster_delete AFTER DELETE ON app_borehole
+        BEGIN
+            {remove}
+        END
+        """
+    ]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_user_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunSQL(triggers(REMOVE), triggers(clusters.REMOVE)),
+
+        # Samples emptied by the old triggers are filled again
+        migrations.RunSQL(REBUILD, migrations.RunSQL.noop),
+    ]
@@ -1,13 +1,25 @@
+import json
+
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+
+from .spt import SPT_FIELDS, parse
 
 
 class User(AbstractUser):
     """
     Standard AbstractUser model from Django.
+    Project and borehole counts are kept up to date by app.signals.
     Also contains serialize() function for returning Json responses.
     """
-    pass
+    project_count = models.PositiveIntegerField(default=0)
+    borehole_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=["updated_at"], name="user_updated_idx")
+        ]
 
     def __str__(self):
         return f"{self.id}: {self.username}"
@@ -16,8 +28,8 @@ class User(AbstractUser):
         return {
             "id": self.id,
             "username": self.username,
-            "projects": self.projects.count(),
-            "boreholes": self.logger.count()
+            "projects": self.project_count,
+            "boreholes": self.borehole_count
         }
 
 
@@ -25,6 +37,7 @@ class Project(models.Model):
     """
     Model contains the details of each project.
     Includes an ImageField for saving sketches.
+    Borehole and message counts are kept up to date by app.signals.
     Also contains serialize() function for returning Json responses.
     """
     lead = models.ForeignKey(
@@ -34,19 +47,40 @@ class Project(models.Model):
     project_reference = models.CharField(max_length=55)
     project_client = models.CharField(max_length=55)
     project_timestamp = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     project_description = models.TextField(max_length=255)
     sketch = models.ImageField(
         upload_to="project_sketch", null=True, blank=True
     )
+    borehole_count = models.PositiveIntegerField(default=0)
+    message_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["project_timestamp", "id"],
+                name="project_timestamp_idx"
+            ),
+            models.Index(
+                fields=["lead", "project_timestamp"],
+                name="project_lead_idx"
+            ),
+            models.Index(fields=["updated_at"], name="project_updated_idx")
+        ]
 
     def __str__(self):
         return f"{self.project_reference}: {self.project_title}"
 
+    def save(self, *args, **kwargs):
+        # Counters are updated by signals within the same transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def serialize(self):
         return {
             "id": self.id,
             "lead": self.lead.username,
-            "lead_id": self.lead.id,
+            "lead_id": self.lead_id,
             "title": self.project_title,
             "ref": self.project_reference,
             "client": self.project_client,
@@ -54,14 +88,15 @@ class Project(models.Model):
                 "%b %d %Y, %I:%M %p"
             ),
             "description": self.project_description,
-            "boreholes": self.borehole.count(),
-            "messages": self.message.count()
+            "boreholes": self.borehole_count,
+            "messages": self.message_count
         }
 
 
 class Borehole(models.Model):
     """
     Model contains the details of each borehole from each project.
+    Layer count and logged depth are kept up to date by app.signals.
     Also contains serialize() function for returning Json responses.
     """
     logger = models.ForeignKey(
@@ -72,6 +107,7 @@ class Borehole(models.Model):
     )
     borehole_reference = models.CharField(max_length=55)
     borehole_timestamp = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     borehole_northing = models.DecimalField(
         max_digits=9, decimal_places=6, null=True, blank=True
     )
@@ -81,15 +117,36 @@ class Borehole(models.Model):
     ground_level = models.DecimalField(max_digits=5, decimal_places=2)
     drilling_equipment = models.CharField(max_length=55)
     borehole_diameter = models.PositiveSmallIntegerField()
+    layer_count = models.PositiveIntegerField(default=0)
+    logged_depth = models.DecimalField(
+        max_digits=5, decimal_places=2, default=0
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["project", "borehole_timestamp", "id"],
+                name="borehole_timestamp_idx"
+            ),
+            models.Index(
+                fields=["logger", "project"],
+                name="borehole_logger_idx"
+            )
+        ]
 
     def __str__(self):
         return f"{self.id} ({self.borehole_reference})"
 
+    def save(self, *args, **kwargs):
+        # Counters are updated by signals within the same transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def serialize(self):
         return {
             "id": self.id,
             "logger": self.logger.username,
-            "logger_id": self.logger.id,
+            "logger_id": self.logger_id,
             "project": self.project.project_title,
             "project_ref": self.project.project_reference,
             "project_client": self.project.project_client,
@@ -102,13 +159,36 @@ class Borehole(models.Model):
             "ground_level": self.ground_level,
             "equipment": self.drilling_equipment,
             "bh_dia": self.borehole_diameter,
+            "layers": self.layer_count,
+            "logged_depth": self.logged_depth
         }
 
 
+class GeologyQuerySet(models.QuerySet):
+    """
+    Parses the SPT results of layers written in bulk, as save() does.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for layer in objs:
+            layer.parse_spt()
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        if "spt_result" in fields:
+            for layer in objs:
+                layer.parse_spt()
+            fields = list(fields) + SPT_FIELDS
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+
 class Geology(models.Model):
     """
     Model contains details of each geology layer from each borehole.
     Also contains serialize() function for returning Json responses.
+    The spt_ columns hold the parsed spt_result and are set on every save.
     """
     borehole = models.ForeignKey(
         "Borehole", on_delete=models.CASCADE, related_name="geology"
@@ -117,18 +197,50 @@ class Geology(models.Model):
     end_depth = models.DecimalField(max_digits=5, decimal_places=2)
     sample_number = models.CharField(max_length=12, null=True, blank=True)
     spt_result = models.CharField(max_length=55, null=True, blank=True)
+    spt_n = models.PositiveSmallIntegerField(null=True, blank=True)
+    spt_blows = models.CharField(max_length=55, blank=True, default="")
+    spt_penetration = models.PositiveSmallIntegerField(null=True, blank=True)
+    spt_refusal = models.BooleanField(default=False)
     field_test_details = models.TextField(max_length=255)
     geology_description = models.TextField(max_length=255)
     geology_timestamp = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = GeologyQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["borehole", "geology_timestamp", "id"],
+                name="geology_timestamp_idx"
+            ),
+            models.Index(fields=["spt_n"], name="geology_spt_idx")
+        ]
 
     def __str__(self):
         return f"{self.id}"
 
+    def save(self, *args, **kwargs):
+        self.parse_spt()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "spt_result" in update_fields:
+            kwargs["update_fields"] = list(update_fields) + SPT_FIELDS
+
+        # Counters are updated by signals within the same transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def parse_spt(self):
+        (
+            self.spt_n, self.spt_blows, self.spt_penetration,
+            self.spt_refusal
+        ) = parse(self.spt_result)
+
     def serialize(self):
         return {
             "id": self.id,
             "borehole": self.borehole.borehole_reference,
-            "borehole_id": self.borehole.id,
+            "borehole_id": self.borehole_id,
             "start_depth": self.start_depth,
             "end_depth": self.end_depth,
             "sample_id": self.sample_number,
@@ -151,15 +263,169 @@ class Message(models.Model):
     message = models.TextField(max_length=255)
     message_date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["project", "message_date", "id"],
+                name="message_date_idx"
+            )
+        ]
+
     def __str__(self):
         return f"Comment {self.id} on Project {self.project.title}"
 
+    def save(self, *args, **kwargs):
+        # Counters are updated by signals within the same transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def serialize(self):
         return {
             "id": self.id,
             "user": self.user.username,
-            "user_id": self.user.id,
-            "project": self.project.id,
+            "user_id": self.user_id,
+            "project": self.project_id,
             "message": self.message,
             "date": self.message_date.strftime("%b %d %Y, %I:%M %p")
         }
+
+
+class Change(models.Model):
+    """
+    Model contains one entry for each create, update or delete of a
+    project, borehole, geology layer or message.
+    Ids form the monotonic sequence used by offline clients to sync.
+    Project ids are plain integers so entries outlive deleted projects.
+    """
+    model = models.CharField(max_length=12)
+    object_id = models.PositiveIntegerField()
+    project_id = models.PositiveIntegerField()
+    deleted = models.BooleanField(default=False)
+    timestamp = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["project_id", "id"], name="change_project_idx"
+            )
+        ]
+
+    def __str__(self):
+        action = "deleted" if self.deleted else "saved"
+        return f"{self.id}: {self.model} {self.object_id} {action}"
+
+
+class Batch(models.Model):
+    """
+    Model contains the response of each batch of changes applied with an
+    idempotency key, so a retried upload is answered from here instead of
+    being applied twice.
+    """
+    user = models.ForeignKey(
+        "User", on_delete=models.CASCADE, related_name="batches"
+    )
+    key = models.CharField(max_length=64)
+    digest = models.CharField(max_length=32)
+    response = models.TextField(blank=True)
+    timestamp = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "key"], name="batch_key_unique"
+            )
+        ]
+
+    def __str__(self):
+        return f"Batch {self.key} by {self.user_id}"
+
+
+class Cluster(models.Model):
+    """
+    Model contains the boreholes of a project in one cell of the map grid
+    at one zoom level, kept up to date by database triggers.
+    Cells at level z are 2 ** z times smaller than the whole map. sample
+    holds the ids of up to 3 of the boreholes, separated by commas.
+    """
+    project_id = models.PositiveIntegerField()
+    level = models.PositiveSmallIntegerField()
+    x = models.IntegerField()
+    y = models.IntegerField()
+    count = models.PositiveIntegerField(default=0)
+    sum_easting = models.FloatField(default=0)
+    sum_northing = models.FloatField(default=0)
+    sample = models.CharField(max_length=64, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["project_id", "level", "x", "y"],
+                name="cluster_cell_unique"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["level", "x", "y"], name="cluster_cell_idx")
+        ]
+
+    def __str__(self):
+        return f"{self.count} at {self.level}/{self.x}/{self.y}"
+
+
+class Job(models.Model):
+    """
+    Model contains each background job, queued by requests and run by the
+    run_jobs command. Jobs can fan out into child jobs and wait for them
+    to finish before running again.
+    Arguments and results are stored as JSON text. A running job holds a
+    lease from claimed_at, after which it is taken back from its worker.
+    """
+    QUEUED = "queued"
+    RUNNING = "running"
+    WAITING = "waiting"
+    DONE = "done"
+    FAILED = "failed"
+    STATUSES = [QUEUED, RUNNING, WAITING, DONE, FAILED]
+
+    kind = models.CharField(max_length=32)
+    arguments = models.TextField(default="{}")
+    user = models.ForeignKey(
+        "User", on_delete=models.CASCADE, null=True, blank=True,
+        related_name="jobs"
+    )
+    parent = models.ForeignKey(
+        "self", on_delete=models.CASCADE, null=True, blank=True,
+        related_name="children"
+    )
+    status = models.CharField(
+        max_length=8, default=QUEUED,
+        choices=[(status, status) for status in STATUSES]
+    )
+    progress = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    result = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "id"], name="job_status_idx")
+        ]
+
+    def __str__(self):
+        return f"{self.kind} job {self.id} {self.status}"
+
+    def serialize(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": self.progress,
+            "total": self.total,
+            "result": json.loads(self.result) if self.result else None,
+            "error": self.error or None,
+            "created": self.created_at.strftime("%b %d %Y, %I:%M %p"),
+            "updated": self.updated_at.strftime("%b %d %Y, %I:%M %p")
+        }
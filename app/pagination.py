@@ -0,0 +1,100 @@
+import json
+import base64
+import binascii
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+# Approximate totals stop counting after this many rows
+TOTAL_LIMIT = 1000
+
+
+class InvalidCursor(Exception):
+    """
+    Raised when a cursor token cannot be decoded.
+    """
+    pass
+
+
+def encode_cursor(timestamp, id, direction):
+    """
+    Packs a (timestamp, id) key and a paging direction into an opaque
+    URL safe token.
+    """
+    data = json.dumps([timestamp.isoformat(), id, direction])
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def decode_cursor(token):
+    """
+    Unpacks a token created by encode_cursor().
+    Returns a tuple of (timestamp, id, direction).
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token.encode()))
+        timestamp, id, direction = data
+        timestamp = parse_datetime(timestamp)
+    except (ValueError, TypeError, binascii.Error):
+        raise InvalidCursor(token)
+    if timestamp is None or not isinstance(id, int) or \
+            direction not in ("next", "prev"):
+        raise InvalidCursor(token)
+    return timestamp, id, direction
+
+
+def cursor_page(queryset, field, token="", size=5, descending=False,
+                total=False):
+    """
+    Keyset pagination over a queryset ordered by (field, id).
+    Every page is a single indexed range query, so fetching a late page
+    costs the same as fetching the first page.
+    Returns a dictionary of the page rows, next/prev tokens and optionally
+    an approximate total capped at TOTAL_LIMIT rows.
+    """
+    direction = "next"
+    if token:
+        timestamp, id, direction = decode_cursor(token)
+
+    # Ordering is flipped when walking backwards from a cursor
+    forwards = direction == "next"
+    ascending = forwards != descending
+    prefix = "" if ascending else "-"
+    rows = queryset.order_by(f"{prefix}{field}", f"{prefix}id")
+
+    # Only rows strictly after the cursor key in the walking direction
+    if token:
+        lookup = "gt" if ascending else "lt"
+        rows = rows.filter(
+            Q(**{f"{field}__{lookup}": timestamp}) |
+            Q(**{field: timestamp, f"id__{lookup}": id})
+        )
+
+    # One extra row tells us whether there is another page
+    rows = list(rows[:size + 1])
+    has_more = len(rows) > size
+    rows = rows[:size]
+    if not forwards:
+        rows.reverse()
+
+    # Work out which directions can still be paged
+    has_next = has_more if forwards else True
+    has_prev = bool(token) if forwards else has_more
+    page = {
+        "rows": rows,
+        "next": None,
+        "prev": None
+    }
+    if rows and has_next:
+        last = rows[-1]
+        page["next"] = encode_cursor(getattr(last, field), last.id, "next")
+    if rows and has_prev:
+        first = rows[0]
+        page["prev"] = encode_cursor(getattr(first, field), first.id, "prev")
+
+    # Counting is bounded so the total never costs a full table scan
+    if total:
+        count = queryset.order_by()[:TOTAL_LIMIT].count()
+        page["total"] = count
+        page["total_exact"] = count < TOTAL_LIMIT
+    return page
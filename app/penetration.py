@@ -0,0 +1,120 @@
+import numpy as np
+
+from .models import Geology
+
+
+# Values of each layer in SPT responses
+SPT_LAYER_FIELDS = [
+    "id", "borehole_id", "borehole", "start_depth", "end_depth", "n_value",
+    "refusal", "description"
+]
+
+# Most layers returned by an SPT filter
+SPT_LIMIT = 5000
+
+# Percentiles of the N values reported by the statistics
+PERCENTILES = [10, 25, 50, 75, 90]
+
+
+def tested(project_id):
+    return Geology.objects.filter(
+        borehole__project_id=project_id, spt_n__isnull=False)
+
+
+def filter_layers(project_id, minimum=None, maximum=None, depth=None,
+                  refusal=None, limit=SPT_LIMIT):
+    """
+    Returns the layers of a project with an N value between minimum and
+    maximum, optionally intersecting a (top, bottom) depth range or only
+    refusals, as compact rows of SPT_LAYER_FIELDS with "truncated" set
+    when there were more than limit.
+    """
+    layers = tested(project_id)
+    if minimum is not None:
+        layers = layers.filter(spt_n__gte=minimum)
+    if maximum is not None:
+        layers = layers.filter(spt_n__lte=maximum)
+    if depth is not None:
+        layers = layers.filter(
+            start_depth__lte=depth[1], end_depth__gte=depth[0])
+    if refusal is not None:
+        layers = layers.filter(spt_refusal=refusal)
+    layers = layers.order_by("borehole_id", "start_depth", "id")
+    rows = list(layers.values_list(
+        "id", "borehole_id", "borehole__borehole_reference", "start_depth",
+        "end_depth", "spt_n", "spt_refusal", "geology_description"
+    )[:limit + 1])
+    return {
+        "fields": SPT_LAYER_FIELDS,
+        "layers": [
+            [id, borehole_id, ref, float(start), float(end), n, refusal, text]
+            for id, borehole_id, ref, start, end, n, refusal, text
+            in rows[:limit]
+        ],
+        "truncated": len(rows) > limit
+    }
+
+
+def summarise(keys, values):
+    """
+    Returns the count, mean and PERCENTILES of values grouped by key, all
+    groups at once on sorted arrays.
+    """
+    order = np.lexsort((values, keys))
+    keys, values = keys[order], values[order]
+    groups, starts, sizes = np.unique(
+        keys, return_index=True, return_counts=True)
+    means = np.add.reduceat(values, starts) / sizes
+
+    # Percentiles by linear interpolation between the sorted values
+    position = (sizes[:, None] - 1) * np.array(PERCENTILES) / 100
+    below = np.floor(position).astype(int)
+    above = np.minimum(below + 1, sizes[:, None] - 1)
+    low = values[starts[:, None] + below]
+    high = values[starts[:, None] + above]
+    percentiles = low + (high - low) * (position - below)
+    return [
+        (key, int(size), round(float(mean), 2), [
+            round(float(value), 2) for value in row
+        ])
+        for key, size, mean, row in zip(groups, sizes, means, percentiles)
+    ]
+
+
+def statistics(project_id, band=1.0):
+    """
+    Returns the distribution of the N values of a project in depth bands
+    of band metres, by the middle of each layer, and for each stratum by
+    description, as counts, means and PERCENTILES.
+    """
+    rows = list(tested(project_id).values_list(
+        "start_depth", "end_depth", "spt_n", "geology_description"))
+    result = {
+        "band": band, "percentiles": PERCENTILES, "count": len(rows),
+        "depth_bands": [], "strata": []
+    }
+    if not rows:
+        return result
+
+    depths = np.array([row[:2] for row in rows], dtype=float)
+    values = np.array([row[2] for row in rows], dtype=float)
+    bands = np.floor(depths.mean(axis=1) / band).astype(int)
+    result["depth_bands"] = [
+        {
+            "top": round(float(key * band), 3),
+            "bottom": round(float((key + 1) * band), 3),
+            "count": count, "mean": mean, "values": row
+        }
+        for key, count, mean, row in summarise(bands, values)
+    ]
+
+    descriptions = [row[3].strip().lower() for row in rows]
+    names, strata = np.unique(descriptions, return_inverse=True)
+    result["strata"] = [
+        {
+            "description": str(names[key]), "count": count, "mean": mean,
+            "values": row
+        }
+        for key, count, mean, row in summarise(strata, values)
+    ]
+    return result
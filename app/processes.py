@@ -0,0 +1,15 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.db import connections
+
+
+def worker_pool(workers):
+    """
+    Returns a pool of worker processes which can use the database.
+    Workers open their own connections, an inherited one must not be
+    shared between processes, so the connections of this process are
+    closed first.
+    """
+    connections.close_all()
+    return ProcessPoolExecutor(workers, initializer=django.setup)
@@ -0,0 +1,140 @@
+import csv
+import io
+import json
+import os
+import zipfile
+from xml.sax.saxutils import escape
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from .jobs import arguments, fan_out
+from .models import Project, Job
+from .penetration import statistics
+from .striplogs import draw, render_borehole
+
+
+# Directory of assembled reports in MEDIA_ROOT
+REPORT_DIR = "reports"
+
+# Columns of the borehole table of a report
+REPORT_COLUMNS = [
+    "Borehole", "Easting", "Northing", "Ground level", "Logged depth",
+    "Layers", "Equipment", "Diameter"
+]
+
+
+def render_log(job):
+    """
+    Renders the strip log of the borehole of a child job of a report.
+    """
+    borehole = arguments(job)["borehole"]
+    return {"borehole": borehole, "log": render_borehole(borehole)}
+
+
+def report(job):
+    """
+    Builds the factual report of a project. The first run fans out one
+    strip log job per borehole, the second puts the logs, the sketch and
+    the summary tables into a zip file in MEDIA_ROOT.
+    """
+    project = Project.objects.get(id=arguments(job)["project"])
+    boreholes = list(project.borehole.order_by("borehole_reference", "id"))
+    if boreholes and not job.children.exists():
+        fan_out(job, [
+            ("strip_log", {"borehole": borehole.id})
+            for borehole in boreholes
+        ])
+        return None
+
+    logs, failed = {}, []
+    for child in job.children.all():
+        if child.status == Job.DONE:
+            result = json.loads(child.result)
+            logs[result["borehole"]] = result["log"]
+        else:
+            failed.append(arguments(child)["borehole"])
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as output:
+        rows = [REPORT_COLUMNS] + [
+            [
+                borehole.borehole_reference, borehole.borehole_easting,
+                borehole.borehole_northing, borehole.ground_level,
+                borehole.logged_depth, borehole.layer_count,
+                borehole.drilling_equipment, borehole.borehole_diameter
+            ] for borehole in boreholes
+        ]
+        table = io.StringIO()
+        csv.writer(table).writerows(rows)
+        output.writestr("boreholes.csv", table.getvalue())
+
+        spt = statistics(project.id)
+        output.writestr("spt.json", json.dumps(spt, indent=2))
+
+        images = []
+        for borehole in boreholes:
+            if logs.get(borehole.id):
+                name = f"logs/{borehole.borehole_reference}_{borehole.id}.png"
+                output.writestr(name, read_log(borehole, logs[borehole.id]))
+                images.append(name)
+        if project.sketch:
+            name = "sketch" + os.path.splitext(project.sketch.name)[1]
+            with project.sketch.open("rb") as sketch:
+                output.writestr(name, sketch.read())
+            images.insert(0, name)
+
+        output.writestr("report.html", page(project, rows, spt, images))
+
+    name = default_storage.save(
+        f"{REPORT_DIR}/{project.id}/report_{job.id}.zip",
+        ContentFile(archive.getvalue())
+    )
+    return {
+        "project": project.id,
+        "file": default_storage.url(name),
+        "boreholes": len(boreholes),
+        "logs": len(logs),
+        "failed": failed
+    }
+
+
+def read_log(borehole, name):
+    """
+    Returns the content of a rendered log, drawing the log again if a
+    newer version of the borehole removed it since.
+    """
+    try:
+        with default_storage.open(name, "rb") as log:
+            return log.read()
+    except FileNotFoundError:
+        return draw(borehole, "png")
+
+
+def page(project, rows, spt, images):
+    """
+    Returns the HTML page of a report showing its tables and images.
+    """
+    def table(rows):
+        return "<table>" + "".join(
+            "<tr>" + "".join(
+                f"<td>{escape(str(value))}</td>" for value in row
+            ) + "</tr>" for row in rows
+        ) + "</table>"
+
+    strata = [["Stratum", "Tests", "Mean N"] + [
+        f"P{percentile}" for percentile in spt["percentiles"]
+    ]] + [
+        [row["description"], row["count"], row["mean"]] + row["values"]
+        for row in spt["strata"]
+    ]
+    return "\n".join([
+        "<!DOCTYPE html>",
+        f"<title>{escape(project.project_reference)} factual report</title>",
+        f"<h1>{escape(project.project_title)}</h1>",
+        f"<p>{escape(project.project_client)}: "
+        f"{escape(project.project_description)}</p>",
+        "<h2>Boreholes</h2>", table(rows),
+        "<h2>SPT results</h2>", table(strata),
+        "<h2>Logs</h2>"
+    ] + [f'<img src="{escape(name)}">' for name in images])
@@ -0,0 +1,105 @@
+from django.db import connection, transaction
+
+
+# Results per page of a search
+SEARCH_PAGE_SIZE = 20
+
+# Statements refilling the full text index from the tables it covers
+REBUILD = [
+    "DELETE FROM app_search",
+    """
+    INSERT INTO app_search (
+        rowid, text, field_test, reference, kind, object_id, project_id,
+        borehole_id
+    )
+    SELECT
+        app_geology.id * 2, geology_description,
+        coalesce(spt_result, '') || ' ' || field_test_details,
+        borehole_reference || ' ' || project_reference, 'geology',
+        app_geology.id, app_borehole.project_id, borehole_id
+    FROM app_geology
+    INNER JOIN app_borehole ON app_borehole.id = app_geology.borehole_id
+    INNER JOIN app_project ON app_project.id = app_borehole.project_id
+    """,
+    """
+    INSERT INTO app_search (
+        rowid, text, field_test, reference, kind, object_id, project_id
+    )
+    SELECT
+        app_message.id * 2 + 1, message, '', project_reference, 'message',
+        app_message.id, project_id
+    FROM app_message
+    INNER JOIN app_project ON app_project.id = app_message.project_id
+    """,
+    "INSERT INTO app_search (app_search) VALUES ('optimize')"
+]
+
+
+def rebuild():
+    """
+    Refills the full text index. Only needed if it was changed by hand,
+    the database triggers keep it in sync with every write.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        for statement in REBUILD:
+            cursor.execute(statement)
+
+
+def match_query(text):
+    """
+    Turns user input into an FTS5 query matching rows which contain every
+    word. Words are quoted so FTS5 operators are taken literally, except
+    a trailing * which matches words starting with the rest.
+    """
+    terms = []
+    for word in text.split():
+        prefix = word.endswith("*") and len(word) > 1
+        word = word.rstrip("*").replace('"', '""')
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+def find(text, project_id=None, user_id=None, page=1,
+           size=SEARCH_PAGE_SIZE):
+    """
+    Returns a page of the geology layers and messages matching text, best
+    matches first, with a snippet of the matching text.
+    Results can be limited to a project, or to the projects a user leads
+    or logs boreholes in.
+    """
+    query = match_query(text)
+    if not query:
+        return {"results": [], "has_next": False}
+
+    sql = """
+        SELECT
+            kind, object_id, project_id, borehole_id,
+            snippet(app_search, -1, '[', ']', '...', 12)
+        FROM app_search
+        WHERE app_search MATCH %s
+    """
+    params = [query]
+    if project_id is not None:
+        sql += " AND project_id = %s"
+        params.append(project_id)
+    if user_id is not None:
+        sql += """
+            AND project_id IN (
+                SELECT id FROM app_project WHERE lead_id = %s
+                UNION
+                SELECT project_id FROM app_borehole WHERE logger_id = %s
+            )
+        """
+        params += [user_id, user_id]
+    sql += " ORDER BY rank LIMIT %s OFFSET %s"
+    params += [size + 1, (page - 1) * size]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    keys = ["kind", "id", "project_id", "borehole_id", "snippet"]
+    return {
+        "results": [dict(zip(keys, row)) for row in rows[:size]],
+        "has_next": len(rows) > size
+    }
@@ -0,0 +1,127 @@
+import numpy as np
+
+from .models import Borehole, Geology
+from .spatial import box
+
+
+# Most vertices of a section line
+VERTEX_LIMIT = 100
+
+# Most boreholes drawn on a section
+SECTION_LIMIT = 500
+
+# Values of each borehole in section responses
+SECTION_FIELDS = ["id", "ref", "chainage", "offset", "ground_level"]
+
+
+def locate(points, line):
+    """
+    Projects points onto a polyline, all points and segments at once.
+    Returns the chainage along the line of the closest point of the line
+    to each point, and the distance to it, negative on the right.
+    """
+    start, end = line[:-1], line[1:]
+    segment = end - start
+    length = np.hypot(segment[:, 0], segment[:, 1])
+    chainage = np.concatenate(([0.0], np.cumsum(length)))[:-1]
+
+    # Position of each point along each segment as a fraction, points
+    # x segments, clipped to the segment ends
+    relative = points[:, None, :] - start[None, :, :]
+    squared = np.maximum(length ** 2, np.finfo(float).tiny)
+    along = np.clip(
+        (relative * segment[None, :, :]).sum(axis=2) / squared, 0, 1)
+    gap = relative - along[:, :, None] * segment[None, :, :]
+    distance = np.hypot(gap[:, :, 0], gap[:, :, 1])
+
+    closest = distance.argmin(axis=1)
+    rows = np.arange(len(points))
+    side = np.sign(
+        segment[closest, 0] * relative[rows, closest, 1] -
+        segment[closest, 1] * relative[rows, closest, 0]
+    )
+    side[side == 0] = 1
+    return (
+        chainage[closest] + along[rows, closest] * length[closest],
+        distance[rows, closest] * side
+    )
+
+
+def section(project_id, line, buffer):
+    """
+    Returns the section through the boreholes of a project within buffer
+    of a polyline of (easting, northing) vertices.
+    Boreholes are placed at their chainage along the line and their
+    layers converted to elevations and grouped by description, each
+    stratum as arrays of borehole index, chainage, top and bottom ready
+    to be plotted.
+    """
+    line = np.asarray(line, dtype=float)
+    low, high = line.min(axis=0) - buffer, line.max(axis=0) + buffer
+    rows = box(low[0], low[1], high[0], high[1], project_id)
+    length = round(float(np.hypot(*np.diff(line, axis=0).T).sum()), 3)
+    empty = {
+        "length": length, "fields": SECTION_FIELDS, "boreholes": [],
+        "strata": [], "truncated": False
+    }
+    if not rows:
+        return empty
+
+    # Boreholes inside the buffer, ordered along the line
+    ids = np.array([row[0] for row in rows])
+    points = np.array([row[3:5] for row in rows], dtype=float)
+    chainage, offset = locate(points, line)
+    inside = np.flatnonzero(np.abs(offset) <= buffer)
+    inside = inside[np.lexsort((ids[inside], chainage[inside]))]
+    truncated = len(inside) > SECTION_LIMIT
+    inside = inside[:SECTION_LIMIT]
+    if not len(inside):
+        return empty
+
+    ground = dict(Borehole.objects.filter(
+        id__in=ids[inside].tolist()).values_list("id", "ground_level"))
+    levels = np.array([float(ground[id]) for id in ids[inside]])
+    index = {id: n for n, id in enumerate(ids[inside].tolist())}
+
+    layers = list(Geology.objects.filter(
+        borehole_id__in=index
+    ).order_by("borehole_id", "start_depth", "id").values_list(
+        "borehole_id", "start_depth", "end_depth", "geology_description"
+    ))
+    strata = []
+    if layers:
+        borehole = np.array([index[layer[0]] for layer in layers])
+        depths = np.array([layer[1:3] for layer in layers], dtype=float)
+        names, group = np.unique(
+            [layer[3].strip().lower() for layer in layers],
+            return_inverse=True
+        )
+        top = np.round(levels[borehole] - depths.min(axis=1), 2)
+        bottom = np.round(levels[borehole] - depths.max(axis=1), 2)
+        at = np.round(chainage[inside][borehole], 3)
+
+        # Each stratum takes the description of its first layer
+        order = np.argsort(group, kind="stable")
+        ends = np.cumsum(np.bincount(group, minlength=len(names)))
+        for members in np.split(order, ends[:-1]):
+            strata.append({
+                "description": layers[members[0]][3],
+                "borehole": borehole[members].tolist(),
+                "chainage": at[members].tolist(),
+                "top": top[members].tolist(),
+                "bottom": bottom[members].tolist()
+            })
+
+    return {
+        "length": length,
+        "fields": SECTION_FIELDS,
+        "boreholes": [
+            [
+                int(ids[n]), rows[n][2], round(float(chainage[n]), 3),
+                round(float(offset[n]), 3), float(levels[i])
+            ]
+            for i, n in enumerate(inside)
+        ],
+        "strata": strata,
+        "truncated": truncated
+    }
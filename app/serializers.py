@@ -0,0 +1,98 @@
+from django.db.models import Prefetch, QuerySet, prefetch_related_objects
+
+from .models import Geology
+from .timing import timed
+
+
+def _select_related(objects, *fields):
+    """
+    Joins related rows into the query when given a queryset.
+    Returns a list so callers can iterate over the rows more than once.
+    """
+    if isinstance(objects, QuerySet):
+        objects = objects.select_related(*fields)
+    return list(objects)
+
+
+@timed("serialize")
+def serialize_users(users):
+    """
+    Serializes a collection of users.
+    Project and borehole counts are read from the counter columns.
+    """
+    return [user.serialize() for user in users]
+
+
+@timed("serialize")
+def serialize_projects(projects):
+    """
+    Serializes a collection of projects with their lead joined into the
+    same query. Borehole and message counts are read from the counter
+    columns.
+    """
+    projects = _select_related(projects, "lead")
+    return [project.serialize() for project in projects]
+
+
+@timed("serialize")
+def serialize_boreholes(boreholes):
+    """
+    Serializes a collection of boreholes with their logger and project
+    joined into the same query.
+    """
+    boreholes = _select_related(boreholes, "logger", "project")
+    return [borehole.serialize() for borehole in boreholes]
+
+
+@timed("serialize")
+def serialize_boreholes_with_geology(boreholes):
+    """
+    Serializes a collection of boreholes with all of their geology layers
+    nested under "geology". The layers of every borehole are fetched in a
+    single query.
+    """
+    boreholes = _select_related(boreholes, "logger", "project")
+    layers = Geology.objects.order_by("geology_timestamp", "id")
+    prefetch_related_objects(boreholes, Prefetch("geology", queryset=layers))
+
+    serialized = []
+    for borehole in boreholes:
+        data = borehole.serialize()
+        data["geology"] = [
+            layer.serialize() for layer in borehole.geology.all()
+        ]
+        serialized.append(data)
+    return serialized
+
+
+def select_fields(rows, fields):
+    """
+    Keeps only the keys in fields from each serialized row.
+    Returns rows unchanged when fields is empty.
+    """
+    if not fields:
+        return rows
+    return [
+        {key: value for key, value in row.items() if key in fields}
+        for row in rows
+    ]
+
+
+@timed("serialize")
+def serialize_geology(layers):
+    """
+    Serializes a collection of geology layers with their borehole joined
+    into the same query.
+    """
+    layers = _select_related(layers, "borehole")
+    return [layer.serialize() for layer in layers]
+
+
+@timed("serialize")
+def serialize_messages(messages):
+    """
+    Serializes a collection of messages with their author joined into the
+    same query.
+    """
+    messages = _select_related(messages, "user")
+    return [message.serialize() for message in messages]
@@ -0,0 +1,231 @@
+import threading
+
+from django.db.models import F, Max
+from django.db.models.signals import (
+    pre_save, post_save, pre_delete, post_delete
+)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import invalidate
+from .models import User, Project, Borehole, Geology, Message
+from .sync import record
+
+
+# Projects and boreholes being deleted, rows deleted along with them need
+# no counter updates or change log entries of their own
+_deleting = threading.local()
+
+
+def deleting(model):
+    if not hasattr(_deleting, "ids"):
+        _deleting.ids = {Project: set(), Borehole: set()}
+    return _deleting.ids[model]
+
+
+def deleting_boreholes():
+    return deleting(Borehole)
+
+
+def touch(model):
+    """
+    Returns the update of updated_at for models which track it.
+    Counters are part of the serialized row, so changing them counts as
+    a change of the row for conditional requests.
+    """
+    if model in (User, Project, Borehole):
+        return {"updated_at": timezone.now()}
+    return {}
+
+
+def add(model, id, amount, *fields):
+    """
+    Adds amount to counter fields of a single row in one UPDATE statement.
+    """
+    model.objects.filter(id=id).update(**{
+        field: F(field) + amount for field in fields
+    }, **touch(model))
+
+
+# Field of the user counted by each user counter of projects and boreholes
+OWNERS = {Project: "lead_id", Borehole: "logger_id"}
+
+
+@receiver(pre_save, sender=Project)
+@receiver(pre_save, sender=Borehole)
+def owner_saving(sender, instance, raw=False, **kwargs):
+    """
+    Remembers the stored owner of a row being updated, so the counters of
+    both users can follow a reassignment.
+    """
+    instance._stored_owner = None
+    if not raw and not instance._state.adding:
+        instance._stored_owner = sender.objects.filter(
+            id=instance.id).values_list(OWNERS[sender], flat=True).first()
+
+
+def reassigned(instance, counter):
+    previous = getattr(instance, "_stored_owner", None)
+    owner = getattr(instance, OWNERS[type(instance)])
+    if previous is not None and previous != owner:
+        add(User, previous, -1, counter)
+        add(User, owner, 1, counter)
+
+
+def update_logged_depth(borehole_id):
+    """
+    Sets the logged depth of a borehole to the bottom of its deepest layer.
+    """
+    depth = Geology.objects.filter(borehole_id=borehole_id).aggregate(
+        depth=Max("end_depth"))["depth"]
+    Borehole.objects.filter(id=borehole_id).update(
+        logged_depth=depth or 0, **touch(Borehole))
+
+
+@receiver(post_save, sender=Project)
+def project_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        add(User, instance.lead_id, 1, "project_count")
+    elif not raw:
+        reassigned(instance, "project_count")
+
+
+@receiver(pre_delete, sender=Project)
+def project_deleting(sender, instance, **kwargs):
+    deleting(Project).add(instance.id)
+
+
+@receiver(post_delete, sender=Project)
+def project_deleted(sender, instance, **kwargs):
+    deleting(Project).discard(instance.id)
+    add(User, instance.lead_id, -1, "project_count")
+
+
+@receiver(post_save, sender=Borehole)
+def borehole_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        add(Project, instance.project_id, 1, "borehole_count")
+        add(User, instance.logger_id, 1, "borehole_count")
+    elif not raw:
+        reassigned(instance, "borehole_count")
+
+
+@receiver(pre_delete, sender=Borehole)
+def borehole_deleting(sender, instance, **kwargs):
+    deleting_boreholes().add(instance.id)
+
+
+@receiver(post_delete, sender=Borehole)
+def borehole_deleted(sender, instance, **kwargs):
+    deleting_boreholes().discard(instance.id)
+    add(Project, instance.project_id, -1, "borehole_count")
+    add(User, instance.logger_id, -1, "borehole_count")
+
+
+@receiver(post_save, sender=Geology)
+def geology_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        add(Borehole, instance.borehole_id, 1, "layer_count")
+    update_logged_depth(instance.borehole_id)
+
+
+@receiver(post_delete, sender=Geology)
+def geology_deleted(sender, instance, **kwargs):
+    if instance.borehole_id in deleting_boreholes():
+        return
+    add(Borehole, instance.borehole_id, -1, "layer_count")
+    update_logged_depth(instance.borehole_id)
+
+
+@receiver(post_save, sender=Message)
+def message_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        add(Project, instance.project_id, 1, "message_count")
+
+
+@receiver(post_delete, sender=Message)
+def message_deleted(sender, instance, **kwargs):
+    add(Project, instance.project_id, -1, "message_count")
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def project_changed(sender, instance, **kwargs):
+    # Boreholes are serialized with their project's details
+    boreholes = Borehole.objects.filter(project_id=instance.id)
+    invalidate("projects", f"project:{instance.id}", *(
+        f"borehole:{id}" for id in boreholes.values_list("id", flat=True)
+    ))
+
+
+@receiver(post_save, sender=Borehole)
+@receiver(post_delete, sender=Borehole)
+def borehole_changed(sender, instance, **kwargs):
+    invalidate(
+        "projects", f"project:{instance.project_id}",
+        f"borehole:{instance.id}"
+    )
+
+
+@receiver(post_save, sender=Geology)
+@receiver(post_delete, sender=Geology)
+def geology_changed(sender, instance, **kwargs):
+    if instance.borehole_id in deleting_boreholes():
+        return
+    invalidate(
+        f"project:{instance.borehole.project_id}",
+        f"borehole:{instance.borehole_id}", f"layer:{instance.id}"
+    )
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+def message_changed(sender, instance, **kwargs):
+    invalidate("projects", f"project:{instance.project_id}")
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def project_logged(sender, instance, signal, raw=False, **kwargs):
+    if not raw:
+        record(
+            "project", instance.id, instance.id, signal is post_delete)
+
+
+@receiver(post_save, sender=Borehole)
+@receiver(post_delete, sender=Borehole)
+def borehole_logged(sender, instance, signal, raw=False, **kwargs):
+    if raw or instance.project_id in deleting(Project):
+        return
+    record(
+        "borehole", instance.id, instance.project_id, signal is post_delete)
+
+    # The project's borehole count changed
+    if signal is post_delete or kwargs.get("created"):
+        record("project", instance.project_id, instance.project_id)
+
+
+@receiver(post_save, sender=Geology)
+@receiver(post_delete, sender=Geology)
+def geology_logged(sender, instance, signal, raw=False, **kwargs):
+    if raw or instance.borehole_id in deleting(Borehole):
+        return
+    project_id = instance.borehole.project_id
+    record("geology", instance.id, project_id, signal is post_delete)
+
+    # The borehole's layer count or logged depth may have changed
+    record("borehole", instance.borehole_id, project_id)
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+def message_logged(sender, instance, signal, raw=False, **kwargs):
+    if raw or instance.project_id in deleting(Project):
+        return
+    record(
+        "message", instance.id, instance.project_id, signal is post_delete)
+
+    # The project's message count changed
+    record("project", instance.project_id, instance.project_id)
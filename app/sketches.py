@@ -0,0 +1,138 @@
+import hashlib
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.utils import timezone
+from PIL import Image
+
+from .jobs import enqueue
+from .models import Project, Job
+
+
+# Directory of sketches in MEDIA_ROOT, as set by Project.sketch
+SKETCH_DIR = "project_sketch"
+
+# Image types accepted as sketches and their file extensions
+SKETCH_TYPES = {
+    "image/png": "png", "image/jpeg": "jpg", "image/gif": "gif",
+    "image/webp": "webp"
+}
+
+# Format Pillow reads from a sketch of each image type
+IMAGE_FORMATS = {
+    "image/png": "PNG", "image/jpeg": "JPEG", "image/gif": "GIF",
+    "image/webp": "WEBP"
+}
+
+# Errors Pillow raises for files which are not valid images
+IMAGE_ERRORS = (OSError, SyntaxError, ValueError, Image.DecompressionBombError)
+
+# Bytes read from an upload at a time
+CHUNK_SIZE = 64 * 1024
+
+# Unreferenced sketches younger than this may be about to be referenced
+# by an upload in progress, so they are not collected yet
+COLLECT_AFTER = timedelta(hours=1)
+
+
+class InvalidSketch(Exception):
+    """
+    Raised when an upload is not a valid sketch, with a message for the
+    client.
+    """
+
+
+def store(chunks, content_type):
+    """
+    Writes the chunks of an uploaded sketch to a temporary file while
+    hashing them, then moves it into storage named by its SHA-256 hash so
+    identical sketches are stored once. Uploads larger than
+    QLOG_SKETCH_MAX_BYTES are rejected before they are read to the end,
+    and uploads which are not images of their content type before they
+    are stored.
+    Returns the name in storage and the size of the sketch.
+    """
+    if content_type not in SKETCH_TYPES:
+        raise InvalidSketch("Unknown image type.")
+    limit = getattr(settings, "QLOG_SKETCH_MAX_BYTES", 10 * 1024 * 1024)
+
+    digest, size = hashlib.sha256(), 0
+    upload = TemporaryUploadedFile("sketch", content_type, 0, None)
+    try:
+        for chunk in chunks:
+            size += len(chunk)
+            if size > limit:
+                raise InvalidSketch("Sketch too large.")
+            digest.update(chunk)
+            upload.write(chunk)
+        if not size:
+            raise InvalidSketch("Sketch is empty.")
+        verify(upload, content_type)
+
+        extension = SKETCH_TYPES[content_type]
+        name = f"{SKETCH_DIR}/{digest.hexdigest()}.{extension}"
+        if default_storage.exists(name):
+            # Reused files count as new so they are not collected
+            try:
+                os.utime(default_storage.path(name))
+            except NotImplementedError:
+                pass
+            return name, size
+        upload.seek(0)
+        upload.size = size
+        return default_storage.save(name, upload), size
+    finally:
+        upload.close()
+
+
+def verify(upload, content_type):
+    """
+    Checks an upload is an image of its content type with Pillow, which
+    reads its headers and structure without decoding the pixels.
+    """
+    upload.seek(0)
+    try:
+        with Image.open(upload) as image:
+            found = image.format
+            image.verify()
+    except IMAGE_ERRORS:
+        raise InvalidSketch("Sketch is not a valid image.")
+    if found != IMAGE_FORMATS[content_type]:
+        raise InvalidSketch("Sketch does not match its image type.")
+
+
+def replace(project, name):
+    """
+    Points a project at a stored sketch with a single update of its row
+    and queues the collection of the sketch it replaced.
+    """
+    previous = project.sketch.name
+    project.sketch = name
+    project.save(update_fields=["sketch", "updated_at"])
+    if previous and previous != name:
+        queued = Job.objects.filter(
+            kind="collect_sketches", status=Job.QUEUED).exists()
+        if not queued:
+            enqueue("collect_sketches")
+
+
+def collect(job):
+    """
+    Deletes the sketches no project points at any more, run as a job so
+    uploads do not wait for it.
+    """
+    referenced = set(Project.objects.exclude(sketch="").exclude(
+        sketch=None).values_list("sketch", flat=True))
+    before = timezone.now() - COLLECT_AFTER
+    deleted = 0
+    if default_storage.exists(SKETCH_DIR):
+        for file in default_storage.listdir(SKETCH_DIR)[1]:
+            name = f"{SKETCH_DIR}/{file}"
+            if name not in referenced and \
+                    default_storage.get_modified_time(name) < before:
+                default_storage.delete(name)
+                deleted += 1
+    return {"deleted": deleted}
@@ -0,0 +1,115 @@
+import math
+
+from django.db import connection
+
+from .models import Borehole
+
+
+# Values of each borehole in map responses
+MAP_FIELDS = ["id", "project_id", "ref", "easting", "northing"]
+
+# Most boreholes returned by a bounding box query
+BOX_LIMIT = 5000
+
+# Most boreholes returned by a nearest neighbour query
+NEAREST_LIMIT = 100
+
+# Coordinates are smaller than this in size, as set by their fields
+_coordinate = Borehole._meta.get_field("borehole_easting")
+MAX_COORDINATE = 10 ** (_coordinate.max_digits - _coordinate.decimal_places)
+
+BOX_QUERY = """
+    SELECT
+        app_borehole.id, project_id, borehole_reference, borehole_easting,
+        borehole_northing
+    FROM app_borehole_position
+    INNER JOIN app_borehole ON app_borehole.id = app_borehole_position.id
+    WHERE min_easting <= %s AND max_easting >= %s
+        AND min_northing <= %s AND max_northing >= %s
+        AND borehole_easting BETWEEN %s AND %s
+        AND borehole_northing BETWEEN %s AND %s
+"""
+
+
+def box(min_easting, min_northing, max_easting, max_northing,
+        project_id=None, limit=None):
+    """
+    Returns the map rows of the boreholes inside a box, found through the
+    R*Tree index. The index stores positions as 32 bit floats rounded
+    outwards, so they are compared again with the exact columns.
+    """
+    sql = BOX_QUERY
+    params = [
+        max_easting, min_easting, max_northing, min_northing,
+        min_easting, max_easting, min_northing, max_northing
+    ]
+    if project_id is not None:
+        sql += " AND project_id = %s"
+        params.append(project_id)
+    sql += " ORDER BY app_borehole.id"
+    if limit is not None:
+        sql += " LIMIT %s"
+        params.append(limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [
+            [id, project, ref, float(easting), float(northing)]
+            for id, project, ref, easting, northing in cursor.fetchall()
+        ]
+
+
+def within(min_easting, min_northing, max_easting, max_northing,
+           project_id=None, limit=BOX_LIMIT):
+    """
+    Returns the boreholes inside a box as compact rows of MAP_FIELDS,
+    with "truncated" set when there were more than limit.
+    """
+    rows = box(
+        min_easting, min_northing, max_easting, max_northing, project_id,
+        limit + 1
+    )
+    return {
+        "fields": MAP_FIELDS,
+        "boreholes": rows[:limit],
+        "truncated": len(rows) > limit
+    }
+
+
+def nearest(easting, northing, count=10, project_id=None):
+    """
+    Returns the count boreholes closest to a point as compact rows of
+    MAP_FIELDS and their distance, closest first.
+    Searches boxes around the point which double in size until one holds
+    count boreholes no further away than half its width. Any borehole
+    closer than those would be inside the box, so each search only reads
+    boreholes near the point. Points far outside the possible positions
+    start with a box reaching their edge and the boxes stop growing once
+    they cover all of them, so there are at most about
+    log2(2 * MAX_COORDINATE) searches.
+    """
+    if not (math.isfinite(easting) and math.isfinite(northing)):
+        raise ValueError("Coordinates must be finite.")
+
+    # Half width of a box around the point covering every possible position
+    reach = MAX_COORDINATE + max(abs(easting), abs(northing))
+    radius = max(1.0, reach - 2 * MAX_COORDINATE)
+    while True:
+        rows = box(
+            easting - radius, northing - radius, easting + radius,
+            northing + radius, project_id
+        )
+        found = sorted((
+            row + [round(math.hypot(row[3] - easting, row[4] - northing), 6)]
+            for row in rows
+        ), key=lambda row: (row[-1], row[0]))
+
+        # A box covering every possible position holds every borehole
+        covered = radius >= reach
+        close = [row for row in found if row[-1] <= radius]
+        if len(close) >= count or covered:
+            return {
+                "fields": MAP_FIELDS + ["distance"],
+                "boreholes": (found if covered else close)[:count]
+            }
+        radius = min(radius * 2, reach)
@@ -0,0 +1,72 @@
+import re
+from collections import namedtuple
+
+
+# Parsed values of an SPT result, stored in the columns of SPT_FIELDS
+SPT = namedtuple("SPT", ["n_value", "blows", "penetration", "refusal"])
+SPT_FIELDS = ["spt_n", "spt_blows", "spt_penetration", "spt_refusal"]
+
+# Penetration in mm of the test drive and each of its increments
+TEST_DRIVE = 300
+INCREMENT = 75
+
+# Reported N value, such as N=22
+N_VALUE = re.compile(r"\bN\s*=\s*(\d+)", re.IGNORECASE)
+
+# Blows over part of an increment, such as 50/75mm
+PARTIAL = re.compile(r"(\d+)\s*/\s*(\d+)\s*mm", re.IGNORECASE)
+
+# Blows of each increment, seating drive first, such as 2,3/4,5,6,7
+SEQUENCE = re.compile(
+    r"(\d+(?:\s*,\s*\d+)+)(?:\s*/\s*(\d+(?:\s*,\s*\d+)*))?")
+
+
+def counts(text):
+    return [int(count) for count in text.split(",")]
+
+
+def parse(text):
+    """
+    Parses a free text SPT result such as "2,3/4,5,6,7 N=22" or "50/75mm"
+    into its N value, the blows of each increment, the penetration of the
+    test drive in mm and whether it was stopped short of it.
+    A reported N value is kept, otherwise it is the sum of the test drive
+    blows, which for a refusal is a lower bound. Values which cannot be
+    read are None.
+    """
+    text = text or ""
+
+    # Partial increments are read first, in "N=50/75mm" the N value is
+    # the blows of a refusal rather than of a full test drive
+    partial = PARTIAL.search(text)
+    rest = PARTIAL.sub(" ", text)
+    reported = N_VALUE.search(rest)
+    rest = N_VALUE.sub(" ", rest)
+
+    seating, test = [], []
+    sequence = SEQUENCE.search(rest)
+    if sequence and sequence.group(2) is not None:
+        seating, test = counts(sequence.group(1)), counts(sequence.group(2))
+    elif sequence:
+        test = counts(sequence.group(1))
+        # Six increments include the seating drive
+        if len(test) == 6:
+            seating, test = test[:2], test[2:]
+
+    penetration = None
+    if partial:
+        test.append(int(partial.group(1)))
+        penetration = INCREMENT * (len(test) - 1) + int(partial.group(2))
+    elif len(test) == 4 or reported:
+        penetration = TEST_DRIVE
+
+    n_value = None
+    if reported:
+        n_value = int(reported.group(1))
+    elif partial or len(test) == 4:
+        n_value = sum(test)
+
+    refusal = penetration is not None and penetration < TEST_DRIVE or \
+        "refus" in text.lower()
+    blows = ",".join(str(count) for count in seating + test)
+    return SPT(n_value, blows, penetration, refusal)
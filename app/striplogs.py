@@ -0,0 +1,224 @@
+import io
+import os
+import textwrap
+import zlib
+from xml.sax.saxutils import escape
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageDraw, ImageFont
+
+from .models import Borehole, Geology
+
+
+# Directory of rendered logs in MEDIA_ROOT, one directory per borehole
+LOG_DIR = "strip_logs"
+
+# Content types of the formats logs are rendered in
+LOG_FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+
+# Size of a log in pixels, logs of deep boreholes use a smaller scale
+WIDTH = 800
+MAX_HEIGHT = 4000
+MAX_SCALE = 40
+TOP, BOTTOM = 70, 20
+
+# Left edge of each column of a log
+DEPTH_X, STRATA_X, TEXT_X, SPT_X, RIGHT_X = 10, 70, 170, 580, 780
+
+# N value at the right edge of the SPT column
+SPT_MAX = 60
+
+# Fill colours of strata, picked by their description
+COLOURS = [
+    "#e8d8a8", "#c8b89a", "#a8c8a0", "#d0a080", "#b0b8d0", "#d8c0d8",
+    "#c0d8d8", "#e0c090"
+]
+
+CHARACTER_WIDTH, LINE_HEIGHT = 6, 12
+
+
+def version(borehole):
+    """
+    Returns the version of the log of a borehole, which moves whenever it,
+    any of its layers or its project change, as the log shows the project
+    reference.
+    """
+    updated_at = max(borehole.updated_at, borehole.project.updated_at)
+    return int(updated_at.timestamp() * 1000000)
+
+
+def path(borehole, format):
+    return f"{LOG_DIR}/{borehole.id}/{version(borehole)}.{format}"
+
+
+def layout(borehole, layers):
+    """
+    Returns the size of the log of a borehole and the shapes drawn on it
+    as tuples of a kind and its values, shared by every format.
+    """
+    depth = max([float(layer.end_depth) for layer in layers] + [1])
+    scale = min(MAX_SCALE, (MAX_HEIGHT - TOP - BOTTOM) / depth)
+    height = int(TOP + depth * scale + BOTTOM)
+
+    def y(value):
+        return round(TOP + float(value) * scale, 1)
+
+    shapes = [
+        ("text", DEPTH_X, 10, f"{borehole.project.project_reference} "
+                              f"{borehole.borehole_reference}"),
+        ("text", DEPTH_X, 26, f"Ground level {borehole.ground_level} m"),
+        ("text", DEPTH_X, TOP - 16, "Depth (m)"),
+        ("text", STRATA_X, TOP - 16, "Strata"),
+        ("text", TEXT_X, TOP - 16, "Description"),
+        ("text", SPT_X, TOP - 16, f"SPT N (0 to {SPT_MAX})")
+    ]
+
+    # Depth scale with a tick at least every 20 pixels
+    step = next(
+        step for step in (0.5, 1, 2, 5, 10, 20, 50, 100) if step * scale >= 20)
+    tick = 0
+    while tick <= depth:
+        shapes.append(("line", STRATA_X - 8, y(tick), STRATA_X, y(tick)))
+        shapes.append(("text", DEPTH_X, y(tick) - 6, f"{tick:g}"))
+        tick += step
+
+    for layer in layers:
+        top, bottom = y(layer.start_depth), y(layer.end_depth)
+        colour = COLOURS[
+            zlib.crc32(layer.geology_description.strip().lower().encode()) %
+            len(COLOURS)
+        ]
+        shapes.append(("rect", STRATA_X, top, TEXT_X - 10, bottom, colour))
+        shapes.append(("line", STRATA_X, bottom, RIGHT_X, bottom))
+
+        # Descriptions are wrapped and cut to the height of their layer
+        lines = textwrap.wrap(
+            layer.geology_description, (SPT_X - TEXT_X - 10) //
+            CHARACTER_WIDTH
+        )[:max(int((bottom - top) // LINE_HEIGHT), 1)]
+        for n, text in enumerate(lines):
+            shapes.append(("text", TEXT_X, top + 2 + n * LINE_HEIGHT, text))
+
+        # Markers at the N value of each test near the top of its layer,
+        # squares for refusals
+        if layer.spt_n is not None:
+            x = round(SPT_X + min(layer.spt_n, SPT_MAX) / SPT_MAX * (
+                RIGHT_X - SPT_X), 1)
+            marker = round(min(top + 6, (top + bottom) / 2), 1)
+            kind = "square" if layer.spt_refusal else "circle"
+            shapes.append((kind, x, marker, 4))
+            shapes.append(("text", x + 6, marker - 6, str(layer.spt_n)))
+
+    shapes += [
+        ("frame", STRATA_X, TOP, TEXT_X - 10, y(depth)),
+        ("frame", SPT_X, TOP, RIGHT_X, y(depth))
+    ]
+    return WIDTH, height, shapes
+
+
+def png(width, height, shapes):
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default()
+    for kind, *values in shapes:
+        if kind == "text":
+            x, y, text = values
+            draw.text((x, y), text, fill="black", font=font)
+        elif kind == "line":
+            draw.line(values, fill="#808080")
+        elif kind == "rect":
+            *box, colour = values
+            draw.rectangle(box, fill=colour, outline="black")
+        elif kind == "frame":
+            draw.rectangle(values, outline="black")
+        else:
+            x, y, radius = values
+            box = [x - radius, y - radius, x + radius, y + radius]
+            if kind == "square":
+                draw.rectangle(box, fill="red")
+            else:
+                draw.ellipse(box, fill="blue")
+    output = io.BytesIO()
+    image.save(output, "PNG", optimize=True)
+    return output.getvalue()
+
+
+def svg(width, height, shapes):
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" '
+        f'height="{height}" font-family="sans-serif" font-size="11">',
+        f'<rect width="{width}" height="{height}" fill="white"/>'
+    ]
+    for kind, *values in shapes:
+        if kind == "text":
+            x, y, text = values
+            parts.append(
+                f'<text x="{x}" y="{y + 10}">{escape(text)}</text>')
+        elif kind == "line":
+            x1, y1, x2, y2 = values
+            parts.append(
+                f'<line x1="{x1}" y1="{y1}" x2="{x2}" y2="{y2}" '
+                f'stroke="#808080"/>')
+        elif kind in ("rect", "frame"):
+            x1, y1, x2, y2 = values[:4]
+            fill = values[4] if kind == "rect" else "none"
+            parts.append(
+                f'<rect x="{x1}" y="{y1}" width="{x2 - x1}" '
+                f'height="{y2 - y1}" fill="{fill}" stroke="black"/>')
+        elif kind == "square":
+            x, y, radius = values
+            parts.append(
+                f'<rect x="{x - radius}" y="{y - radius}" '
+                f'width="{2 * radius}" height="{2 * radius}" fill="red"/>')
+        else:
+            x, y, radius = values
+            parts.append(
+                f'<circle cx="{x}" cy="{y}" r="{radius}" fill="blue"/>')
+    parts.append("</svg>")
+    return "\n".join(parts).encode()
+
+
+RENDERERS = {"png": png, "svg": svg}
+
+
+def draw(borehole, format):
+    layers = list(Geology.objects.filter(borehole=borehole).order_by(
+        "start_depth", "id"))
+    return RENDERERS[format](*layout(borehole, layers))
+
+
+def strip_log(borehole, format="png"):
+    """
+    Returns the name in storage of the log of a borehole, rendering it if
+    the current version has not been rendered yet. Versions older than it
+    are removed once it is saved, so a concurrent render of a newer
+    version is never removed, though a reader of an older one may find it
+    gone.
+    """
+    name = path(borehole, format)
+    if default_storage.exists(name):
+        return name
+
+    name = default_storage.save(name, ContentFile(draw(borehole, format)))
+    current = version(borehole)
+    directory = f"{LOG_DIR}/{borehole.id}"
+    for old in default_storage.listdir(directory)[1]:
+        # Concurrent saves of one version get a suffix after an underscore
+        stem, extension = os.path.splitext(old)
+        if extension == f".{format}" and \
+                int(stem.split("_")[0]) < current:
+            default_storage.delete(f"{directory}/{old}")
+    return name
+
+
+def render_borehole(borehole_id, format="png"):
+    """
+    Renders the log of a borehole by id, for use in worker processes.
+    Returns the name in storage, or None if the borehole was deleted.
+    """
+    borehole = Borehole.objects.select_related("project").filter(
+        id=borehole_id).first()
+    if borehole is None:
+        return None
+    return strip_log(borehole, format)
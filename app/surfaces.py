@@ -0,0 +1,141 @@
+import hashlib
+
+import numpy as np
+from django.conf import settings
+
+from .cache import get_cache, versions
+from .intervals import layers
+from .models import Borehole
+
+
+# Most grid nodes along either side of a surface
+GRID_LIMIT = 1000
+
+# Most boreholes used as control points of a surface
+CONTROL_LIMIT = 20000
+
+# Most entries of the distance matrix between a chunk of grid nodes and
+# the control points, which bounds the memory used by interpolation to a
+# few arrays of 16 MB whatever the number of control points
+CHUNK_ENTRIES = 2 ** 21
+
+
+class InvalidSurface(Exception):
+    """
+    Raised when a surface cannot be built, with a message for the client.
+    """
+
+
+def control_points(project_id, stratum):
+    """
+    Returns the easting, northing and elevation of the top of the first
+    layer matching stratum in each borehole of a project with coordinates.
+    """
+    tops = {
+        row[1]: row[5] for row in layers(
+            project_id, text=stratum, first=True, limit=CONTROL_LIMIT
+        )["layers"]
+    }
+    points = Borehole.objects.filter(
+        id__in=tops, borehole_easting__isnull=False,
+        borehole_northing__isnull=False
+    ).order_by("id").values_list(
+        "id", "borehole_easting", "borehole_northing")
+    return np.array([
+        (float(easting), float(northing), tops[id])
+        for id, easting, northing in points
+    ], dtype=float).reshape(-1, 3)
+
+
+def interpolate(points, eastings, northings, power=2):
+    """
+    Interpolates the elevation at every grid node by inverse distance
+    weighting over all control points at once, a chunk of nodes at a
+    time. Nodes on a control point take its elevation.
+    Returns an array of northings x eastings.
+    """
+    nodes_e, nodes_n = np.meshgrid(eastings, northings)
+    nodes_e, nodes_n = nodes_e.ravel(), nodes_n.ravel()
+    values = np.empty(len(nodes_e))
+    step = max(CHUNK_ENTRIES // len(points), 1)
+    for start in range(0, len(values), step):
+        end = start + step
+        squared = (
+            (nodes_e[start:end, None] - points[None, :, 0]) ** 2 +
+            (nodes_n[start:end, None] - points[None, :, 1]) ** 2
+        )
+        exact = squared == 0
+        with np.errstate(divide="ignore"):
+            weights = np.where(exact, 0, squared ** (-power / 2))
+        chunk = weights @ points[:, 2] / np.maximum(
+            weights.sum(axis=1), np.finfo(float).tiny)
+        on_point = exact.any(axis=1)
+        chunk[on_point] = points[exact[on_point].argmax(axis=1), 2]
+        values[start:end] = chunk
+    return values.reshape(len(northings), len(eastings))
+
+
+def build(project_id, stratum, resolution, power=2):
+    """
+    Returns the description of the grid of a surface and its elevations,
+    rows running north from the most southern control point. The grid is
+    empty when no borehole reaches the stratum.
+    """
+    points = control_points(project_id, stratum)
+    if not len(points):
+        return {
+            "stratum": stratum, "origin": None, "resolution": resolution,
+            "power": power, "columns": 0, "rows": 0, "control_points": 0,
+            "min": None, "max": None
+        }, np.empty((0, 0))
+    low, high = points[:, :2].min(axis=0), points[:, :2].max(axis=0)
+    # Sizes are checked as floats, a tiny resolution overflows integers
+    columns, rows = (
+        float(span) // 1 + 1 for span in (high - low) / resolution)
+    if max(columns, rows) > GRID_LIMIT:
+        raise InvalidSurface("Resolution too fine for the site.")
+    columns, rows = int(columns), int(rows)
+
+    grid = interpolate(
+        points, low[0] + np.arange(columns) * resolution,
+        low[1] + np.arange(rows) * resolution, power
+    )
+    return {
+        "stratum": stratum,
+        "origin": [float(low[0]), float(low[1])],
+        "resolution": resolution,
+        "power": power,
+        "columns": int(columns),
+        "rows": int(rows),
+        "control_points": len(points),
+        "min": round(float(grid.min()), 3),
+        "max": round(float(grid.max()), 3)
+    }, grid
+
+
+def surface(project_id, stratum, resolution, power=2):
+    """
+    Returns the description, elevations and whether they were cached of
+    the surface of a stratum. Grids are cached as float32 bytes under the
+    version of the project, so they are reused until it changes. Versions
+    are only shared between processes through a shared cache, otherwise
+    QLOG_SURFACE_CACHE_TTL bounds how long a grid misses edits made in
+    another process.
+    """
+    version = versions([f"project:{project_id}"])
+    key = hashlib.md5(
+        f"{project_id}:{version}:{stratum}:{resolution}:{power}".encode()
+    ).hexdigest()
+    key = f"surface:{key}"
+    cache = get_cache()
+    entry = cache.get(key)
+    if entry is not None:
+        grid, content = entry
+        values = np.frombuffer(content, dtype="<f4")
+        return grid, values.reshape(grid["rows"], grid["columns"]), True
+
+    grid, values = build(project_id, stratum, resolution, power)
+    values = values.astype("<f4")
+    timeout = getattr(settings, "QLOG_SURFACE_CACHE_TTL", 5 * 60)
+    cache.set(key, (grid, values.tobytes()), timeout)
+    return grid, values, False
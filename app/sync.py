@@ -0,0 +1,103 @@
+from itertools import islice
+
+from .models import Project, Borehole, Geology, Message, Change
+from .serializers import (
+    serialize_projects, serialize_boreholes, serialize_geology,
+    serialize_messages
+)
+
+
+# Name used in the change log for each synced model, with the key of its
+# rows in responses, their serializer and the path to their project id
+SYNCED = {
+    "project": (Project, "projects", serialize_projects, "id"),
+    "borehole": (Borehole, "boreholes", serialize_boreholes, "project_id"),
+    "geology": (
+        Geology, "geology", serialize_geology, "borehole__project_id"),
+    "message": (Message, "messages", serialize_messages, "project_id")
+}
+
+# Most changes returned by a single sync request
+SYNC_LIMIT = 900
+
+
+def record(model, object_id, project_id, deleted=False):
+    """
+    Appends a single create, update or delete to the change log.
+    """
+    Change.objects.create(
+        model=model, object_id=object_id, project_id=project_id,
+        deleted=deleted
+    )
+
+
+def record_all(changes):
+    """
+    Appends many changes to the change log in one INSERT.
+    changes is a list of (model, object id, project id) for saved rows.
+    """
+    Change.objects.bulk_create([
+        Change(model=model, object_id=object_id, project_id=project_id)
+        for model, object_id, project_id in changes
+    ])
+
+
+def record_many(name, after=0, batch_size=5000):
+    """
+    Appends the creation of every row of a synced model with an id above
+    after to the change log, for code which inserts with bulk_create and so
+    skips the signals.
+    """
+    model, key, serializer, project = SYNCED[name]
+    rows = model.objects.filter(id__gt=after).order_by("id")
+    rows = rows.values_list("id", project).iterator()
+    batch = list(islice(rows, batch_size))
+    while batch:
+        Change.objects.bulk_create([
+            Change(model=name, object_id=object_id, project_id=project_id)
+            for object_id, project_id in batch
+        ])
+        batch = list(islice(rows, batch_size))
+
+
+def changes_since(since, project_id=None, limit=500):
+    """
+    Returns every row created, updated or deleted after change since.
+    Rows changed several times are only returned once in their latest
+    state. Deleted rows are returned as tombstones of ids, and deleting a
+    project or borehole implies deleting everything below it.
+    The cost depends on the number of changes, not the size of projects.
+    """
+    limit = max(1, min(limit, SYNC_LIMIT))
+    log = Change.objects.filter(id__gt=since)
+    if project_id is not None:
+        log = log.filter(project_id=project_id)
+    log = list(log.order_by("id").values_list(
+        "id", "model", "object_id", "deleted")[:limit + 1])
+    has_more = len(log) > limit
+    log = log[:limit]
+
+    # Only the latest change of each row counts
+    latest = {}
+    for id, model, object_id, deleted in log:
+        latest[(model, object_id)] = deleted
+
+    data = {"changes": {}, "deleted": {}}
+    for name, (model, key, serializer, project) in SYNCED.items():
+        saved = [
+            object_id for (changed, object_id), deleted in latest.items()
+            if changed == name and not deleted
+        ]
+        data["deleted"][key] = sorted(
+            object_id for (changed, object_id), deleted in latest.items()
+            if changed == name and deleted
+        )
+
+        # Rows deleted by a later change beyond this page are left out
+        data["changes"][key] = serializer(
+            model.objects.filter(id__in=saved).order_by("id")
+        ) if saved else []
+
+    data["sync_token"] = log[-1][0] if log else since
+    data["has_more"] = has_more
+    return data
@@ -1,3 +1,2077 @@
-from django.test import TestCase
+import os
+import re
+import gzip
+import json
+import base64
+import hashlib
+import math
+import tempfile
+import zipfile
+from io import BytesIO, StringIO
+from datetime import timedelta
+from random import Random
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    clusters, counters, formats, jobs, spatial, spt, surfaces, sync, views
+)
+from .http import JsonResponse, StreamingJsonResponse
+from .importer import Importer
+from .metrics import registry, REQUESTS
+from .models import User, Project, Borehole, Geology, Message, Job
+from .serializers import serialize_geology, serialize_users
+
+
+def seed(lead, logger, projects=2, boreholes=3, layers=4, messages=3):
+    """
+    Creates a small dataset of projects, boreholes, layers and messages.
+    Returns the list of created projects.
+    """
+    created = []
+    layer_start = Geology.objects.order_by("-id").values_list(
+        "id", flat=True).first() or 0
+    message_start = Message.objects.order_by("-id").values_list(
+        "id", flat=True).first() or 0
+    for p in range(projects):
+        project = Project.objects.create(
+            lead=lead,
+            project_title=f"Project {p}",
+            project_reference=f"P{p}",
+            project_client="Client",
+            project_description="Description"
+        )
+        created.append(project)
+        for b in range(boreholes):
+            borehole = Borehole.objects.create(
+                logger=logger,
+                project=project,
+                borehole_reference=f"BH{b}",
+                borehole_northing=b,
+                borehole_easting=b,
+                ground_level=10,
+                drilling_equipment="Rig",
+                borehole_diameter=100
+            )
+            Geology.objects.bulk_create([
+                Geology(
+                    borehole=borehole,
+                    start_depth=g,
+                    end_depth=g + 1,
+                    spt_result="N=10",
+                    field_test_details="SPT",
+                    geology_description="Stiff CLAY"
+                ) for g in range(layers)
+            ])
+        Message.objects.bulk_create([
+            Message(project=project, user=logger, message=f"Message {m}")
+            for m in range(messages)
+        ])
+
+    # bulk_create skips the signals which maintain the counters and log
+    counters.rebuild()
+    sync.record_many("geology", layer_start)
+    sync.record_many("message", message_start)
+    return created
+
+
+class QueryCountTestCase(TestCase):
+    """
+    Pins the number of SQL queries made by each API endpoint.
+    Every endpoint is requested against a small and a larger dataset to
+    check the number of queries does not grow with the number of rows.
+    """
+
+    def setUp(self):
+        self.lead = User.objects.create_user("lead", "lead@qlog.com", "pw")
+        self.logger = User.objects.create_user("log", "log@qlog.com", "pw")
+        self.client.force_login(self.lead)
+
+    def assertConstantQueries(self, num, url, **sizes):
+        """
+        Requests url against two dataset sizes with num queries each time.
+        The url is formatted with the first seeded project, borehole and
+        geology layer.
+        """
+        for scale in (1, 3):
+            Project.objects.all().delete()
+            project = seed(self.lead, self.logger, **{
+                key: value * scale for key, value in sizes.items()
+            })[0]
+            borehole = project.borehole.first()
+            layer = borehole.geology.first()
+            path = url.format(
+                project=project.id, borehole=borehole.id, layer=layer.id,
+                user=self.logger.id
+            )
+            with self.assertNumQueries(num):
+                response = self.client.get(path)
+                response.getvalue()
+            self.assertEqual(response.status_code, 200)
+
+    def test_projects_list(self):
+        self.assertConstantQueries(5, "/projects/0/1", projects=4)
+
+    def test_project_detail(self):
+        self.assertConstantQueries(
+            7, "/projects/{project}/1", boreholes=4, messages=4)
+
+    def test_profile_list(self):
+        self.assertConstantQueries(4, "/profile/0", projects=2)
+
+    def test_profile_detail(self):
+        self.assertConstantQueries(8, "/profile/{user}", projects=2)
+
+    def test_borehole(self):
+        self.assertConstantQueries(4, "/borehole/{borehole}")
+
+    def test_geology_list(self):
+        self.assertConstantQueries(6, "/geology/{borehole}/0", layers=10)
+
+    def test_geology_detail(self):
+        self.assertConstantQueries(5, "/geology/{borehole}/{layer}")
+
+    def test_sketch(self):
+        self.assertConstantQueries(4, "/sketch/{project}")
+
+    def test_messages(self):
+        self.assertConstantQueries(6, "/message/{project}/1", messages=4)
+
+
+class CursorPaginationTestCase(TestCase):
+    """
+    Walks the keyset paginated endpoints forwards and backwards.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", "user@qlog.com", "pw")
+        self.client.force_login(self.user)
+        self.project = seed(
+            self.user, self.user, projects=12, boreholes=7, layers=0,
+            messages=11
+        )[0]
+
+    def walk(self, url, key, token=""):
+        """
+        Follows next tokens from token until the last page.
+        Returns the ids seen and the list of pages.
+        """
+        ids, pages = [], []
+        while token is not None:
+            response = self.client.get(url, {"cursor": token})
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            pages.append(page)
+            ids += [row["id"] for row in page[key]]
+            token = page["next"]
+        return ids, pages
+
+    def test_projects_forwards_and_backwards(self):
+        ids, pages = self.walk("/projects/0/1", "projects")
+        expected = Project.objects.order_by("-project_timestamp", "-id")
+        self.assertEqual(ids, [project.id for project in expected])
+        self.assertEqual(len(pages), 3)
+        self.assertIsNone(pages[0]["prev"])
+
+        # Stepping back from the last page returns the middle page
+        response = self.client.get(
+            "/projects/0/1", {"cursor": pages[-1]["prev"]})
+        self.assertEqual(response.json()["projects"], pages[1]["projects"])
+
+    def test_boreholes(self):
+        ids, pages = self.walk(f"/projects/{self.project.id}/1", "boreholes")
+        expected = self.project.borehole.order_by("borehole_timestamp", "id")
+        self.assertEqual(ids, [borehole.id for borehole in expected])
+        self.assertEqual(pages[0]["project"]["id"], self.project.id)
+
+    def test_messages(self):
+        ids, pages = self.walk(f"/message/{self.project.id}/1", "messages")
+        expected = self.project.message.order_by("-message_date", "-id")
+        self.assertEqual(ids, [message.id for message in expected])
+
+    def test_same_queries_on_every_page(self):
+        token = ""
+        while token is not None:
+            with self.assertNumQueries(4):
+                response = self.client.get("/projects/0/1", {"cursor": token})
+            token = response.json()["next"]
+
+    def test_total(self):
+        response = self.client.get("/projects/0/1", {"cursor": "", "total": 1})
+        self.assertEqual(response.json()["total"], 12)
+        self.assertTrue(response.json()["total_exact"])
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/projects/0/1", {"cursor": "nonsense"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_page_numbers_still_work(self):
+        response = self.client.get("/projects/0/2")
+        self.assertEqual(response.json()["current_page"], 2)
+        self.assertEqual(response.json()["total_pages"], 3)
+
+
+class QueryPlanTestCase(TestCase):
+    """
+    Runs EXPLAIN QUERY PLAN on every query made by each GET endpoint.
+    Fails if a query scans a whole table or sorts in a temporary B-tree
+    instead of reading rows in index order.
+    """
+
+    # Queries which read a whole table by design
+    FULL_SCANS = ["app_user"]
+
+    def setUp(self):
+        self.lead = User.objects.create_user("lead", "lead@qlog.com", "pw")
+        self.logger = User.objects.create_user("log", "log@qlog.com", "pw")
+        self.client.force_login(self.lead)
+        self.project = seed(self.lead, self.logger, projects=8)[0]
+        self.borehole = self.project.borehole.first()
+        self.layer = self.borehole.geology.first()
+
+        # Other users' projects so statistics resemble a shared install
+        for n in range(4):
+            user = User.objects.create_user(f"user{n}", "", "pw")
+            seed(user, user, projects=8)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def plan(self, sql):
+        """
+        Returns the EXPLAIN QUERY PLAN details of a query.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertIndexedQueries(self, url, **params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+
+        for query in context.captured_queries:
+            if not query["sql"].startswith("SELECT"):
+                continue
+            for detail in self.plan(query["sql"]):
+                self.assertNotIn("TEMP B-TREE", detail, query["sql"])
+
+                # Before SQLite 3.36 plans read "SCAN TABLE t"
+                scan = re.match(r"SCAN (?:TABLE )?(\w+)", detail)
+                if scan and "INDEX" not in detail:
+                    self.assertIn(scan[1], self.FULL_SCANS, query["sql"])
+
+    def test_projects_list(self):
+        self.assertIndexedQueries("/projects/0/2")
+        self.assertIndexedQueries("/projects/0/1", cursor="")
+
+    def test_project_detail(self):
+        self.assertIndexedQueries(f"/projects/{self.project.id}/1")
+        self.assertIndexedQueries(f"/projects/{self.project.id}/1", cursor="")
+
+    def test_profile(self):
+        self.assertIndexedQueries("/profile/0")
+        self.assertIndexedQueries(f"/profile/{self.lead.id}")
+        self.assertIndexedQueries(f"/profile/{self.logger.id}")
+
+    def test_borehole(self):
+        self.assertIndexedQueries(f"/borehole/{self.borehole.id}")
+
+    def test_geology(self):
+        self.assertIndexedQueries(f"/geology/{self.borehole.id}/0")
+        self.assertIndexedQueries(
+            f"/geology/{self.borehole.id}/{self.layer.id}")
+
+    def test_sketch(self):
+        self.assertIndexedQueries(f"/sketch/{self.project.id}")
+
+    def test_messages(self):
+        self.assertIndexedQueries(f"/message/{self.project.id}/1")
+        self.assertIndexedQueries(f"/message/{self.project.id}/1", cursor="")
+
+
+class BenchmarkTestCase(TestCase):
+    """
+    Checks the seed_data and benchmark management commands.
+    """
+
+    def seed(self):
+        call_command(
+            "seed_data", users=3, projects=4, boreholes=2, layers=3,
+            messages=2, seed=7, stdout=StringIO()
+        )
+        return list(Geology.objects.order_by("id").values_list(
+            "borehole__project__lead__username", "geology_description",
+            "end_depth"
+        ))
+
+    def test_seed_data(self):
+        layers = self.seed()
+        self.assertEqual(Project.objects.count(), 4)
+        self.assertEqual(Borehole.objects.count(), 8)
+        self.assertEqual(len(layers), 24)
+        self.assertEqual(Message.objects.count(), 8)
+
+        # The same seed generates the same rows
+        Project.objects.all().delete()
+        self.assertEqual(self.seed(), layers)
+
+    def test_benchmark(self):
+        self.seed()
+        output = StringIO()
+
+        # Strip logs are rendered into MEDIA_ROOT
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(MEDIA_ROOT=directory):
+                call_command("benchmark", iterations=2, stdout=output)
+        results = json.loads(output.getvalue())
+        names = [endpoint["name"] for endpoint in results["endpoints"]]
+        self.assertIn("projects (all)", names)
+        self.assertIn("geology", names)
+        for endpoint in results["endpoints"]:
+            self.assertEqual(endpoint["status"], 200, endpoint["name"])
+            self.assertLessEqual(endpoint["p50_ms"], endpoint["p95_ms"])
+            self.assertLessEqual(
+                endpoint["warm_p50_ms"], endpoint["warm_p95_ms"])
+
+
+class TimingMiddlewareTestCase(TestCase):
+    """
+    Checks the Server-Timing header and the slow request log.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", "user@qlog.com", "pw")
+        self.client.force_login(self.user)
+        seed(self.user, self.user)
+
+    def test_server_timing(self):
+        response = self.client.get("/projects/0/1")
+        timing = response["Server-Timing"]
+        for name in ("total", "view", "db", "serialize", "encode"):
+            self.assertIn(f"{name};dur=", timing)
+        self.assertIn('desc="5 queries"', timing)
+
+    @override_settings(
+        QLOG_SLOW_REQUEST_MS=0, QLOG_SLOW_QUERY_COUNT=2,
+        QLOG_PROFILE_SAMPLE_RATE=0
+    )
+    def test_slow_request_log(self):
+        with self.assertLogs("app.requests", "WARNING") as logs:
+            self.client.get("/projects/0/1")
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["path"], "/projects/0/1")
+        self.assertEqual(record["queries"], 5)
+        self.assertEqual(len(record["worst_queries"]), 2)
+        self.assertIsNone(record["profile"])
+
+    def test_fast_requests_not_logged(self):
+        with self.assertRaises(AssertionError):
+            with self.assertLogs("app.requests", "WARNING"):
+                self.client.get("/projects/0/1")
+
+    def test_profile_outliers(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(
+                QLOG_SLOW_REQUEST_MS=0, QLOG_PROFILE_SAMPLE_RATE=1,
+                QLOG_PROFILE_DIR=directory
+            ):
+                with self.assertLogs("app.requests", "WARNING") as logs:
+                    self.client.get("/projects/0/1")
+            record = json.loads(logs.records[0].getMessage())
+            self.assertTrue(os.path.exists(record["profile"]))
+
+
+class MetricsTestCase(TestCase):
+    """
+    Checks the /metrics endpoint and aggregation across processes.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", "user@qlog.com", "pw")
+        self.client.force_login(self.user)
+        seed(self.user, self.user)
+        self.key = REQUESTS.key(
+            {"view": "projects", "method": "GET", "status": 200})
+
+    def test_metrics(self):
+        self.client.get("/projects/0/1")
+        count = registry.values[self.key]
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn(
+            f'qlog_requests_total{{view="projects",method="GET",'
+            f'status="200"}} {count}', text)
+        self.assertIn(
+            'qlog_request_duration_seconds_bucket{view="projects",'
+            'le="+Inf"}', text)
+        self.assertIn("qlog_db_query_duration_seconds_count", text)
+        self.assertIn("# TYPE qlog_sketch_upload_bytes_total counter", text)
+
+    def test_processes_are_summed(self):
+        self.client.get("/projects/0/1")
+        with tempfile.TemporaryDirectory() as directory:
+
+            # Another worker process which has served 5 requests
+            with open(os.path.join(directory, "metrics_0.json"), "w") as f:
+                json.dump({self.key: 5}, f)
+
+            with override_settings(QLOG_METRICS_DIR=directory):
+                count = registry.values[self.key]
+                text = registry.render()
+                self.assertTrue(os.path.exists(os.path.join(
+                    directory, f"metrics_{os.getpid()}.json")))
+        self.assertIn(
+            f'qlog_requests_total{{view="projects",method="GET",'
+            f'status="200"}} {count + 5}', text)
+
+
+class CounterTestCase(TestCase):
+    """
+    Checks the denormalized counters follow creates, edits and deletes.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", "user@qlog.com", "pw")
+        self.client.force_login(self.user)
+        self.project = seed(self.user, self.user, projects=2)[0]
+        self.borehole = self.project.borehole.first()
+
+    def post(self, url, data, method="post"):
+        response = getattr(self.client, method)(
+            url, json.dumps(data), content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+
+    def test_created_through_views(self):
+        self.post("/projects/0/1", {
+            "project_title": "New", "project_reference": "N1",
+            "project_client": "Client", "project_description": "New"
+        })
+        self.post("/borehole/0", {
+            "projectId": self.project.id, "borehole_reference": "BH9",
+            "ground_level": 5, "drilling_equipment": "Rig",
+            "borehole_diameter": 100
+        })
+        self.post(f"/geology/{self.borehole.id}/0", {
+            "start_depth": 4, "end_depth": 12.5,
+            "field_test_details": "-", "geology_description": "Rock"
+        })
+        self.post(f"/message/{self.project.id}/0", {"message": "Hello"})
+        self.assertEqual(counters.verify(), [])
+
+        self.borehole.refresh_from_db()
+        self.assertEqual(self.borehole.layer_count, 5)
+        self.assertEqual(float(self.borehole.logged_depth), 12.5)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.serialize()["projects"], 3)
+
+    def test_edit_updates_logged_depth(self):
+        layer = self.borehole.geology.order_by("-end_depth").first()
+        layer.end_depth = 20
+        layer.save()
+        self.borehole.refresh_from_db()
+        self.assertEqual(float(self.borehole.logged_depth), 20)
+
+    def test_deletes(self):
+        self.borehole.geology.first().delete()
+        self.project.message.first().delete()
+        self.borehole.delete()
+        self.assertEqual(counters.verify(), [])
+        self.project.delete()
+        self.assertEqual(counters.verify(), [])
+
+    def test_rebuild_command(self):
+        Project.objects.update(borehole_count=99)
+        with self.assertRaises(CommandError):
+            call_command(
+                "rebuild_counters", verify=True, stdout=StringIO())
+        call_command("rebuild_counters", stdout=StringIO())
+        call_command("rebuild_counters", verify=True, stdout=StringIO())
+
+
+class BundleTestCase(TestCase):
+    """
+    Checks the single request project bundle.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", "user@qlog.com", "pw")
+        self.client.force_login(self.user)
+
+    def test_bundle(self):
+        for scale in (1, 3):
+            Project.objects.all().delete()
+            project = seed(
+                self.user, self.user, projects=1, boreholes=3 * scale,
+                layers=4 * scale, messages=4 * scale
+            )[0]
+            with self.assertNumQueries(9):
+                response = self.client.get(f"/bundle/{project.id}")
+            data = response.json()
+            self.assertEqual(data["project"]["id"], project.id)
+            self.assertEqual(len(data["boreholes"]), min(3 * scale, 5))
+            self.assertEqual(
+                len(data["boreholes"][0]["geology"]), 4 * scale)
+            self.assertIsNone(data["sketch"])
+            self.assertEqual(len(data["messages"]), 4 if scale == 1 else 5)
+
+        # Next pages are fetched from the paginated endpoints
+        response = self.client.get(
+            f"/projects/{project.id}/1", {"cursor": data["boreholes_next"]})
+        self.assertEqual(len(response.json()["boreholes"]), 4)
+
+    def test_include_and_fields(self):
+        project = seed(self.user, self.user, projects=1)[0]
+        with self.assertNumQueries(8):
+            response = self.client.get(f"/bundle/{project.id}", {
+                "include": "boreholes,geology",
+                "fields[boreholes]": "id,ref",
+                "fields[geology]": "id,description"
+            })
+        data = response.json()
+        self.assertEqual(list(data), ["boreholes", "boreholes_next"])
+        self.assertEqual(
+            set(data["boreholes"][0]), {"id", "ref", "geology"})
+        self.assertEqual(
+            set(data["boreholes"][0]["geology"][0]), {"id", "description"})
+
+    def test_missing_project(self):
+        response = self.client.get("/bundle/999")
+        self.assertEqual(response.status_code, 400)
+
+
+class ResponseCacheTestCase(TestCase):
+    """
+    Checks cached responses are served until a write invalidates them.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", "user@qlog.com", "pw")
+        self.client.force_login(self.user)
+        self.project = seed(self.user, self.user, projects=2)[0]
+        self.borehole = self.project.borehole.first()
+
+    def assertCached(self, url, cached):
+        response = self.client.get(url)
+        self.assertEqual(response["X-Cache"], "HIT" if cached else "MISS")
+        return json.loads(response.getvalue())
+
+    def test_hit_after_miss(self):
+        url = f"/geology/{self.borehole.id}/0"
+        self.assertCached(url, False)
+        with self.assertNumQueries(4):
+            self.assertCached(url, True)
+
+    def test_geology_write_invalidates(self):
+        urls = [
+            f"/geology/{self.borehole.id}/0",
+            f"/borehole/{self.borehole.id}",
+            f"/projects/{self.project.id}/1",
+            f"/bundle/{self.project.id}"
+        ]
+        for url in urls:
+            self.assertCached(url, False)
+            self.assertCached(url, True)
+        layer = self.borehole.geology.first()
+        layer.geology_description = "Soft SILT"
+        layer.save()
+        for url in urls:
+            self.assertCached(url, False)
+        self.assertEqual(
+            self.assertCached(urls[0], True)[0]["description"], "Soft SILT")
+
+    def test_project_edit_invalidates_boreholes(self):
+        url = f"/borehole/{self.borehole.id}"
+        self.assertCached(url, False)
+        self.project.project_title = "Renamed"
+        self.project.save()
+        self.assertEqual(self.assertCached(url, False)["project"], "Renamed")
+
+    def test_message_invalidates_lists(self):
+        self.assertCached("/projects/0/1", False)
+        self.assertCached(f"/message/{self.project.id}/1", False)
+        Message.objects.create(
+            project=self.project, user=self.user, message="New")
+        self.assertCached("/projects/0/1", False)
+        messages = self.assertCached(f"/message/{self.project.id}/1", False)
+        self.assertEqual(messages["messages"][0]["message"], "New")
+
+    def test_other_projects_stay_cached(self):
+        other = Project.objects.exclude(id=self.project.id).first()
+        url = f"/projects/{other.id}/1"
+        self.assertCached(url, False)
+        Message.objects.create(
+            project=self.project, user=self.user, message="New")
+        self.assertCached(url, True)
+
+    @override_settings(QLOG_RESPONSE_CACHE_TTL=0)
+    def test_ttl(self):
+        url = f"/geology/{self.borehole.id}/0"
+        self.assertCached(url, False)
+        self.assertCached(url, False)
+
+
+class ConditionalGetTestCase(TestCase):
+    """
+    Checks ETag and Last-Modified validators and 304 responses.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", "user@qlog.com", "pw")
+        self.client.force_login(self.user)
+        self.project = seed(self.user, self.user, projects=2)[0]
+        self.borehole = self.project.borehole.first()
+
+    def assertNotModified(self, url, etag, not_modified=True):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304 if not_modified else 200)
+
+    def test_every_get_route(self):
+        urls = [
+            "/projects/0/1", f"/projects/{self.project.id}/1", "/profile/0",
+            f"/profile/{self.user.id}", f"/borehole/{self.borehole.id}",
+            f"/geology/{self.borehole.id}/0",
+            f"/geology/{self.borehole.id}/{self.borehole.geology.first().id}",
+            f"/sketch/{self.project.id}", f"/message/{self.project.id}/1",
+            f"/bundle/{self.project.id}"
+        ]
+        for url in urls:
+            etag = self.client.get(url)["ETag"]
+            self.assertNotModified(url, etag)
+
+    def test_layer_edit_changes_borehole_log(self):
+        url = f"/geology/{self.borehole.id}/0"
+        etag = self.client.get(url)["ETag"]
+        layer = self.borehole.geology.first()
+        layer.geology_description = "Soft SILT"
+        layer.save()
+        self.assertNotModified(url, etag, False)
+
+    def test_layer_delete_changes_project_page(self):
+        url = f"/projects/{self.project.id}/1"
+        etag = self.client.get(url)["ETag"]
+        self.borehole.geology.first().delete()
+        self.assertNotModified(url, etag, False)
+
+    def test_counter_changes_profiles(self):
+        other = User.objects.create_user("other", "other@qlog.com", "pw")
+        urls = ["/profile/0", f"/profile/{self.user.id}"]
+        etags = [self.client.get(url)["ETag"] for url in urls]
+
+        # Moving a borehole to another logger keeps the number of users,
+        # projects and boreholes but changes the counts of both users
+        self.borehole.logger = other
+        self.borehole.save()
+        self.assertEqual(counters.verify(), [])
+        for url, etag in zip(urls, etags):
+            self.assertNotModified(url, etag, False)
+
+    def test_query_string_is_part_of_etag(self):
+        etag = self.client.get("/projects/0/1")["ETag"]
+        self.assertNotModified("/projects/0/1?cursor=", etag, False)
+
+    def test_if_modified_since(self):
+        url = f"/borehole/{self.borehole.id}"
+        response = self.client.get(url)
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_missing_rows_have_no_validators(self):
+        response = self.client.get("/borehole/999")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.has_header("ETag"))
+
+
+class SyncTestCase(TestCase):
+    """
+    Checks the change log and the delta sync endpoint.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", "user@qlog.com", "pw")
+        self.client.force_login(self.user)
+        self.project = seed(self.user, self.user, projects=2)[0]
+        self.borehole = self.project.borehole.first()
+
+    def sync(self, since, **params):
+        params["since"] = since
+        response = self.client.get("/changes", params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_token_only_returns_later_changes(self):
+        token = self.sync(0)["sync_token"]
+        layer = Geology.objects.create(
+            borehole=self.borehole, start_depth=10, end_depth=11,
+            spt_result="N=5", field_test_details="SPT",
+            geology_description="Soft CLAY"
+        )
+        data = self.sync(token)
+        self.assertEqual([row["id"] for row in data["changes"]["geology"]],
+                         [layer.id])
+        self.assertEqual(data["changes"]["boreholes"][0]["layers"], 5)
+        self.assertEqual(data["changes"]["projects"], [])
+        self.assertGreater(data["sync_token"], token)
+        self.assertEqual(self.sync(data["sync_token"])["changes"]["geology"],
+                         [])
+
+    def test_deletes_are_tombstones(self):
+        token = self.sync(0)["sync_token"]
+        message = Message.objects.create(
+            project=self.project, user=self.user, message="Hello")
+        message_id = message.id
+        message.delete()
+        data = self.sync(token)
+        self.assertEqual(data["changes"]["messages"], [])
+        self.assertEqual(data["deleted"]["messages"], [message_id])
+        self.assertEqual(data["changes"]["projects"][0]["messages"], 3)
+
+    def test_cascaded_rows_are_not_logged(self):
+        token = self.sync(0)["sync_token"]
+        project_id = self.project.id
+        self.project.delete()
+        data = self.sync(token)
+        self.assertEqual(data["deleted"]["projects"], [project_id])
+        self.assertEqual(data["deleted"]["boreholes"], [])
+        self.assertEqual(data["changes"]["boreholes"], [])
+
+    def test_project_filter(self):
+        other = Project.objects.exclude(id=self.project.id).first()
+        data = self.sync(0, project=other.id)
+        self.assertEqual([row["id"] for row in data["changes"]["projects"]],
+                         [other.id])
+        self.assertEqual(len(data["changes"]["boreholes"]), 3)
+
+    def test_limit_pages_through_log(self):
+        data = self.sync(0, limit=2)
+        self.assertTrue(data["has_more"])
+        tokens = [data["sync_token"]]
+        while data["has_more"]:
+            data = self.sync(tokens[-1], limit=2)
+            tokens.append(data["sync_token"])
+        self.assertEqual(tokens, sorted(set(tokens)))
+
+    def test_constant_queries(self):
+        token = self.sync(0)["sync_token"]
+        seed(self.user, self.user, projects=3, boreholes=5)
+        with self.assertNumQueries(7):
+            self.sync(token)
+
+    def test_invalid_token(self):
+        response = self.client.get("/changes", {"since": "abc"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_seed_data_logs_rows(self):
+        token = self.sync(0)["sync_token"]
+        call_command("seed_data", users=2, projects=2, boreholes=2,
+                     layers=2, messages=1, stdout=StringIO())
+        data = self.sync(token)
+        self.assertEqual(len(data["changes"]["geology"]), 8)
+        self.assertEqual(len(data["changes"]["messages"]), 2)
+
+
+class BatchTestCase(TestCase):
+    """
+    Checks batches of creates and updates and their idempotency keys.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", "user@qlog.com", "pw")
+        self.client.force_login(self.user)
+        self.project = seed(self.user, self.user, projects=1)[0]
+        self.borehole = self.project.borehole.first()
+
+    def post(self, operations, key="key-1"):
+        return self.client.post(
+            "/batch", json.dumps({"operations": operations}),
+            content_type="application/json", HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def layers(self, borehole, count, start=10):
+        return [{
+            "op": "create", "model": "geology", "borehole": borehole,
+            "data": {
+                "start_depth": start + n, "end_depth": start + n + 1,
+                "spt_result": "N=10", "field_test_details": "SPT",
+                "geology_description": "Stiff CLAY"
+            }
+        } for n in range(count)]
+
+    def test_new_borehole_with_layers(self):
+        response = self.post([{
+            "op": "create", "model": "borehole", "project": self.project.id,
+            "ref": "bh", "data": {
+                "borehole_reference": "BH9", "ground_level": 5,
+                "drilling_equipment": "Rig", "borehole_diameter": 100
+            }
+        }] + self.layers("bh", 3, start=0))
+        self.assertEqual(response.status_code, 201)
+        results = response.json()["results"]
+        borehole = Borehole.objects.get(id=results[0]["id"])
+        self.assertEqual(
+            sorted(borehole.geology.values_list("id", flat=True)),
+            [result["id"] for result in results[1:]]
+        )
+        self.assertEqual(borehole.layer_count, 3)
+        self.assertEqual(borehole.logged_depth, 3)
+        self.assertEqual(counters.verify(), [])
+        self.assertEqual(self.client.get("/changes").json()[
+            "changes"]["boreholes"][-1]["layers"], 3)
+
+    def test_updates(self):
+        layer = self.borehole.geology.order_by("id").first()
+        response = self.post([{
+            "op": "update", "model": "geology", "id": layer.id, "data": {
+                "start_depth": 0, "end_depth": 20, "spt_result": "N=5",
+                "field_test_details": "SPT", "geology_description": "Soft"
+            }
+        }, {
+            "op": "update", "model": "project", "id": self.project.id,
+            "data": {
+                "project_title": "Renamed", "project_reference": "R",
+                "project_client": "C", "project_description": "D"
+            }
+        }])
+        self.assertEqual(response.status_code, 201)
+        layer.refresh_from_db()
+        self.assertEqual(layer.geology_description, "Soft")
+        self.assertEqual(
+            self.client.get(f"/borehole/{self.borehole.id}").json()[
+                "project"], "Renamed")
+        self.borehole.refresh_from_db()
+        self.assertEqual(self.borehole.logged_depth, 20)
+
+    def test_invalid_operation_applies_nothing(self):
+        operations = self.layers(self.borehole.id, 2)
+        operations[1]["data"]["end_depth"] = "deep"
+        response = self.post(operations)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["operation"], 1)
+        self.assertEqual(self.borehole.geology.count(), 4)
+
+        # The key was not used up by the failed batch
+        operations[1]["data"]["end_depth"] = 12
+        self.assertEqual(self.post(operations).status_code, 201)
+
+    def test_retry_is_not_applied_twice(self):
+        operations = self.layers(self.borehole.id, 2)
+        first = self.post(operations)
+        retry = self.post(operations)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(self.borehole.geology.count(), 6)
+
+        # A different batch cannot reuse the key
+        response = self.post(self.layers(self.borehole.id, 1))
+        self.assertEqual(response.status_code, 400)
+
+    def test_key_required(self):
+        response = self.post(self.layers(self.borehole.id, 1), key="")
+        self.assertEqual(response.status_code, 400)
+
+    def test_constant_queries(self):
+        sizes = []
+        for key, count in (("small", 2), ("large", 40)):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.post(
+                    self.layers(self.borehole.id, count), key)
+            self.assertEqual(response.status_code, 201)
+            sizes.append(len(queries))
+        self.assertEqual(sizes[0], sizes[1])
+
+
+AGS = '''"GROUP","LOCA"
+"HEADING","LOCA_ID","LOCA_TYPE","LOCA_NATE","LOCA_NATN","LOCA_GL"
+"UNIT","","","m","m","m"
+"TYPE","ID","PA","2DP","2DP","2DP"
+"DATA","A1","CP","10.00","20.00","5.50"
+"DATA","A2","RC","11.00","21.00","6.00"
+
+"GROUP","HDIA"
+"HEADING","LOCA_ID","HDIA_BASE","HDIA_DIAM"
+"DATA","A1","10.00","150"
+
+"GROUP","GEOL"
+"HEADING","LOCA_ID","GEOL_TOP","GEOL_BASE","GEOL_DESC"
+"DATA","A1","0.00","1.50","Firm brown CLAY"
+"DATA","A1","1.50","4.00","Dense SAND"
+"DATA","A2","0.00","2.00","Soft grey SILT"
+"DATA","A3","0.00","1.00","Unknown hole"
+"DATA","A2","2.00","x","Bad depth"
+'''
+
+
+class ImportTestCase(TestCase):
+    """
+    Checks importing boreholes and layers from AGS4 and CSV files.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", "user@qlog.com", "pw")
+        self.client.force_login(self.user)
+        self.project = seed(self.user, self.user, projects=1)[0]
+
+    def upload(self, name, content):
+        file = SimpleUploadedFile(name, content.encode())
+        return self.client.post(
+            f"/import/{self.project.id}", {"file": file})
+
+    def test_ags_upload(self):
+        response = self.upload("site.ags", AGS)
+        self.assertEqual(response.status_code, 201)
+        report = response.json()
+        self.assertEqual(report["boreholes"], 2)
+        self.assertEqual(report["layers"], 3)
+        self.assertEqual(
+            [error["line"] for error in report["errors"]], [17, 18])
+
+        borehole = self.project.borehole.get(borehole_reference="A1")
+        self.assertEqual(borehole.borehole_diameter, 150)
+        self.assertEqual(borehole.drilling_equipment, "CP")
+        self.assertEqual(borehole.layer_count, 2)
+        self.assertEqual(borehole.logged_depth, 4)
+        self.assertEqual(counters.verify(), [])
+
+    def test_csv_command_in_batches(self):
+        rows = [",".join(formats.CSV_COLUMNS)] + [
+            f"BH{b},,,10,Rig,100,{n},{n + 1},,,SPT,CLAY"
+            for b in range(2, 5) for n in range(5)
+        ]
+        with tempfile.NamedTemporaryFile(
+                "w", suffix=".csv", delete=False) as file:
+            file.write("\n".join(rows))
+        err = StringIO()
+        try:
+            call_command(
+                "import_boreholes", self.project.id, file.name,
+                batch_size=4, stdout=StringIO(), stderr=err
+            )
+        finally:
+            os.remove(file.name)
+
+        # Existing BH2 is neither duplicated nor extended
+        self.assertEqual(self.project.borehole.count(), 5)
+        self.assertEqual(Geology.objects.filter(
+            borehole__project=self.project).count(), 22)
+        self.assertGreater(len(err.getvalue().splitlines()), 3)
+        self.assertEqual(counters.verify(), [])
+
+    def test_import_again(self):
+        self.upload("site.ags", AGS)
+        Borehole.objects.filter(borehole_reference="A1").update(
+            borehole_diameter=200)
+        report = self.upload("site.ags", AGS).json()
+        self.assertEqual((report["boreholes"], report["layers"]), (0, 0))
+
+        # Every row of the existing boreholes is a conflict
+        self.assertEqual(report["error_count"], 8)
+        borehole = self.project.borehole.get(borehole_reference="A1")
+        self.assertEqual(borehole.borehole_diameter, 200)
+        self.assertEqual(borehole.layer_count, 2)
+        self.assertEqual(counters.verify(), [])
+
+    def test_changes_are_logged(self):
+        token = self.client.get("/changes").json()["sync_token"]
+        self.upload("site.ags", AGS)
+        data = self.client.get("/changes", {"since": token}).json()
+        self.assertEqual(len(data["changes"]["boreholes"]), 2)
+        self.assertEqual(len(data["changes"]["geology"]), 3)
+
+    def test_unknown_format(self):
+        response = self.upload("site.txt", AGS)
+        self.assertEqual(response.status_code, 400)
+
+    def test_negative_diameter(self):
+        report = self.upload(
+            "site.ags", AGS.replace('"150"', '"-150"')).json()
+        self.assertEqual(report["boreholes"], 2)
+        self.assertEqual(report["errors"][0]["line"], 10)
+        borehole = self.project.borehole.get(borehole_reference="A1")
+        self.assertEqual(borehole.borehole_diameter, 0)
+
+    def test_unreadable_file(self):
+        # The third line has a field longer than the csv module reads
+        content = "\n".join([
+            ",".join(formats.CSV_COLUMNS), "BH7,,,10,Rig,100,0,1,,,SPT,CLAY",
+            "BH7,,,10,Rig,100,1,2,,,SPT," + "x" * 200000
+        ])
+        response = self.upload("site.csv", content)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["line"], 3)
+        self.assertFalse(
+            self.project.borehole.filter(borehole_reference="BH7").exists())
+
+
+class ExportTestCase(TestCase):
+    """
+    Checks streaming exports of projects.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", "user@qlog.com", "pw")
+        self.client.force_login(self.user)
+        self.projects = seed(self.user, self.user, projects=2)
+        self.project = self.projects[0]
+        Borehole.objects.create(
+            logger=self.user, project=self.project, borehole_reference="BH9",
+            ground_level=1, drilling_equipment="Rig", borehole_diameter=100
+        )
+
+    def export(self, url, **headers):
+        response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content)
+
+    def test_csv(self):
+        content = self.export(f"/export/{self.project.id}").decode()
+        lines = content.splitlines()
+        self.assertEqual(lines[0].split(","), formats.EXPORT_COLUMNS)
+
+        # 3 boreholes with 4 layers and one borehole without layers
+        self.assertEqual(len(lines), 14)
+
+    def test_round_trip(self):
+        for format in ("csv", "ags"):
+            content = self.export(
+                f"/export/{self.project.id}?format={format}").decode()
+            project = Project.objects.create(
+                lead=self.user, project_title="Copy", project_reference="C",
+                project_client="C", project_description="D"
+            )
+            report = Importer(project, self.user).run(
+                formats.READERS[format](content.splitlines()))
+            self.assertEqual(report["error_count"], 0, report["errors"])
+            self.assertEqual(report["boreholes"], 4)
+            self.assertEqual(report["layers"], 12)
+            self.assertEqual(project.borehole.get(
+                borehole_reference="BH9").borehole_diameter, 100)
+
+    def test_gzip_ndjson_of_every_project(self):
+        content = self.export(
+            "/export/0?format=ndjson", HTTP_ACCEPT_ENCODING="gzip")
+        lines = gzip.decompress(content).decode().splitlines()
+        boreholes = [json.loads(line) for line in lines]
+        self.assertEqual(len(boreholes), 7)
+        self.assertEqual(boreholes[-1]["geology"][0]["end_depth"], "1.00")
+        self.assertEqual(boreholes[3]["geology"], [])
+
+    def test_gzip_refused(self):
+        for header in ("gzip;q=0", "br, *;q=0", "gzip; q=0.0, identity"):
+            response = self.client.get(
+                f"/export/{self.project.id}", HTTP_ACCEPT_ENCODING=header)
+            self.assertFalse(response.has_header("Content-Encoding"), header)
+        response = self.client.get(
+            f"/export/{self.project.id}", HTTP_ACCEPT_ENCODING="br;q=1, *")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+
+    def test_ags_of_several_projects(self):
+        # References such as BH1 repeat between projects
+        response = self.client.get("/export/0?format=ags")
+        self.assertEqual(response.status_code, 400)
+        with self.assertRaises(CommandError):
+            call_command("export_projects", format="ags", stdout=StringIO())
+
+    def test_filtered_projects(self):
+        url = f"/export/0?format=ndjson&projects={self.projects[1].id}"
+        lines = self.export(url).splitlines()
+        self.assertEqual(len(lines), 3)
+
+    def test_constant_queries(self):
+        url = f"/export/{self.project.id}"
+        with self.assertNumQueries(4):
+            self.export(url)
+        seed(self.user, self.user, projects=1, boreholes=10, layers=10)
+        Borehole.objects.filter(project__in=Project.objects.exclude(
+            id=self.project.id)).update(project=self.project)
+        with self.assertNumQueries(4):
+            self.export(url)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "export.ags.gz")
+            call_command(
+                "export_projects", self.project.id, format="ags", gzip=True,
+                output=path
+            )
+            with gzip.open(path, "rt") as file:
+                self.assertIn('"GROUP","GEOL"', file.read())
+
+
+class StreamingJsonTestCase(TestCase):
+    """
+    Checks streamed JSON arrays match the lists they replace.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", "user@qlog.com", "pw")
+        self.client.force_login(self.user)
+        self.project = seed(self.user, self.user, projects=1, layers=7)[0]
+        self.borehole = self.project.borehole.first()
+
+    def test_same_body_as_list(self):
+        layers = Geology.objects.filter(borehole=self.borehole)
+        layers = layers.order_by("geology_timestamp", "id")
+        response = self.client.get(f"/geology/{self.borehole.id}/0")
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            response.getvalue(),
+            JsonResponse(serialize_geology(layers), safe=False).content
+        )
+
+    def test_chunks(self):
+        sizes = []
+
+        def serializer(rows):
+            sizes.append(len(rows))
+            return serialize_geology(rows)
+
+        layers = Geology.objects.select_related("borehole").order_by("id")
+        response = StreamingJsonResponse(layers, serializer, chunk_size=5)
+        self.assertEqual(len(json.loads(response.getvalue())), 21)
+        self.assertEqual(sizes, [5, 5, 5, 5, 1])
+
+    def test_empty(self):
+        response = StreamingJsonResponse(User.objects.none(), serialize_users)
+        self.assertEqual(response.getvalue(), b"[]")
+
+    @override_settings(QLOG_RESPONSE_CACHE_MAX_BYTES=100)
+    def test_large_streams_are_not_cached(self):
+        url = f"/geology/{self.borehole.id}/0"
+        self.client.get(url).getvalue()
+        self.assertEqual(self.client.get(url)["X-Cache"], "MISS")
+
+
+class SearchTestCase(TestCase):
+    """
+    Checks the full text index stays in sync and the search endpoint.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", "user@qlog.com", "pw")
+        self.client.force_login(self.user)
+        self.projects = seed(self.user, self.user, projects=2)
+        self.project = self.projects[0]
+        self.borehole = self.project.borehole.first()
+        self.layer = Geology.objects.create(
+            borehole=self.borehole, start_depth=4, end_depth=5,
+            spt_result="N=50 refusal", field_test_details="SPT",
+            geology_description="Very stiff brown CLAYS with gravel"
+        )
+
+    def search(self, **params):
+        response = self.client.get("/search", params)
+        self.assertEqual(response.status_code, 200)
+        return [
+            (result["kind"], result["id"])
+            for result in response.json()["results"]
+        ]
+
+    def test_stemmed_words_in_any_column(self):
+        self.assertEqual(
+            self.search(q="stiff clay refusal"),
+            [("geology", self.layer.id)]
+        )
+
+    def test_ranking_and_scope(self):
+        self.assertEqual(len(self.search(q="stiff CLAY")), 20)
+
+        # Matches in longer text rank lower
+        results = self.search(q="clay", project=self.project.id)
+        self.assertEqual(len(results), 13)
+        self.assertEqual(results[-1], ("geology", self.layer.id))
+        other = self.projects[1].id
+        self.assertEqual(len(self.search(q="clay", project=other)), 12)
+        self.assertEqual(len(self.search(q="clay", user=999)), 0)
+
+    def test_pages(self):
+        response = self.client.get("/search", {"q": "clay"}).json()
+        self.assertTrue(response["has_next"])
+        second = self.search(q="clay", page=2)
+        self.assertEqual(len(second), 5)
+
+    def test_sync_with_writes(self):
+        self.layer.geology_description = "Loose SAND"
+        self.layer.save()
+        self.assertEqual(self.search(q="gravel"), [])
+        self.assertEqual(len(self.search(q="sand")), 1)
+
+        # References are searchable and follow renames
+        self.borehole.borehole_reference = "BH-NORTH"
+        self.borehole.save()
+        self.assertEqual(len(self.search(q="north sand")), 1)
+        message = Message.objects.create(
+            project=self.project, user=self.user, message="Rig broke down")
+        self.assertEqual(self.search(q="rig broke"), [("message", message.id)])
+        self.project.delete()
+        self.assertEqual(self.search(q="sand"), [])
+        self.assertEqual(self.search(q="rig"), [])
+
+    def test_operators_are_literal(self):
+        self.assertEqual(self.search(q='clay" OR "sand'), [])
+        self.assertEqual(len(self.search(q="cla*", page=2)), 5)
+
+    def test_rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM app_search")
+        call_command("rebuild_search", stdout=StringIO())
+        self.assertEqual(len(self.search(q="refusal")), 1)
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command("benchmark_search", "stiff clay", iterations=1,
+                     stdout=out)
+        results = json.loads(out.getvalue())
+        self.assertEqual(results["fts"]["rows"], 20)
+        self.assertEqual(results["icontains"]["rows"], 20)
+
+
+class SpatialTestCase(TestCase):
+    """
+    Checks bounding box and nearest neighbour queries against brute force.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", "user@qlog.com", "pw")
+        self.client.force_login(self.user)
+        self.projects = seed(
+            self.user, self.user, projects=2, boreholes=1, layers=0)
+        random = Random(4)
+        Borehole.objects.bulk_create([
+            Borehole(
+                logger=self.user, project=self.projects[n % 2],
+                borehole_reference=f"R{n}", ground_level=1,
+                drilling_equipment="Rig", borehole_diameter=100,
+                borehole_easting=round(random.uniform(-900, 900), 6),
+                borehole_northing=round(random.uniform(-900, 900), 6)
+            ) for n in range(300)
+        ])
+
+        # Boreholes without coordinates are never found
+        Borehole.objects.create(
+            logger=self.user, project=self.projects[0],
+            borehole_reference="NONE", ground_level=1,
+            drilling_equipment="Rig", borehole_diameter=100
+        )
+
+    def positions(self, project=None):
+        boreholes = Borehole.objects.exclude(borehole_easting=None)
+        if project is not None:
+            boreholes = boreholes.filter(project_id=project)
+        return [
+            (id, float(easting), float(northing))
+            for id, easting, northing in boreholes.values_list(
+                "id", "borehole_easting", "borehole_northing")
+        ]
+
+    def test_within(self):
+        response = self.client.get("/map/within", {"box": "-100,-200,300,50"})
+        data = response.json()
+        self.assertFalse(data["truncated"])
+        expected = [
+            id for id, easting, northing in self.positions()
+            if -100 <= easting <= 300 and -200 <= northing <= 50
+        ]
+        self.assertEqual([row[0] for row in data["boreholes"]], expected)
+
+        project = self.projects[1].id
+        response = self.client.get(
+            "/map/within", {"box": "-900,-900,900,900", "project": project})
+        self.assertEqual(
+            len(response.json()["boreholes"]), len(self.positions(project)))
+
+    def test_nearest(self):
+        for easting, northing, count in ((0, 0, 10), (850, -850, 25),
+                                         (5000, 5000, 3)):
+            response = self.client.get("/map/nearest", {
+                "easting": easting, "northing": northing, "count": count
+            })
+            expected = sorted(
+                self.positions(),
+                key=lambda row: math.hypot(row[1] - easting, row[2] - northing)
+            )[:count]
+            self.assertEqual(
+                [row[0] for row in response.json()["boreholes"]],
+                [row[0] for row in expected]
+            )
+
+    def test_index_follows_writes(self):
+        borehole = Borehole.objects.get(borehole_reference="NONE")
+        borehole.borehole_easting = 999
+        borehole.borehole_northing = 999
+        borehole.save()
+        rows = self.client.get("/map/nearest", {
+            "easting": 999, "northing": 999, "count": 1
+        }).json()["boreholes"]
+        self.assertEqual(rows[0][0], borehole.id)
+        borehole.delete()
+        rows = self.client.get(
+            "/map/within", {"box": "998,998,999,999"}).json()["boreholes"]
+        self.assertEqual(rows, [])
+
+    def test_invalid_box(self):
+        response = self.client.get("/map/within", {"box": "1,2,0,3"})
+        self.assertEqual(response.status_code, 400)
+        for box in ("nan,0,1,1", "0,0,inf,1", "-inf,-inf,inf,inf"):
+            response = self.client.get("/map/within", {"box": box})
+            self.assertEqual(response.status_code, 400)
+
+    def test_invalid_point(self):
+        for easting, northing in (("nan", 0), (0, "inf"), ("-inf", "nan")):
+            response = self.client.get("/map/nearest", {
+                "easting": easting, "northing": northing
+            })
+            self.assertEqual(response.status_code, 400)
+
+    def test_nearest_far_away(self):
+        with CaptureQueriesContext(connection) as queries:
+            rows = spatial.nearest(1e300, -1e300, 1)["boreholes"]
+        self.assertEqual(len(rows), 1)
+        self.assertLessEqual(len(queries), 3)
+
+
+class ClusterTestCase(TestCase):
+    """
+    Checks map clusters stay in step with the boreholes they count.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", "user@qlog.com", "pw")
+        self.client.force_login(self.user)
+        self.projects = seed(
+            self.user, self.user, projects=2, boreholes=1, layers=0)
+        random = Random(5)
+        Borehole.objects.bulk_create([
+            Borehole(
+                logger=self.user, project=self.projects[n % 2],
+                borehole_reference=f"C{n}", ground_level=1,
+                drilling_equipment="Rig", borehole_diameter=100,
+                borehole_easting=round(random.uniform(-900, 900), 6),
+                borehole_northing=round(random.uniform(-900, 900), 6)
+            ) for n in range(500)
+        ])
+
+    def get(self, zoom, box, **params):
+        response = self.client.get("/map/clusters", {
+            "zoom": zoom, "box": ",".join(str(value) for value in box),
+            **params
+        })
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def expected(self, size, project=None):
+        """
+        Counts the boreholes in each cell of a level by brute force.
+        """
+        boreholes = Borehole.objects.exclude(borehole_easting=None)
+        if project is not None:
+            boreholes = boreholes.filter(project_id=project)
+        cells = {}
+        for easting, northing in boreholes.values_list(
+                "borehole_easting", "borehole_northing"):
+            key = (
+                int((float(easting) + 1000) // size),
+                int((float(northing) + 1000) // size)
+            )
+            cells[key] = cells.get(key, 0) + 1
+        return sorted(cells.values())
+
+    def test_counts(self):
+        data = self.get(2, (-1000, -1000, 1000, 1000))
+        self.assertEqual(data["level"], 2)
+        self.assertEqual(
+            sorted(row[0] for row in data["clusters"]), self.expected(500))
+        self.assertEqual(
+            sum(row[0] for row in data["clusters"]),
+            Borehole.objects.exclude(borehole_easting=None).count()
+        )
+
+        project = self.projects[1].id
+        data = self.get(4, (-1000, -1000, 1000, 1000), project=project)
+        self.assertEqual(
+            sorted(row[0] for row in data["clusters"]),
+            self.expected(125, project)
+        )
+
+    def test_bounded(self):
+        # A whole map view at the deepest zoom uses a coarser level
+        data = self.get(16, (-1000, -1000, 1000, 1000))
+        self.assertLessEqual(data["level"], 5)
+        self.assertLessEqual(
+            len(data["clusters"]), (clusters.GRID + 1) ** 2)
+
+    def test_follows_writes(self):
+        borehole = Borehole.objects.get(borehole_reference="C0")
+        borehole.borehole_easting = 999
+        borehole.borehole_northing = 999
+        borehole.save()
+        data = self.get(16, (998, 998, 999.5, 999.5))
+        self.assertEqual(data["clusters"], [[1, 999.0, 999.0, [borehole.id]]])
+
+        Borehole.objects.filter(borehole_reference="C1").delete()
+        self.assertEqual(
+            sorted(row[0] for row in self.get(
+                3, (-1000, -1000, 1000, 1000))["clusters"]),
+            self.expected(250)
+        )
+
+        borehole.delete()
+        data = self.get(16, (998, 998, 999.5, 999.5))
+        self.assertEqual(data["clusters"], [])
+
+    def test_sample_refilled(self):
+        project = seed(
+            self.user, self.user, projects=1, boreholes=0, layers=0)[0]
+        ids = [
+            Borehole.objects.create(
+                logger=self.user, project=project,
+                borehole_reference=f"S{n}", ground_level=1,
+                drilling_equipment="Rig", borehole_diameter=100,
+                borehole_easting=500 + n / 1000, borehole_northing=500
+            ).id for n in range(6)
+        ]
+
+        # Deleting or moving the sampled boreholes samples the others
+        Borehole.objects.filter(id__in=ids[:2]).delete()
+        Borehole.objects.filter(id=ids[2]).update(borehole_easting=-500)
+        box = (499, 499, 501, 501)
+        for zoom in (4, 8, 16):
+            rows = self.get(zoom, box, project=project.id)["clusters"]
+            self.assertEqual([row[0] for row in rows], [3])
+            self.assertEqual(rows[0][3], ids[3:])
+
+    def test_rebuild(self):
+        before = self.get(6, (-500, -500, 500, 500))
+        call_command("rebuild_clusters", stdout=StringIO())
+        after = self.get(6, (-500, -500, 500, 500))
+        self.assertEqual(
+            [row[:3] for row in after["clusters"]],
+            [row[:3] for row in before["clusters"]]
+        )
+
+    def test_invalid_inputs(self):
+        response = self.client.get(
+            "/map/clusters", {"zoom": "-1", "box": "0,0,1,1"})
+        self.assertEqual(response.status_code, 400)
+        for box in ("-inf,0,1,1", "0,0,inf,1", "0,nan,1,1", "1,0,0,1"):
+            response = self.client.get(
+                "/map/clusters", {"zoom": "3", "box": box})
+            self.assertEqual(response.status_code, 400)
+
+    def test_outside_positions(self):
+        # Views reaching past the possible positions find the same cells
+        inside = self.get(2, (-1000, -1000, 1000, 1000))
+        outside = self.get(2, (-5000, -5000, 5000, 5000))
+        self.assertEqual(outside, inside)
+        self.assertEqual(
+            sum(row[0] for row in outside["clusters"]),
+            Borehole.objects.exclude(borehole_easting=None).count()
+        )
+
+
+class IntervalTestCase(TestCase):
+    """
+    Checks depth and elevation interval queries against brute force.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", "user@qlog.com", "pw")
+        self.client.force_login(self.user)
+        self.projects = seed(
+            self.user, self.user, projects=2, boreholes=4, layers=6)
+
+        # Rock at a different depth in each borehole of the first project
+        for n, borehole in enumerate(self.projects[0].borehole.order_by("id")):
+            Geology.objects.filter(
+                borehole=borehole, start_depth__gte=n + 2
+            ).update(geology_description="Weathered granite ROCK")
+            Borehole.objects.filter(id=borehole.id).update(ground_level=n)
+
+    def get(self, project, **params):
+        response = self.client.get(f"/intervals/{project.id}", params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_depth(self):
+        data = self.get(self.projects[0], depth="2.5,3.5")
+        expected = Geology.objects.filter(
+            borehole__project=self.projects[0],
+            start_depth__lte=3.5, end_depth__gte=2.5
+        ).order_by("borehole_id", "start_depth")
+        self.assertEqual(
+            [row[0] for row in data["layers"]],
+            [layer.id for layer in expected]
+        )
+        self.assertFalse(data["truncated"])
+
+    def test_elevation(self):
+        # Ground levels were changed after the layers were indexed
+        data = self.get(self.projects[0], elevation="-1,0")
+        expected = [
+            layer.id for layer in Geology.objects.filter(
+                borehole__project=self.projects[0]
+            ).select_related("borehole").order_by(
+                "borehole_id", "start_depth")
+            if layer.borehole.ground_level - layer.end_depth <= 0
+            and layer.borehole.ground_level - layer.start_depth >= -1
+        ]
+        self.assertEqual([row[0] for row in data["layers"]], expected)
+        for row in data["layers"]:
+            self.assertLessEqual(row[6], 0)
+            self.assertGreaterEqual(row[5], -1)
+
+    def test_first_rock(self):
+        data = self.get(self.projects[0], q="rock", first="1")
+        self.assertEqual(
+            [(row[2], row[3]) for row in data["layers"]],
+            [("BH0", 2), ("BH1", 3), ("BH2", 4), ("BH3", 5)]
+        )
+        self.assertEqual(self.get(self.projects[1], q="rock")["layers"], [])
+
+    def test_follows_writes(self):
+        layer = Geology.objects.filter(
+            borehole__project=self.projects[1]).first()
+        layer.start_depth = 50
+        layer.end_depth = 60
+        layer.save()
+        data = self.get(self.projects[1], depth="55,56")
+        self.assertEqual([row[0] for row in data["layers"]], [layer.id])
+        layer.delete()
+        self.assertEqual(
+            self.get(self.projects[1], depth="55,56")["layers"], [])
+
+    def test_invalid_inputs(self):
+        response = self.client.get(
+            f"/intervals/{self.projects[0].id}", {"depth": "5,1"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get("/intervals/0")
+        self.assertEqual(response.status_code, 400)
+
+
+class SectionTestCase(TestCase):
+    """
+    Checks cross sections against boreholes placed along a known line.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", "user@qlog.com", "pw")
+        self.client.force_login(self.user)
+        self.project = seed(
+            self.user, self.user, projects=1, boreholes=0, layers=0)[0]
+
+        # Boreholes either side of an L shaped line and one far from it
+        self.boreholes = []
+        for ref, easting, northing, ground in (
+                ("S1", 10, 5, 20), ("S2", 60, -5, 18), ("S3", 105, 40, 15),
+                ("FAR", 50, 200, 10)):
+            borehole = Borehole.objects.create(
+                logger=self.user, project=self.project,
+                borehole_reference=ref, borehole_easting=easting,
+                borehole_northing=northing, ground_level=ground,
+                drilling_equipment="Rig", borehole_diameter=100
+            )
+            self.boreholes.append(borehole)
+            Geology.objects.bulk_create([
+                Geology(
+                    borehole=borehole, start_depth=0, end_depth=2,
+                    field_test_details="", geology_description="Made ground"
+                ),
+                Geology(
+                    borehole=borehole, start_depth=2, end_depth=6,
+                    field_test_details="", geology_description="Stiff CLAY"
+                )
+            ])
+        self.url = f"/section/{self.project.id}"
+        self.line = {"line": "0,0,100,0,100,100", "buffer": 10}
+
+    def test_section(self):
+        data = self.client.get(self.url, self.line).json()
+        self.assertEqual(data["length"], 200)
+        self.assertEqual(
+            [row[1:4] for row in data["boreholes"]],
+            [["S1", 10, 5], ["S2", 60, -5], ["S3", 140, -5]]
+        )
+        strata = {row["description"]: row for row in data["strata"]}
+        clay = strata["Stiff CLAY"]
+        self.assertEqual(clay["borehole"], [0, 1, 2])
+        self.assertEqual(clay["chainage"], [10, 60, 140])
+        self.assertEqual(clay["top"], [18, 16, 13])
+        self.assertEqual(clay["bottom"], [14, 12, 9])
+
+    def test_cached_by_project_version(self):
+        response = self.client.get(self.url, self.line)
+        self.assertEqual(response["X-Cache"], "MISS")
+        response = self.client.get(self.url, self.line)
+        self.assertEqual(response["X-Cache"], "HIT")
+
+        borehole = self.boreholes[0]
+        borehole.ground_level = 30
+        borehole.save()
+        response = self.client.get(self.url, self.line)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["boreholes"][0][4], 30)
+
+    def test_invalid_line(self):
+        for line in ("0,0", "0,0,1", "0,0,a,1"):
+            response = self.client.get(self.url, {"line": line})
+            self.assertEqual(response.status_code, 400)
+
+
+class SurfaceTestCase(TestCase):
+    """
+    Checks stratum surfaces interpolate between and honour boreholes.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", "user@qlog.com", "pw")
+        self.client.force_login(self.user)
+        self.project = seed(
+            self.user, self.user, projects=1, boreholes=0, layers=0)[0]
+
+        # Clay is reached 2 m down, the ground rising to the east
+        for easting, northing, ground in ((0, 0, 10), (100, 0, 20),
+                                          (0, 100, 10), (100, 100, 20)):
+            borehole = Borehole.objects.create(
+                logger=self.user, project=self.project,
+                borehole_reference=f"S{easting}{northing}",
+                borehole_easting=easting, borehole_northing=northing,
+                ground_level=ground, drilling_equipment="Rig",
+                borehole_diameter=100
+            )
+            Geology.objects.bulk_create([
+                Geology(
+                    borehole=borehole, start_depth=0, end_depth=2,
+                    field_test_details="", geology_description="Topsoil"
+                ),
+                Geology(
+                    borehole=borehole, start_depth=2, end_depth=6,
+                    field_test_details="", geology_description="Firm CLAY"
+                )
+            ])
+        self.url = f"/surface/{self.project.id}"
+
+    def test_surface(self):
+        response = self.client.get(
+            self.url, {"stratum": "clay", "resolution": 25})
+        data = response.json()
+        self.assertEqual((data["rows"], data["columns"]), (5, 5))
+        self.assertEqual(data["control_points"], 4)
+        self.assertEqual(data["origin"], [0, 0])
+
+        # Nodes on boreholes take their value, the middle is the mean
+        self.assertEqual(data["values"][0][0], 8)
+        self.assertEqual(data["values"][4][4], 18)
+        self.assertEqual(data["values"][2][2], 13)
+        self.assertEqual((data["min"], data["max"]), (8, 18))
+
+    def test_binary_window_from_cache(self):
+        params = {"stratum": "clay", "resolution": 25}
+        response = self.client.get(self.url, params)
+        self.assertEqual(response["X-Cache"], "MISS")
+        response = self.client.get(self.url, dict(
+            params, window="3,0,4,1", format="binary"))
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(response["X-Surface-Shape"], "2,2")
+        self.assertEqual(response["X-Surface-Origin"], "75.0,0.0")
+        values = list(memoryview(response.content).cast("f"))
+        self.assertEqual(len(values), 4)
+        self.assertEqual(values[1], 18)
+
+        # Changing the project builds a new grid
+        Borehole.objects.filter(borehole_easting=0).first().save()
+        response = self.client.get(self.url, params)
+        self.assertEqual(response["X-Cache"], "MISS")
+
+    def test_invalid_inputs(self):
+        for params in ({}, {"stratum": "clay", "resolution": 0},
+                       {"stratum": "clay", "resolution": 0.01},
+                       {"stratum": "clay", "resolution": 1e-300}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 400)
+
+    def test_chunked(self):
+        # Chunks of a single node give the same grid as one chunk
+        points = surfaces.control_points(self.project.id, "clay")
+        axis = [0, 25, 50, 75, 100]
+        whole = surfaces.interpolate(points, axis, axis)
+        with mock.patch.object(surfaces, "CHUNK_ENTRIES", 1):
+            chunked = surfaces.interpolate(points, axis, axis)
+        self.assertEqual(whole.tolist(), chunked.tolist())
+
+    def test_stratum_not_reached(self):
+        data = self.client.get(self.url, {"stratum": "rock"}).json()
+        self.assertEqual(data["control_points"], 0)
+        self.assertEqual(data["values"], [])
+
+
+class SptTestCase(TestCase):
+    """
+    Checks SPT results are parsed on every write and can be filtered and
+    summarised.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", "user@qlog.com", "pw")
+        self.client.force_login(self.user)
+        self.project = seed(
+            self.user, self.user, projects=1, boreholes=2, layers=0)[0]
+        self.borehole = self.project.borehole.order_by("id").first()
+        results = [
+            "2,3/4,5,6,7 N=22", "50/75mm", "1,2/3,3,4,4", "N=8", "", "N=35",
+            "5,6/10,12,15,50/25mm"
+        ]
+        Geology.objects.bulk_create([
+            Geology(
+                borehole=self.borehole, start_depth=n, end_depth=n + 1,
+                spt_result=result, field_test_details="SPT",
+                geology_description="Dense SAND" if n % 2 else "Stiff CLAY"
+            ) for n, result in enumerate(results)
+        ])
+
+    def test_parse(self):
+        self.assertEqual(
+            spt.parse("2,3/4,5,6,7 N=22"),
+            spt.SPT(22, "2,3,4,5,6,7", 300, False)
+        )
+        self.assertEqual(spt.parse("50/75mm"), spt.SPT(50, "50", 75, True))
+        self.assertEqual(
+            spt.parse("N=50/75mm"), spt.SPT(50, "50", 75, True))
+        self.assertEqual(
+            spt.parse("1,2/3,3,4,4"), spt.SPT(14, "1,2,3,3,4,4", 300, False))
+        self.assertEqual(
+            spt.parse("5,6/10,12,15,50/25mm"),
+            spt.SPT(87, "5,6,10,12,15,50", 250, True)
+        )
+        self.assertEqual(spt.parse(None), spt.SPT(None, "", None, False))
+
+    def test_parsed_on_write(self):
+        layers = Geology.objects.filter(
+            borehole=self.borehole).order_by("start_depth")
+        self.assertEqual(
+            [layer.spt_n for layer in layers], [22, 50, 14, 8, None, 35, 87])
+
+        layer = layers[4]
+        layer.spt_result = "N=12"
+        layer.save()
+        layer.refresh_from_db()
+        self.assertEqual(layer.spt_n, 12)
+
+        # Bulk updates of the result update the parsed columns too
+        layer.spt_result = "25/100mm"
+        Geology.objects.bulk_update([layer], ["spt_result"])
+        layer.refresh_from_db()
+        self.assertEqual((layer.spt_n, layer.spt_refusal), (25, True))
+
+    def test_backfill(self):
+        Geology.objects.update(spt_n=None, spt_blows="")
+        call_command("parse_spt", batch_size=3, stdout=StringIO())
+        self.assertEqual(
+            Geology.objects.filter(spt_n=None).count(),
+            Geology.objects.filter(spt_result="").count()
+        )
+        self.assertTrue(Geology.objects.filter(spt_blows="2,3,4,5,6,7"))
+
+    def test_filter(self):
+        url = f"/spt/{self.project.id}"
+        data = self.client.get(url, {"min": 30}).json()
+        self.assertEqual([row[5] for row in data["layers"]], [50, 35, 87])
+        data = self.client.get(url, {"min": 30, "refusal": 1}).json()
+        self.assertEqual([row[5] for row in data["layers"]], [50, 87])
+        data = self.client.get(url, {"max": 20, "depth": "0,3"}).json()
+        self.assertEqual([row[5] for row in data["layers"]], [14, 8])
+        response = self.client.get(url, {"min": "many"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_statistics(self):
+        data = self.client.get(
+            f"/spt/{self.project.id}/statistics", {"band": 2}).json()
+        self.assertEqual(data["count"], 6)
+        self.assertEqual(
+            [band["top"] for band in data["depth_bands"]], [0, 2, 4, 6])
+        self.assertEqual(
+            [band["count"] for band in data["depth_bands"]], [2, 2, 1, 1])
+
+        values = [22, 14, 87]
+        strata = {row["description"]: row for row in data["strata"]}
+        clay = strata["stiff clay"]
+        self.assertEqual(clay["count"], 3)
+        self.assertEqual(clay["mean"], round(sum(values) / 3, 2))
+        self.assertEqual(data["percentiles"], [10, 25, 50, 75, 90])
+        self.assertEqual(clay["values"], [15.6, 18, 22, 54.5, 74])
+
+
+class StripLogTestCase(TestCase):
+    """
+    Checks strip logs are rendered once per version of a borehole.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", "user@qlog.com", "pw")
+        self.client.force_login(self.user)
+        self.project = seed(
+            self.user, self.user, projects=1, boreholes=2, layers=4)[0]
+        self.borehole = self.project.borehole.order_by("id").first()
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=self.media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+    def logs(self):
+        directory = os.path.join(
+            self.media.name, "strip_logs", str(self.borehole.id))
+        return sorted(os.listdir(directory))
+
+    def test_png(self):
+        response = self.client.get(f"/log/{self.borehole.id}")
+        self.assertEqual(response["Content-Type"], "image/png")
+        content = b"".join(response.streaming_content)
+        self.assertTrue(content.startswith(b"\x89PNG"))
+        self.assertEqual(len(self.logs()), 1)
+
+        # The same version is served from the rendered file
+        response = self.client.get(f"/log/{self.borehole.id}")
+        b"".join(response.streaming_content)
+        self.assertEqual(len(self.logs()), 1)
+
+    def test_new_version(self):
+        self.client.get(f"/log/{self.borehole.id}")
+        before = self.logs()
+        Geology.objects.create(
+            borehole=self.borehole, start_depth=4, end_depth=6,
+            spt_result="50/75mm", field_test_details="SPT",
+            geology_description="Weathered <granite> & sand"
+        )
+        response = self.client.get(f"/log/{self.borehole.id}?format=svg")
+        content = b"".join(response.streaming_content).decode()
+        self.assertIn("&lt;granite&gt; &amp; sand", content)
+        self.assertIn('fill="red"', content)
+
+        # Older versions are removed once a new one is rendered
+        self.client.get(f"/log/{self.borehole.id}")
+        self.assertEqual(len(self.logs()), 2)
+        self.assertNotEqual(self.logs(), before)
+
+    def test_project_renamed(self):
+        self.client.get(f"/log/{self.borehole.id}?format=svg")
+        self.project.project_reference = "Renamed"
+        self.project.save()
+        response = self.client.get(f"/log/{self.borehole.id}?format=svg")
+        content = b"".join(response.streaming_content).decode()
+        self.assertIn("Renamed", content)
+        self.assertEqual(len(self.logs()), 1)
+
+    def test_removed_while_serving(self):
+        # A log removed by a newer render is drawn again for the request
+        with mock.patch.object(
+                views.default_storage, "open", side_effect=FileNotFoundError):
+            response = self.client.get(f"/log/{self.borehole.id}")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content.startswith(b"\x89PNG"))
+
+    def test_command(self):
+        output = StringIO()
+        call_command(
+            "render_strip_logs", self.project.id, workers=1, stdout=output)
+        self.assertIn("Rendered 2 strip logs", output.getvalue())
+        with self.assertRaises(CommandError):
+            call_command("render_strip_logs", 0, stdout=StringIO())
+
+    def test_unknown_format(self):
+        response = self.client.get(f"/log/{self.borehole.id}?format=gif")
+        self.assertEqual(response.status_code, 400)
+
+
+class JobTestCase(TestCase):
+    """
+    Checks the job queue and project reports built with it.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", "user@qlog.com", "pw")
+        self.client.force_login(self.user)
+        self.project = seed(
+            self.user, self.user, projects=1, boreholes=3, layers=3)[0]
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=self.media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+    def test_report(self):
+        response = self.client.post(f"/report/{self.project.id}")
+        self.assertEqual(response.status_code, 201)
+        url = f"/jobs/{response.json()['job']['id']}"
+        self.assertEqual(self.client.get(url).json()["status"], "queued")
+
+        output = StringIO()
+        call_command("run_jobs", workers=1, once=True, stdout=output)
+
+        # The report, its three logs and the report again once they ran
+        self.assertIn("Ran 5 jobs", output.getvalue())
+        data = self.client.get(url).json()
+        self.assertEqual(data["status"], "done")
+        self.assertEqual((data["progress"], data["total"]), (3, 3))
+        self.assertEqual(data["result"]["logs"], 3)
+
+        name = data["result"]["file"].replace(settings.MEDIA_URL, "", 1)
+        with zipfile.ZipFile(os.path.join(self.media.name, name)) as report:
+            names = report.namelist()
+            self.assertIn("report.html", names)
+            self.assertIn("boreholes.csv", names)
+            self.assertEqual(
+                len([name for name in names if name.startswith("logs/")]), 3)
+
+    def test_failed_children(self):
+        job = jobs.enqueue("report", self.user, project=self.project.id)
+        jobs.run(jobs.claim())
+        child = job.children.order_by("id").first()
+        child.arguments = json.dumps({"borehole": "missing"})
+        child.save()
+        jobs.work(once=True)
+
+        job.refresh_from_db()
+        child.refresh_from_db()
+        self.assertEqual(child.status, "failed")
+        self.assertIn("Traceback", child.error)
+        self.assertEqual(job.status, "done")
+        self.assertEqual(json.loads(job.result)["failed"], ["missing"])
+
+    def test_claimed_once(self):
+        jobs.enqueue("strip_log", self.user, borehole=0)
+        claimed = jobs.claim()
+        self.assertEqual(claimed.status, "running")
+        self.assertIsNone(jobs.claim())
+
+    def test_stopped_worker(self):
+        job = jobs.enqueue("report", self.user, project=self.project.id)
+        jobs.run(jobs.claim())
+        child = jobs.claim()
+        self.assertEqual(child.attempts, 1)
+
+        # A running job whose lease ran out is claimed again
+        expired = timezone.now() - timedelta(seconds=settings.QLOG_JOB_LEASE)
+        Job.objects.filter(id=child.id).update(claimed_at=expired)
+        self.assertEqual(jobs.claim().id, child.id)
+
+        # Until it was claimed too often, then it fails and the parent ends
+        Job.objects.filter(id=child.id).update(
+            claimed_at=expired, attempts=jobs.MAX_ATTEMPTS)
+        jobs.work(once=True)
+        child.refresh_from_db()
+        job.refresh_from_db()
+        self.assertEqual(child.status, "failed")
+        self.assertIn("Worker stopped", child.error)
+        self.assertEqual(job.status, "done")
+        self.assertEqual(len(json.loads(job.result)["failed"]), 1)
+
+    def test_other_users_jobs(self):
+        other = User.objects.create_user("other", "other@qlog.com", "pw")
+        job = jobs.enqueue("report", other, project=self.project.id)
+        response = self.client.get(f"/jobs/{job.id}")
+        self.assertEqual(response.status_code, 400)
+
+
+class SketchTestCase(TestCase):
+    """
+    Checks sketches are stored by content and old ones collected later.
+    """
+
+    @staticmethod
+    def image(colour="white", format="PNG"):
+        output = BytesIO()
+        Image.new("RGB", (40, 30), colour).save(output, format)
+        return output.getvalue()
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", "user@qlog.com", "pw")
+        self.client.force_login(self.user)
+        self.projects = seed(
+            self.user, self.user, projects=2, boreholes=0, layers=0)
+        self.url = f"/sketch/{self.projects[0].id}"
+        self.PNG = self.image()
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=self.media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+    def files(self):
+        return sorted(os.listdir(
+            os.path.join(self.media.name, "project_sketch")))
+
+    def test_uploads(self):
+        # Raw, multipart and data URI uploads of one image share a file
+        response = self.client.post(
+            self.url, self.PNG, content_type="image/png")
+        self.assertEqual(response.status_code, 201)
+        upload = SimpleUploadedFile("s.png", self.PNG, "image/png")
+        response = self.client.post(
+            f"/sketch/{self.projects[1].id}", {"sketch": upload})
+        self.assertEqual(response.status_code, 201)
+        data_uri = "data:image/png;base64," + \
+            base64.b64encode(self.PNG).decode()
+        response = self.client.post(
+            self.url, {"dataURI": data_uri}, content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(len(self.files()), 1)
+        url = self.client.get(self.url).json()["img"]
+        self.assertTrue(url.endswith(
+            hashlib.sha256(self.PNG).hexdigest() + ".png"))
+
+    def test_collected_later(self):
+        self.client.post(self.url, self.PNG, content_type="image/png")
+        self.client.post(
+            self.url, self.image("black"), content_type="image/png")
+        self.assertEqual(len(self.files()), 2)
+
+        # Files are only collected once they are old enough
+        jobs.work(once=True)
+        self.assertEqual(len(self.files()), 2)
+        old = os.path.join(
+            self.media.name, "project_sketch",
+            hashlib.sha256(self.PNG).hexdigest() + ".png"
+        )
+        os.utime(old, (0, 0))
+        jobs.enqueue("collect_sketches")
+        jobs.work(once=True)
+        self.assertEqual(len(self.files()), 1)
+        self.assertFalse(os.path.exists(old))
+
+    def test_invalid(self):
+        with override_settings(QLOG_SKETCH_MAX_BYTES=len(self.PNG) - 1):
+            response = self.client.post(
+                self.url, self.PNG, content_type="image/png")
+        self.assertEqual(response.json()["error"], "Sketch too large.")
+        response = self.client.post(
+            self.url, b"text", content_type="text/plain")
+        self.assertEqual(response.status_code, 400)
+        upload = SimpleUploadedFile("s.png", b"", "image/png")
+        response = self.client.post(self.url, {"sketch": upload})
+        self.assertEqual(response.json()["error"], "Sketch is empty.")
+
+    def test_not_an_image(self):
+        # Neither bytes which are not an image nor an image of another
+        # type are stored
+        for content, error in (
+                (b"\x89PNG\r\n\x1a\n" + b"<script>" * 100,
+                 "Sketch is not a valid image."),
+                (self.image(format="GIF"),
+                 "Sketch does not match its image type.")):
+            response = self.client.post(
+                self.url, content, content_type="image/png")
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()["error"], error)
+        self.assertFalse(os.path.exists(
+            os.path.join(self.media.name, "project_sketch")))
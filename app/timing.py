@@ -0,0 +1,83 @@
+import threading
+import time
+from functools import wraps
+
+
+_local = threading.local()
+
+
+class RequestTimer:
+    """
+    Collects the time spent in each section of a single request.
+    Also records every SQL statement with its duration when installed as
+    a database execute wrapper.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.view_start = None
+        self.sections = {}
+        self.queries = []
+
+    def add(self, name, duration):
+        self.sections[name] = self.sections.get(name, 0) + duration
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((time.perf_counter() - start, sql))
+
+    @property
+    def db_time(self):
+        return sum(duration for duration, sql in self.queries)
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.start
+
+    def worst_queries(self, count):
+        """
+        Returns the slowest statements as (milliseconds, sql) pairs.
+        """
+        queries = sorted(self.queries, key=lambda query: -query[0])
+        return [
+            (round(duration * 1000, 3), sql)
+            for duration, sql in queries[:count]
+        ]
+
+
+def current():
+    """
+    Returns the timer of the request being handled by this thread, if any.
+    """
+    return getattr(_local, "timer", None)
+
+
+def activate(timer):
+    _local.timer = timer
+
+
+def deactivate():
+    _local.timer = None
+
+
+def timed(name):
+    """
+    Decorator adding the run time of a function to the current request
+    timer under name. Does nothing outside of a timed request.
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            timer = current()
+            if timer is None:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                timer.add(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
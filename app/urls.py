@@ -27,5 +27,47 @@ urlpatterns = [
         "message/<int:project_id>/<int:page_number>",
         views.message,
         name="message"
-    )
+    ),
+    path("bundle/<int:project_id>", views.bundle, name="bundle"),
+    path("batch", views.batch, name="batch"),
+    path(
+        "import/<int:project_id>",
+        views.import_boreholes,
+        name="import_boreholes"
+    ),
+    path(
+        "export/<int:project_id>",
+        views.export_projects,
+        name="export_projects"
+    ),
+    path("search", views.search, name="search"),
+    path("map/within", views.map_within, name="map_within"),
+    path("map/nearest", views.map_nearest, name="map_nearest"),
+    path("map/clusters", views.map_clusters, name="map_clusters"),
+    path("intervals/<int:project_id>", views.intervals, name="intervals"),
+    path(
+        "section/<int:project_id>",
+        views.cross_section,
+        name="cross_section"
+    ),
+    path(
+        "surface/<int:project_id>",
+        views.stratum_surface,
+        name="stratum_surface"
+    ),
+    path("log/<int:borehole_id>", views.borehole_log, name="borehole_log"),
+    path("spt/<int:project_id>", views.spt_layers, name="spt_layers"),
+    path(
+        "spt/<int:project_id>/statistics",
+        views.spt_statistics,
+        name="spt_statistics"
+    ),
+    path(
+        "report/<int:project_id>",
+        views.project_report,
+        name="project_report"
+    ),
+    path("jobs/<int:job_id>", views.job, name="job"),
+    path("changes", views.changes, name="changes"),
+    path("metrics", views.metrics, name="metrics")
 ]
@@ -1,18 +1,80 @@
+import io
 import os
 import json
+import math
 import base64
-import time
+import binascii
 
 from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
 from django.shortcuts import render
 from django.contrib.auth import authenticate, login, logout
-from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
+from django.http import (
+    FileResponse, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+)
 from django.urls import reverse
+from django.utils.cache import patch_vary_headers
 from django.core.paginator import Paginator
 
-from .models import User, Project, Borehole, Geology, Message
+from .batch import InvalidBatch, submit
+from .cache import cache_response
+from .clusters import clusters
+from .conditional import (
+    conditional, projects_validator, profile_validator, borehole_validator,
+    geology_validator, sketch_validator, message_validator, bundle_validator
+)
+from .http import JsonResponse, StreamingJsonResponse, accepts_gzip
+from .metrics import registry, SKETCH_UPLOAD_BYTES
+from .models import User, Project, Borehole, Geology, Message, Job
+from .exporter import EXPORTS, export
+from .formats import READERS, InvalidFile
 from .forms import ProjectForm, BoreholeForm, GeologyForm, MessageForm
+from .importer import Importer
+from .intervals import layers
+from .jobs import enqueue
+from .pagination import InvalidCursor, cursor_page
+from .penetration import filter_layers, statistics
+from .search import find
+from .sections import VERTEX_LIMIT, section
+from .serializers import (
+    serialize_users, serialize_projects, serialize_boreholes,
+    serialize_boreholes_with_geology, serialize_geology, serialize_messages,
+    select_fields
+)
+from .sketches import (
+    CHUNK_SIZE, SKETCH_TYPES, InvalidSketch, replace, store
+)
+from .spatial import NEAREST_LIMIT, nearest, within
+from .striplogs import LOG_FORMATS, draw, strip_log
+from .surfaces import InvalidSurface, surface
+from .sync import changes_since
+
+
+# Parts of a project bundle which can be requested with ?include=
+BUNDLE_SECTIONS = ["project", "boreholes", "geology", "sketch", "messages"]
+
+
+def cursor_response(request, queryset, field, key, serializer,
+                    descending=False, extra=None):
+    """
+    Returns a keyset paginated JSON response for a queryset.
+    Used instead of page numbers when a "cursor" is in the query string.
+    An empty cursor requests the first page and "total=1" requests an
+    approximate row count. Any extra data is added to the response.
+    """
+    try:
+        page = cursor_page(
+            queryset,
+            field,
+            token=request.GET.get("cursor", ""),
+            descending=descending,
+            total=request.GET.get("total") == "1"
+        )
+    except InvalidCursor:
+        return JsonResponse({"error": "Invalid cursor."}, status=400)
+
+    page[key] = serializer(page.pop("rows"))
+    page.update(extra or {})
+    return JsonResponse(page)
 
 
 def index(request):
@@ -27,6 +89,10 @@ def index(request):
         return HttpResponseRedirect(reverse("login"))
 
 
+@conditional(projects_validator)
+@cache_response(lambda project_id, page_number=1: [
+    "projects" if project_id == 0 else f"project:{project_id}"
+])
 def projects(request, project_id, page_number=1):
     """
     This function deals with everything to do with project models.
@@ -45,15 +111,22 @@ def projects(request, project_id, page_number=1):
 
             # If project_id == 0, this is a singal that all projects requested
             if project_id == 0:
-                projects = Project.objects.order_by(
-                    "-project_timestamp").all()
+                projects = Project.objects.select_related("lead")
+                projects = projects.order_by("-project_timestamp").all()
+
+                # Keyset pagination if client sent a cursor
+                if "cursor" in request.GET:
+                    return cursor_response(
+                        request, projects, "project_timestamp", "projects",
+                        serialize_projects, descending=True
+                    )
 
                 # Paginator before returning JSON object
                 paginator = Paginator(projects, 5)
                 page_obj = paginator.get_page(page_number)
 
                 return JsonResponse(data={
-                    "projects": [project.serialize() for project in page_obj],
+                    "projects": serialize_projects(page_obj.object_list),
                     "total_pages": paginator.num_pages,
                     "current_page": page_obj.number,
                     "has_prev": page_obj.has_previous(),
@@ -62,18 +135,28 @@ def projects(request, project_id, page_number=1):
 
             # Single project requested with all borehole information
             else:
-                project = Project.objects.filter(id=project_id).first()
-                boreholes = project.borehole.order_by(
-                    "borehole_timestamp").all()
+                project = Project.objects.select_related("lead")
+                project = project.filter(id=project_id).first()
+                boreholes = project.borehole.select_related(
+                    "logger", "project")
+                boreholes = boreholes.order_by("borehole_timestamp").all()
+
+                # Keyset pagination if client sent a cursor
+                if "cursor" in request.GET:
+                    return cursor_response(
+                        request, boreholes, "borehole_timestamp",
+                        "boreholes", serialize_boreholes, extra={
+                            "project": serialize_projects([project])[0]
+                        }
+                    )
 
                 # Paginator before returning JSON object
                 paginator = Paginator(boreholes, 5)
                 page_obj = paginator.get_page(page_number)
 
                 return JsonResponse({
-                    "project": project.serialize(),
-                    "boreholes": [
-                        borehole.serialize() for borehole in page_obj],
+                    "project": serialize_projects([project])[0],
+                    "boreholes": serialize_boreholes(page_obj.object_list),
                     "total_pages": paginator.num_pages,
                     "current_page": page_obj.number,
                     "has_prev": page_obj.has_previous(),
@@ -165,6 +248,7 @@ def projects(request, project_id, page_number=1):
         return JsonResponse({"error": "User not logged in."}, status=400)
 
 
+@conditional(profile_validator)
 def profile(request, user_id):
     """
     This function deals with all things about the user profiles.
@@ -181,9 +265,8 @@ def profile(request, user_id):
 
         # If user is == 0, this is a request to list all users
         if user_id == 0:
-            users = User.objects.all()
-            return JsonResponse(
-                [user.serialize() for user in users], safe=False)
+            users = User.objects.order_by("id")
+            return StreamingJsonResponse(users, serialize_users)
 
         # Request for single user's profile page
         else:
@@ -200,25 +283,18 @@ def profile(request, user_id):
                 "-project_timestamp").all()
 
             # Get all projects with boreholes being logged by user
-            boreholes_logging = Borehole.objects.filter(logger=user).all()
-            projects_logging = []
-            for borehole in boreholes_logging:
-                projects_logging.append(borehole.project)
-
             # Only list each project once even though multiple boreholes
-            projects_logging = list(set(projects_logging))
-            projects_logging = sorted(
-                projects_logging,
-                key=lambda instance: instance.project_timestamp,
-                reverse=True
+            projects_logging = Project.objects.filter(
+                id__in=Borehole.objects.filter(
+                    logger=user).values("project_id")
             )
+            projects_logging = projects_logging.order_by(
+                "-project_timestamp").all()
 
             return JsonResponse({
                 "user": user.username,
-                "projects_leading": [
-                    project.serialize() for project in projects_leading],
-                "projects_logging": [
-                    project.serialize() for project in projects_logging]
+                "projects_leading": serialize_projects(projects_leading),
+                "projects_logging": serialize_projects(projects_logging)
             }, safe=False)
 
     # If user is not logged in, return error
@@ -226,6 +302,8 @@ def profile(request, user_id):
         return JsonResponse({"error": "User not logged in."}, status=400)
 
 
+@conditional(borehole_validator)
+@cache_response(lambda borehole_id: [f"borehole:{borehole_id}"])
 def borehole(request, borehole_id):
     """
     This view handles every request related to boreholes.
@@ -244,13 +322,14 @@ def borehole(request, borehole_id):
 
             # Check if borehole exists and returns data if exists
             try:
-                borehole = Borehole.objects.filter(id=borehole_id).first()
-            except Borehole.DoesNotExist:
+                borehole = Borehole.objects.filter(id=borehole_id)
+                borehole = serialize_boreholes(borehole)[0]
+            except IndexError:
                 return JsonResponse({
                     "error": "Borehole could not be found."
                 }, status=400)
 
-            return JsonResponse(borehole.serialize())
+            return JsonResponse(borehole)
 
         # Request to create new borehole
         elif request.method == "POST":
@@ -356,6 +435,10 @@ def borehole(request, borehole_id):
         return JsonResponse({"error": "User not logged in."}, status=400)
 
 
+@conditional(geology_validator)
+@cache_response(lambda borehole_id, strata_id=0: [
+    f"borehole:{borehole_id}", f"layer:{strata_id}"
+])
 def geology(request, borehole_id, strata_id=0):
     """
     This function handles requests to do with geology or layers.
@@ -383,28 +466,27 @@ def geology(request, borehole_id, strata_id=0):
             if strata_id == 0:
                 try:
                     geology_all = Geology.objects.filter(borehole=borehole)
+                    geology_all = geology_all.select_related("borehole")
                     geology_all = geology_all.order_by(
-                        "geology_timestamp").all()
+                        "geology_timestamp", "id").all()
                 except Geology.DoesNotExist:
                     return JsonResponse({
                         "error": "Geology could not be found."
                     }, status=400)
 
-                return JsonResponse(
-                    [geology.serialize() for geology in geology_all],
-                    safe=False
-                )
+                return StreamingJsonResponse(geology_all, serialize_geology)
 
             # Else, single geology is requested
             else:
                 try:
-                    geology = Geology.objects.filter(id=strata_id).first()
-                except Geology.DoesNotExist:
+                    geology = Geology.objects.filter(id=strata_id)
+                    geology = serialize_geology(geology)[0]
+                except IndexError:
                     return JsonResponse({
                         "error": "Geology could not be found."
                     }, status=400)
 
-                return JsonResponse(geology.serialize())
+                return JsonResponse(geology)
 
         # POST request to add new layer
         elif request.method == "POST":
@@ -488,6 +570,7 @@ def geology(request, borehole_id, strata_id=0):
         return JsonResponse({"error": "User not logged in."}, status=400)
 
 
+@conditional(sketch_validator)
 def sketch(request, project_id):
     """
     This function handles requests to do with project sketches.
@@ -511,32 +594,36 @@ def sketch(request, project_id):
         # Request to create a new sketch
         if request.method == "POST":
 
-            # Obtain POST info
-            data = json.loads(request.body)
-            image_URI = data.get("dataURI", "")
-
-            # Content will need to be cleaned before Python can convert to png
-            header, image_content = image_URI.split(";base64,")
-            ext = header.split("/")[-1]
-
-            # Replace the previous sketch (only store 1 sketch per project)
-            if project.sketch:
-                filename = project.sketch.file.name
-                project.sketch = None
-                os.remove(filename)
-
-            # New id is needed in order to let React know to refresh component
-            unique_id = int(time.time())
-
-            # Convert URI data into a png file
-            project_sketch = ContentFile(
-                base64.b64decode(image_content),
-                name=f"{project_id}_{unique_id}." + ext
-            )
+            # Sketches are sent as a multipart file, as the raw image or
+            # as a data URI in a JSON body
+            try:
+                if request.content_type == "multipart/form-data":
+                    upload = request.FILES.get("sketch")
+                    if upload is None:
+                        raise InvalidSketch("Sketch required.")
+                    name, size = store(upload.chunks(), upload.content_type)
+                elif request.content_type in SKETCH_TYPES:
+                    name, size = store(
+                        iter(lambda: request.read(CHUNK_SIZE), b""),
+                        request.content_type
+                    )
+                else:
+                    data = json.loads(request.body)
+                    header, image_content = data.get("dataURI", "").split(
+                        ";base64,")
+                    name, size = store(
+                        [base64.b64decode(image_content)],
+                        header.split(":")[-1]
+                    )
+            except (ValueError, binascii.Error):
+                return JsonResponse({"error": "Invalid inputs."}, status=400)
+            except InvalidSketch as error:
+                return JsonResponse({"error": str(error)}, status=400)
+            SKETCH_UPLOAD_BYTES.inc(size)
 
-            # Save new sketch in model
-            project.sketch = project_sketch
-            project.save()
+            # Replace the previous sketch (only store 1 sketch per project),
+            # which is deleted later if no other project shares it
+            replace(project, name)
 
             return JsonResponse({"message": "Sketch added."}, status=201)
 
@@ -555,6 +642,8 @@ def sketch(request, project_id):
         return JsonResponse({"error": "User not logged in."}, status=400)
 
 
+@conditional(message_validator)
+@cache_response(lambda project_id, page_number=1: [f"project:{project_id}"])
 def message(request, project_id, page_number=1):
     """
     This function handles requests to do with messages on projects.
@@ -612,14 +701,22 @@ def message(request, project_id, page_number=1):
         # Request is GET
         else:
             messages = Message.objects.filter(project=project)
+            messages = messages.select_related("user")
             messages = messages.order_by("-message_date").all()
 
+            # Keyset pagination if client sent a cursor
+            if "cursor" in request.GET:
+                return cursor_response(
+                    request, messages, "message_date", "messages",
+                    serialize_messages, descending=True
+                )
+
             # Paginate response
             paginator = Paginator(messages, 5)
             page_obj = paginator.get_page(page_number)
 
             return JsonResponse({
-                    "messages": [message.serialize() for message in page_obj],
+                    "messages": serialize_messages(page_obj.object_list),
                     "total_pages": paginator.num_pages,
                     "current_page": page_obj.number,
                     "has_prev": page_obj.has_previous(),
@@ -631,6 +728,671 @@ def message(request, project_id, page_number=1):
         return JsonResponse({"error": "User not logged in."}, status=400)
 
 
+@conditional(bundle_validator)
+@cache_response(lambda project_id: [f"project:{project_id}"])
+def bundle(request, project_id):
+    """
+    Returns everything the project page shows in a single response:
+    the project, the first page of boreholes with their geology, the
+    sketch URL and the latest messages.
+    Sections can be picked with ?include=project,boreholes,... and the
+    keys of each section with ?fields[section]=id,ref,...
+    The number of queries does not depend on the size of the project.
+    """
+
+    # Needs to be a GET request
+    if request.method != "GET":
+        return JsonResponse({"error": "Request not valid."}, status=400)
+
+    # Checks user is logged in
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "User not logged in."}, status=400)
+
+    # Check that project exists
+    project = Project.objects.select_related("lead")
+    project = project.filter(id=project_id).first()
+    if project is None:
+        return JsonResponse({
+            "error": "Project could not be found."
+        }, status=400)
+
+    include = request.GET.get("include")
+    include = include.split(",") if include else BUNDLE_SECTIONS
+
+    def fields(section):
+        selected = request.GET.get(f"fields[{section}]")
+        return selected.split(",") if selected else []
+
+    data = {}
+    if "project" in include:
+        data["project"] = select_fields(
+            serialize_projects([project]), fields("project"))[0]
+
+    # First page of boreholes, optionally with all of their layers
+    if "boreholes" in include:
+        boreholes = project.borehole.select_related("logger", "project")
+        page = cursor_page(boreholes, "borehole_timestamp")
+        borehole_fields = fields("boreholes")
+        if "geology" in include:
+            boreholes = serialize_boreholes_with_geology(page["rows"])
+            for borehole in boreholes:
+                borehole["geology"] = select_fields(
+                    borehole["geology"], fields("geology"))
+            if borehole_fields:
+                borehole_fields.append("geology")
+        else:
+            boreholes = serialize_boreholes(page["rows"])
+        data["boreholes"] = select_fields(boreholes, borehole_fields)
+        data["boreholes_next"] = page["next"]
+
+    if "sketch" in include:
+        data["sketch"] = project.sketch.url if project.sketch else None
+
+    # Latest messages first
+    if "messages" in include:
+        messages = project.message.select_related("user")
+        page = cursor_page(messages, "message_date", descending=True)
+        data["messages"] = select_fields(
+            serialize_messages(page["rows"]), fields("messages"))
+        data["messages_next"] = page["next"]
+
+    return JsonResponse(data)
+
+
+def batch(request):
+    """
+    Applies a list of project, borehole, geology and message creates and
+    updates in a single transaction, validated with the same forms as the
+    single row views. Every operation is applied or none are.
+    The Idempotency-Key header is required. A retried batch with the same
+    key is answered with the response of the first one.
+    """
+
+    # Needs to be a POST request
+    if request.method != "POST":
+        return JsonResponse({"error": "Request not valid."}, status=400)
+
+    # Checks user is logged in
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "User not logged in."}, status=400)
+
+    key = request.headers.get("Idempotency-Key", "")
+    if not key or len(key) > 64:
+        return JsonResponse({
+            "error": "Idempotency key required."
+        }, status=400)
+
+    # Obtain operations from POST data
+    try:
+        operations = json.loads(request.body)["operations"]
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"error": "Invalid inputs."}, status=400)
+
+    try:
+        data, replayed = submit(request.user, key, operations)
+    except InvalidBatch as error:
+        data = {"error": str(error)}
+        if error.index is not None:
+            data["operation"] = error.index
+        return JsonResponse(data, status=400)
+
+    response = JsonResponse(data, status=201)
+    if replayed:
+        response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def import_boreholes(request, project_id):
+    """
+    Imports boreholes and geology layers into a project from an uploaded
+    AGS4 or CSV file in "file". The format is taken from the file name or
+    from "format". Uploads are read one line at a time and large uploads
+    are kept on disk, so memory use does not grow with the file size.
+    Returns the number of rows imported and the errors of skipped rows.
+    """
+
+    # Needs to be a POST request
+    if request.method != "POST":
+        return JsonResponse({"error": "Request not valid."}, status=400)
+
+    # Checks user is logged in
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "User not logged in."}, status=400)
+
+    # Check that project exists
+    project = Project.objects.filter(id=project_id).first()
+    if project is None:
+        return JsonResponse({
+            "error": "Project could not be found."
+        }, status=400)
+
+    upload = request.FILES.get("file")
+    if upload is None:
+        return JsonResponse({"error": "Invalid inputs."}, status=400)
+    format = request.POST.get("format") or \
+        os.path.splitext(upload.name)[1].lstrip(".").lower()
+    if format not in READERS:
+        return JsonResponse({"error": "Unknown file format."}, status=400)
+
+    lines = io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+    try:
+        report = Importer(project, request.user).run(READERS[format](lines))
+    except UnicodeDecodeError:
+        return JsonResponse({"error": "File is not UTF-8 text."}, status=400)
+    except InvalidFile as error:
+        return JsonResponse({
+            "error": str(error), "line": error.line
+        }, status=400)
+    return JsonResponse(report, status=201)
+
+
+def export_projects(request, project_id):
+    """
+    Streams the boreholes and layers of a project as CSV, AGS4 or NDJSON
+    chosen with ?format=. When project_id is 0 every project is exported,
+    or only the ids in ?projects= or the projects led by ?lead=, as CSV
+    or NDJSON.
+    The response is gzipped on the fly for clients which accept it.
+    """
+
+    # Needs to be a GET request
+    if request.method != "GET":
+        return JsonResponse({"error": "Request not valid."}, status=400)
+
+    # Checks user is logged in
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "User not logged in."}, status=400)
+
+    format = request.GET.get("format", "csv")
+    if format not in EXPORTS:
+        return JsonResponse({"error": "Unknown file format."}, status=400)
+
+    projects = Project.objects.all()
+    try:
+        if project_id != 0:
+            projects = projects.filter(id=project_id)
+        elif request.GET.get("projects"):
+            projects = projects.filter(id__in=[
+                int(id) for id in request.GET["projects"].split(",")
+            ])
+        elif request.GET.get("lead"):
+            projects = projects.filter(lead_id=int(request.GET["lead"]))
+    except ValueError:
+        return JsonResponse({"error": "Invalid inputs."}, status=400)
+    if project_id != 0 and not projects.exists():
+        return JsonResponse({
+            "error": "Project could not be found."
+        }, status=400)
+
+    # AGS files describe a single project, boreholes of different
+    # projects may share a LOCA_ID
+    if format == "ags" and projects.count() != 1:
+        return JsonResponse({
+            "error": "AGS exports hold a single project."
+        }, status=400)
+
+    compress = accepts_gzip(request)
+    content_type, extension = EXPORTS[format]
+    response = StreamingHttpResponse(
+        export(projects, format, compress), content_type=content_type)
+    response["Content-Disposition"] = \
+        f'attachment; filename="project_{project_id}.{extension}"'
+    if compress:
+        response["Content-Encoding"] = "gzip"
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
+
+
+def search(request):
+    """
+    Returns a page of the geology layers and messages matching the words
+    in ?q=, best matches first, from the full text index.
+    Results can be limited with ?project= or to the projects of ?user=.
+    """
+
+    # Needs to be a GET request
+    if request.method != "GET":
+        return JsonResponse({"error": "Request not valid."}, status=400)
+
+    # Checks user is logged in
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "User not logged in."}, status=400)
+
+    try:
+        project = request.GET.get("project")
+        project = int(project) if project else None
+        user = request.GET.get("user")
+        user = int(user) if user else None
+        page = max(int(request.GET.get("page", 1)), 1)
+    except ValueError:
+        return JsonResponse({"error": "Invalid inputs."}, status=400)
+
+    data = find(request.GET.get("q", ""), project, user, page)
+    data["page"] = page
+    return JsonResponse(data)
+
+
+def map_within(request):
+    """
+    Returns the boreholes of every project inside the map view in
+    ?box=min_easting,min_northing,max_easting,max_northing as compact
+    rows, optionally only those of ?project=.
+    """
+
+    # Needs to be a GET request
+    if request.method != "GET":
+        return JsonResponse({"error": "Request not valid."}, status=400)
+
+    # Checks user is logged in
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "User not logged in."}, status=400)
+
+    try:
+        box = [float(value) for value in request.GET["box"].split(",")]
+        project = request.GET.get("project")
+        project = int(project) if project else None
+    except (KeyError, ValueError):
+        return JsonResponse({"error": "Invalid inputs."}, status=400)
+    if len(box) != 4 or not all(map(math.isfinite, box)) or \
+            box[0] > box[2] or box[1] > box[3]:
+        return JsonResponse({"error": "Invalid inputs."}, status=400)
+
+    return JsonResponse(within(*box, project_id=project))
+
+
+def map_nearest(request):
+    """
+    Returns the ?count= boreholes closest to ?easting= and ?northing= as
+    compact rows with their distance, optionally only those of ?project=.
+    """
+
+    # Needs to be a GET request
+    if request.method != "GET":
+        return JsonResponse({"error": "Request not valid."}, status=400)
+
+    # Checks user is logged in
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "User not logged in."}, status=400)
+
+    try:
+        easting = float(request.GET["easting"])
+        northing = float(request.GET["northing"])
+        count = int(request.GET.get("count", 10))
+        project = request.GET.get("project")
+        project = int(project) if project else None
+    except (KeyError, ValueError):
+        return JsonResponse({"error": "Invalid inputs."}, status=400)
+    if not 0 < count <= NEAREST_LIMIT or not (
+            math.isfinite(easting) and math.isfinite(northing)):
+        return JsonResponse({"error": "Invalid inputs."}, status=400)
+
+    return JsonResponse(nearest(easting, northing, count, project))
+
+
+def map_clusters(request):
+    """
+    Returns the boreholes inside the map view in ?box= grouped into
+    clusters for the map ?zoom= level, optionally only those of
+    ?project=. Large views are answered at a coarser level so the
+    response stays small.
+    """
+
+    # Needs to be a GET request
+    if request.method != "GET":
+        return JsonResponse({"error": "Request not valid."}, status=400)
+
+    # Checks user is logged in
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "User not logged in."}, status=400)
+
+    try:
+        zoom = int(request.GET["zoom"])
+        box = [float(value) for value in request.GET["box"].split(",")]
+        project = request.GET.get("project")
+        project = int(project) if project else None
+    except (KeyError, ValueError):
+        return JsonResponse({"error": "Invalid inputs."}, status=400)
+    if len(box) != 4 or not all(map(math.isfinite, box)) or \
+            box[0] > box[2] or box[1] > box[3] or zoom < 0:
+        return JsonResponse({"error": "Invalid inputs."}, status=400)
+
+    return JsonResponse(clusters(zoom, *box, project_id=project))
+
+
+def intervals(request, project_id):
+    """
+    Returns the geology layers of a project intersecting the depths in
+    ?depth=top,bottom or the elevations in ?elevation=low,high as compact
+    rows, optionally only those matching the search ?q=. With ?first=1
+    only the shallowest such layer of each borehole is returned.
+    """
+
+    # Needs to be a GET request
+    if request.method != "GET":
+        return JsonResponse({"error": "Request not valid."}, status=400)
+
+    # Checks user is logged in
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "User not logged in."}, status=400)
+
+    if not Project.objects.filter(id=project_id).exists():
+        return JsonResponse({
+            "error": "Project could not be found."
+        }, status=400)
+
+    ranges = {}
+    try:
+        for name in ("depth", "elevation"):
+            if request.GET.get(name):
+                ranges[name] = [
+                    float(value) for value in request.GET[name].split(",")
+                ]
+    except ValueError:
+        return JsonResponse({"error": "Invalid inputs."}, status=400)
+    if any(len(pair) != 2 or pair[0] > pair[1] for pair in ranges.values()):
+        return JsonResponse({"error": "Invalid inputs."}, status=400)
+
+    return JsonResponse(layers(
+        project_id, ranges.get("depth"), ranges.get("elevation"),
+        request.GET.get("q"), request.GET.get("first") == "1"
+    ))
+
+
+@cache_response(lambda project_id: [f"project:{project_id}"])
+def cross_section(request, project_id):
+    """
+    Returns the cross section through the boreholes of a project within
+    ?buffer= of the line through the points in
+    ?line=easting,northing,easting,northing,... as arrays for plotting.
+    Sections are cached until the project changes.
+    """
+
+    # Needs to be a GET request
+    if request.method != "GET":
+        return JsonResponse({"error": "Request not valid."}, status=400)
+
+    # Checks user is logged in
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "User not logged in."}, status=400)
+
+    if not Project.objects.filter(id=project_id).exists():
+        return JsonResponse({
+            "error": "Project could not be found."
+        }, status=400)
+
+    try:
+        values = [float(value) for value in request.GET["line"].split(",")]
+        buffer = float(request.GET.get("buffer", 50))
+    except (KeyError, ValueError):
+        return JsonResponse({"error": "Invalid inputs."}, status=400)
+    line = list(zip(values[::2], values[1::2]))
+    if len(values) % 2 or not 2 <= len(line) <= VERTEX_LIMIT or \
+            not all(map(math.isfinite, values + [buffer])) or buffer < 0:
+        return JsonResponse({"error": "Invalid inputs."}, status=400)
+
+    return JsonResponse(section(project_id, line, buffer))
+
+
+def stratum_surface(request, project_id):
+    """
+    Returns the grid of elevations of the top of the stratum in ?stratum=
+    across a project, interpolated between boreholes every ?resolution=
+    metres. ?window=column,row,column,row reads part of the grid and
+    ?format=binary returns the elevations as little endian float32 rows
+    with the grid described in headers.
+    """
+
+    # Needs to be a GET request
+    if request.method != "GET":
+        return JsonResponse({"error": "Request not valid."}, status=400)
+
+    # Checks user is logged in
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "User not logged in."}, status=400)
+
+    if not Project.objects.filter(id=project_id).exists():
+        return JsonResponse({
+            "error": "Project could not be found."
+        }, status=400)
+
+    try:
+        stratum = request.GET["stratum"].strip().lower()
+        resolution = float(request.GET.get("resolution", 10))
+        power = float(request.GET.get("power", 2))
+        window = request.GET.get("window")
+        window = [int(value) for value in window.split(",")] \
+            if window else None
+    except (KeyError, ValueError):
+        return JsonResponse({"error": "Invalid inputs."}, status=400)
+    if not stratum or not 0 < resolution < math.inf or not 0 < power <= 10:
+        return JsonResponse({"error": "Invalid inputs."}, status=400)
+    if window is not None and (len(window) != 4 or min(window) < 0):
+        return JsonResponse({"error": "Invalid inputs."}, status=400)
+
+    try:
+        grid, values, cached = surface(project_id, stratum, resolution, power)
+    except InvalidSurface as error:
+        return JsonResponse({"error": str(error)}, status=400)
+
+    # Windows are clipped to the grid and keep their own origin
+    if window is not None and values.size:
+        first_column, first_row, last_column, last_row = window
+        values = values[first_row:last_row + 1, first_column:last_column + 1]
+        grid = dict(
+            grid, columns=values.shape[1], rows=values.shape[0], origin=[
+                grid["origin"][0] + first_column * resolution,
+                grid["origin"][1] + first_row * resolution
+            ]
+        )
+
+    if request.GET.get("format") == "binary":
+        response = HttpResponse(
+            values.tobytes(), content_type="application/octet-stream")
+        response["X-Surface-Origin"] = "{},{}".format(*grid["origin"])
+        response["X-Surface-Resolution"] = grid["resolution"]
+        response["X-Surface-Shape"] = f"{grid['rows']},{grid['columns']}"
+    else:
+        response = JsonResponse(dict(grid, values=[
+            [round(float(value), 3) for value in row] for row in values
+        ]))
+    response["X-Cache"] = "HIT" if cached else "MISS"
+    return response
+
+
+def spt_layers(request, project_id):
+    """
+    Returns the geology layers of a project with an SPT N value of at
+    least ?min= and at most ?max=, optionally intersecting the depths in
+    ?depth=top,bottom and only refusals with ?refusal=1, as compact rows.
+    """
+
+    # Needs to be a GET request
+    if request.method != "GET":
+        return JsonResponse({"error": "Request not valid."}, status=400)
+
+    # Checks user is logged in
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "User not logged in."}, status=400)
+
+    if not Project.objects.filter(id=project_id).exists():
+        return JsonResponse({
+            "error": "Project could not be found."
+        }, status=400)
+
+    try:
+        minimum = request.GET.get("min")
+        minimum = int(minimum) if minimum else None
+        maximum = request.GET.get("max")
+        maximum = int(maximum) if maximum else None
+        depth = request.GET.get("depth")
+        depth = [float(value) for value in depth.split(",")] \
+            if depth else None
+        refusal = request.GET.get("refusal")
+        refusal = refusal == "1" if refusal else None
+    except ValueError:
+        return JsonResponse({"error": "Invalid inputs."}, status=400)
+    if depth is not None and (len(depth) != 2 or depth[0] > depth[1]):
+        return JsonResponse({"error": "Invalid inputs."}, status=400)
+
+    return JsonResponse(
+        filter_layers(project_id, minimum, maximum, depth, refusal))
+
+
+def spt_statistics(request, project_id):
+    """
+    Returns the distribution of the SPT N values of a project in depth
+    bands of ?band= metres and for each stratum.
+    """
+
+    # Needs to be a GET request
+    if request.method != "GET":
+        return JsonResponse({"error": "Request not valid."}, status=400)
+
+    # Checks user is logged in
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "User not logged in."}, status=400)
+
+    if not Project.objects.filter(id=project_id).exists():
+        return JsonResponse({
+            "error": "Project could not be found."
+        }, status=400)
+
+    try:
+        band = float(request.GET.get("band", 1))
+    except ValueError:
+        return JsonResponse({"error": "Invalid inputs."}, status=400)
+    if not 0.1 <= band <= 100:
+        return JsonResponse({"error": "Invalid inputs."}, status=400)
+
+    return JsonResponse(statistics(project_id, band))
+
+
+def borehole_log(request, borehole_id):
+    """
+    Returns the strip log of a borehole as a PNG or SVG image chosen with
+    ?format=. Logs are rendered once per version of the borehole and kept
+    in MEDIA_ROOT.
+    """
+
+    # Needs to be a GET request
+    if request.method != "GET":
+        return JsonResponse({"error": "Request not valid."}, status=400)
+
+    # Checks user is logged in
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "User not logged in."}, status=400)
+
+    format = request.GET.get("format", "png")
+    if format not in LOG_FORMATS:
+        return JsonResponse({"error": "Unknown file format."}, status=400)
+
+    borehole = Borehole.objects.select_related("project").filter(
+        id=borehole_id).first()
+    if borehole is None:
+        return JsonResponse({
+            "error": "Borehole could not be found."
+        }, status=400)
+
+    # A newer version rendered meanwhile may have removed this one
+    name = strip_log(borehole, format)
+    try:
+        log = default_storage.open(name, "rb")
+    except FileNotFoundError:
+        return HttpResponse(
+            draw(borehole, format), content_type=LOG_FORMATS[format])
+    return FileResponse(log, content_type=LOG_FORMATS[format])
+
+
+def project_report(request, project_id):
+    """
+    Queues the factual report of a project, with the strip log of every
+    borehole, the sketch and summary tables. Reports are built by the
+    run_jobs command and their progress is read from /jobs/<id>.
+    """
+
+    # Needs to be a POST request
+    if request.method != "POST":
+        return JsonResponse({"error": "Request not valid."}, status=400)
+
+    # Checks user is logged in
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "User not logged in."}, status=400)
+
+    if not Project.objects.filter(id=project_id).exists():
+        return JsonResponse({
+            "error": "Project could not be found."
+        }, status=400)
+
+    job = enqueue("report", request.user, project=project_id)
+    return JsonResponse({
+        "message": "Report queued.", "job": job.serialize()
+    }, status=201)
+
+
+def job(request, job_id):
+    """
+    Returns the status, progress and result of a job queued by the user.
+    """
+
+    # Needs to be a GET request
+    if request.method != "GET":
+        return JsonResponse({"error": "Request not valid."}, status=400)
+
+    # Checks user is logged in
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "User not logged in."}, status=400)
+
+    job = Job.objects.filter(id=job_id, user=request.user).first()
+    if job is None:
+        return JsonResponse({"error": "Job could not be found."}, status=400)
+    return JsonResponse(job.serialize())
+
+
+def changes(request):
+    """
+    Returns the projects, boreholes, geology layers and messages created,
+    updated or deleted since the sync token in ?since=, optionally only
+    for the project in ?project=.
+    Clients store the returned sync_token and pass it with their next
+    request, repeating while has_more is true.
+    """
+
+    # Needs to be a GET request
+    if request.method != "GET":
+        return JsonResponse({"error": "Request not valid."}, status=400)
+
+    # Checks user is logged in
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "User not logged in."}, status=400)
+
+    try:
+        since = int(request.GET.get("since", 0))
+        project = request.GET.get("project")
+        project = int(project) if project else None
+        limit = int(request.GET.get("limit", 500))
+    except ValueError:
+        return JsonResponse({"error": "Invalid inputs."}, status=400)
+    if since < 0:
+        return JsonResponse({"error": "Invalid inputs."}, status=400)
+
+    return JsonResponse(changes_since(since, project, limit))
+
+
+def metrics(request):
+    """
+    Returns the operational metrics of every worker process in the
+    Prometheus text format.
+    Left open to anonymous requests so it can be scraped.
+    """
+    if request.method != "GET":
+        return JsonResponse({"error": "Request not valid."}, status=400)
+
+    return HttpResponse(
+        registry.render(),
+        content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 def login_view(request):
     if request.method == "POST":
 
@@ -41,6 +41,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'app.middleware.TimingMiddleware',
+    'app.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -123,3 +125,84 @@ STATIC_URL = '/static/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
+
+
+# Request timing
+# Requests slower than this are logged along with their slowest queries
+
+QLOG_SLOW_REQUEST_MS = 500
+
+QLOG_SLOW_QUERY_COUNT = 5
+
+# Fraction of requests run under cProfile, slow ones are saved to disk
+
+QLOG_PROFILE_SAMPLE_RATE = 0.01
+
+# Directory the profiles of slow sampled requests are saved to, leave as
+# None to turn profiling off
+
+QLOG_PROFILE_DIR = None
+
+# Caching
+# Local memory is private to each process, so with several worker processes
+# writes in one process are only seen by the others once entries expire.
+# Use django.core.cache.backends.filebased.FileBasedCache to share one cache.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+QLOG_RESPONSE_CACHE = 'default'
+
+# Longest time in seconds a cached response can be served
+
+QLOG_RESPONSE_CACHE_TTL = 60
+
+# Streamed responses larger than this many bytes are not cached
+
+QLOG_RESPONSE_CACHE_MAX_BYTES = 1024 * 1024
+
+# Longest time in seconds a computed stratum surface grid is kept. Grids
+# are keyed on the project version, but with the local memory cache other
+# processes do not see its changes, so this bounds how stale a grid can be
+
+QLOG_SURFACE_CACHE_TTL = 5 * 60
+
+# Seconds a worker can run a job before it is assumed to have stopped and
+# the job is queued again, longer than any job should take
+
+QLOG_JOB_LEASE = 15 * 60
+
+# Largest sketch in bytes which can be uploaded
+
+QLOG_SKETCH_MAX_BYTES = 10 * 1024 * 1024
+
+# Metrics
+# Worker processes share metrics through files in this directory, leave as
+# None to only report the metrics of the process serving /metrics
+
+QLOG_METRICS_DIR = None
+
+QLOG_METRICS_FLUSH_SECONDS = 5
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'app.requests': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}